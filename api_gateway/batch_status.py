@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+from cache import analysis_cache_ttl
+from config import settings
+from http_client import forward_cached_request, forward_coalesced_request, forward_to_upstream
+from upstreams import Upstream
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+BULK_STATUS_PATH = "/analysis/files/status"
+
+class AnalysisStatusBatchRequest(BaseModel):
+    file_ids: List[str] = Field(..., min_length=1)
+
+def _error_detail(response: Response) -> str:
+    try:
+        payload = json.loads(response.body)
+    except ValueError:
+        return response.body.decode("utf-8", errors="replace")
+    if isinstance(payload, dict) and "detail" in payload:
+        return str(payload["detail"])
+    return str(payload)
+
+def _status_subrequest(request: Request) -> Request:
+    scope = dict(request.scope)
+    scope["method"] = "GET"
+    scope["query_string"] = b""
+    scope["headers"] = [
+        (k, v) for k, v in request.scope["headers"]
+        if k not in (b"content-length", b"content-type", b"transfer-encoding", b"if-none-match", b"if-modified-since")
+    ]
+    return Request(scope)
+
+def _bulk_subrequest(request: Request, file_ids: List[str]) -> Request:
+    body = json.dumps({"file_ids": file_ids}).encode()
+    scope = dict(request.scope)
+    scope["query_string"] = b""
+    scope["headers"] = [
+        (k, v) for k, v in request.scope["headers"]
+        if k not in (b"content-length", b"content-type", b"transfer-encoding", b"content-encoding")
+    ] + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive=receive)
+
+class AnalysisStatusBatcher:
+    def __init__(self):
+        self.bulk_unsupported_until = 0.0
+        self.bulk_batches = 0
+        self.fanout_batches = 0
+        self.fanout_requests = 0
+        self.fanout_failures = 0
+
+    async def fetch(self, request: Request, upstream: Upstream, file_ids: List[str]) -> Tuple[str, Dict[str, list], Dict[str, dict]]:
+        if settings.BATCH_STATUS_PUSHDOWN and time.monotonic() >= self.bulk_unsupported_until:
+            bulk = await self._fetch_bulk(request, upstream, file_ids)
+            if bulk is not None:
+                return "bulk", bulk.get("results", {}), bulk.get("errors", {})
+        results, errors = await self._fetch_fanout(request, upstream, file_ids)
+        return "fanout", results, errors
+
+    async def _fetch_bulk(self, request: Request, upstream: Upstream, file_ids: List[str]) -> Optional[dict]:
+        try:
+            response = await forward_to_upstream(
+                _bulk_subrequest(request, file_ids), upstream, BULK_STATUS_PATH, header_overrides={"accept-encoding": "identity"})
+        except HTTPException as e:
+            logger.warning(f"Bulk status query to '{upstream.name}' failed with {e.status_code} ({e.detail}), falling back to fan-out")
+            return None
+        if response.status_code == 200:
+            self.bulk_batches += 1
+            logger.debug(f"Batch status for {len(file_ids)} file(s) served by '{upstream.name}' bulk query")
+            return json.loads(response.body)
+        if response.status_code in (404, 405):
+            self.bulk_unsupported_until = time.monotonic() + settings.BATCH_STATUS_BULK_RETRY_SECONDS
+            logger.warning(f"'{upstream.name}' has no bulk status query ({response.status_code}), using fan-out for {settings.BATCH_STATUS_BULK_RETRY_SECONDS}s")
+        else:
+            logger.warning(f"Bulk status query to '{upstream.name}' failed with {response.status_code}, falling back to fan-out")
+        return None
+
+    async def _fetch_fanout(self, request: Request, upstream: Upstream, file_ids: List[str]) -> Tuple[Dict[str, list], Dict[str, dict]]:
+        self.fanout_batches += 1
+        semaphore = asyncio.Semaphore(settings.BATCH_STATUS_CONCURRENCY)
+
+        async def fetch_one(file_id: str):
+            target_path = f"/analysis/file/{quote(file_id, safe='')}"
+            async with semaphore:
+                self.fanout_requests += 1
+                try:
+                    if settings.CACHE_ENABLED:
+                        response = await forward_cached_request(_status_subrequest(request), upstream, target_path, analysis_cache_ttl)
+                    else:
+                        response = await forward_coalesced_request(_status_subrequest(request), upstream, target_path)
+                except HTTPException as e:
+                    return file_id, None, {"status_code": e.status_code, "detail": str(e.detail)}
+            if response.status_code != 200:
+                return file_id, None, {"status_code": response.status_code, "detail": _error_detail(response)}
+            return file_id, json.loads(response.body), None
+
+        results = {}
+        errors = {}
+        for file_id, result, error in await asyncio.gather(*[fetch_one(file_id) for file_id in file_ids]):
+            if error is not None:
+                self.fanout_failures += 1
+                errors[file_id] = error
+            else:
+                results[file_id] = result
+        logger.debug(f"Batch status fan-out for {len(file_ids)} file(s) finished with {len(errors)} failure(s)")
+        return results, errors
+
+    def reset(self):
+        self.bulk_unsupported_until = 0.0
+        self.bulk_batches = 0
+        self.fanout_batches = 0
+        self.fanout_requests = 0
+        self.fanout_failures = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "bulk_supported": time.monotonic() >= self.bulk_unsupported_until,
+            "bulk_batches": self.bulk_batches,
+            "fanout_batches": self.fanout_batches,
+            "fanout_requests": self.fanout_requests,
+            "fanout_failures": self.fanout_failures,
+        }
+
+analysis_status_batcher = AnalysisStatusBatcher()
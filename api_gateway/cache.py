@@ -0,0 +1,153 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional
+
+from fastapi import Request, Response
+
+from config import settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+def latest_analysis(analyses: List[dict]) -> Optional[dict]:
+    analyses = [analysis for analysis in analyses if isinstance(analysis, dict)]
+    return max(analyses, key=lambda analysis: analysis.get("created_at") or "", default=None)
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak_etag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == weak_etag:
+            return True
+    return False
+
+def analysis_cache_ttl(target_path: str, status_code: int, headers: Mapping[str, str], body: bytes) -> Optional[float]:
+    if status_code != 200:
+        return None
+
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0.0
+    if cache_control.get("max-age") is not None:
+        try:
+            return float(cache_control["max-age"])
+        except ValueError:
+            pass
+
+    if target_path.startswith("/analysis/wordclouds/"):
+        return settings.CACHE_IMMUTABLE_TTL_SECONDS
+
+    if not headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+
+    latest = payload if isinstance(payload, dict) else latest_analysis(payload) if isinstance(payload, list) else None
+    if latest is not None and latest.get("analysis_status") == "COMPLETED":
+        return settings.CACHE_COMPLETED_TTL_SECONDS
+    return settings.CACHE_PENDING_TTL_SECONDS
+
+class CacheEntry:
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes, ttl: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = headers.get("etag")
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers.items())
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def refresh(self, ttl: float):
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+
+    def to_response(self, request: Request) -> Response:
+        headers = dict(self.headers)
+        headers["age"] = str(int(time.monotonic() - self.stored_at))
+        headers["x-cache"] = "HIT"
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            headers.pop("content-length", None)
+            headers.pop("content-type", None)
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, status_code=self.status_code, headers=headers)
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        if entry.size > self.max_entry_bytes:
+            logger.debug(f"Not caching {key}: entry size {entry.size} exceeds limit {self.max_entry_bytes}")
+            return
+        self.invalidate(key)
+        self._entries[key] = entry
+        self.current_bytes += entry.size
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.size
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+response_cache = ResponseCache(settings.CACHE_MAX_BYTES, settings.CACHE_MAX_ENTRY_BYTES)
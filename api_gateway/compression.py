@@ -0,0 +1,229 @@
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from logging_config import get_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = get_logger(__name__)
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+def available_encodings(preferred: List[str]) -> List[str]:
+    supported = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [encoding for encoding in preferred if supported.get(encoding)]
+
+def negotiate_encoding(accept_encoding: Optional[str], encodings: List[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+
+    best = None
+    best_weight = 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+class CompressionStats:
+    def __init__(self):
+        self.responses: Dict[str, int] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.bytes_out: Dict[str, int] = {}
+        self.skipped = 0
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int):
+        self.responses[encoding] = self.responses.get(encoding, 0) + 1
+        self.bytes_in[encoding] = self.bytes_in.get(encoding, 0) + bytes_in
+        self.bytes_out[encoding] = self.bytes_out.get(encoding, 0) + bytes_out
+
+    def reset(self):
+        self.responses.clear()
+        self.bytes_in.clear()
+        self.bytes_out.clear()
+        self.skipped = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "skipped": self.skipped,
+            "encodings": {
+                encoding: {
+                    "responses": count,
+                    "bytes_in": self.bytes_in[encoding],
+                    "bytes_out": self.bytes_out[encoding],
+                    "ratio": round(self.bytes_out[encoding] / self.bytes_in[encoding], 4) if self.bytes_in[encoding] else 0.0,
+                }
+                for encoding, count in self.responses.items()
+            },
+        }
+
+compression_stats = CompressionStats()
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        encodings: List[str],
+        mime_types: List[str],
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        stats: CompressionStats = compression_stats
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(encodings)
+        self.mime_types = mime_types
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.stats = stats
+        logger.info(f"Response compression enabled: encodings={self.encodings}, minimum_size={minimum_size}")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self, encoding, send).run(scope, receive)
+
+    def create_compressor(self, encoding: str):
+        if encoding == "zstd":
+            return _ZstdCompressor(self.zstd_level)
+        if encoding == "br":
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level)
+
+    def is_compressible(self, status_code: int, headers: Headers) -> bool:
+        if status_code < 200 or status_code in (204, 206, 304):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_type = headers.get("content-type", "").lower()
+        if not any(content_type.startswith(mime_type) for mime_type in self.mime_types):
+            return False
+        content_length = headers.get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) < self.minimum_size:
+            return False
+        return True
+
+class _CompressingResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+        self.pending = b""
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def run(self, scope: Scope, receive: Receive):
+        await self.middleware.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            if not self.middleware.is_compressible(message["status"], Headers(raw=message["headers"])):
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            self.pending += body
+            if more_body and len(self.pending) < self.middleware.minimum_size:
+                return
+            if len(self.pending) < self.middleware.minimum_size:
+                self.passthrough = True
+                self.middleware.stats.skipped += 1
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": self.pending, "more_body": False})
+                return
+            await self._start_compression()
+            body, self.pending = self.pending, b""
+
+        self.bytes_in += len(body)
+        compressed = self.compressor.compress(body)
+        if not more_body:
+            compressed += self.compressor.finish()
+        self.bytes_out += len(compressed)
+        if compressed or not more_body:
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        if not more_body:
+            self.middleware.stats.record(self.encoding, self.bytes_in, self.bytes_out)
+
+    async def _start_compression(self):
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        del headers["content-length"]
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        self.compressor = self.middleware.create_compressor(self.encoding)
+        await self.send(self.start_message)
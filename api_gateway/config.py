@@ -8,6 +8,83 @@ class Settings(BaseSettings):
     API_GATEWAY_PORT: int = 8000
     FSS_URL: str = "http://files_storing_service:8000"
     FAS_URL: str = "http://file_analysis_service:8000"
+    STREAM_CHUNK_SIZE: int = 64 * 1024
+
+    LOAD_BALANCER_STRATEGY: str = "p2c"
+    HEALTH_CHECK_ENABLED: bool = True
+    HEALTH_CHECK_INTERVAL_SECONDS: float = 5.0
+    HEALTH_CHECK_UNHEALTHY_THRESHOLD: int = 2
+    HEALTH_CHECK_HEALTHY_THRESHOLD: int = 2
+
+    FSS_MAX_CONNECTIONS: int = 100
+    FSS_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    FSS_KEEPALIVE_EXPIRY: float = 30.0
+    FSS_CONNECT_TIMEOUT: float = 5.0
+    FSS_READ_TIMEOUT: float = 300.0
+    FSS_WRITE_TIMEOUT: float = 300.0
+    FSS_POOL_TIMEOUT: float = 5.0
+    FSS_HTTP2: bool = False
+
+    FAS_MAX_CONNECTIONS: int = 50
+    FAS_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    FAS_KEEPALIVE_EXPIRY: float = 30.0
+    FAS_CONNECT_TIMEOUT: float = 2.0
+    FAS_READ_TIMEOUT: float = 10.0
+    FAS_WRITE_TIMEOUT: float = 10.0
+    FAS_POOL_TIMEOUT: float = 2.0
+    FAS_HTTP2: bool = False
+
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    CACHE_COMPLETED_TTL_SECONDS: float = 3600.0
+    CACHE_IMMUTABLE_TTL_SECONDS: float = 86400.0
+    CACHE_PENDING_TTL_SECONDS: float = 1.0
+
+    COALESCE_GET_REQUESTS: bool = True
+
+    HEDGING_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY_SECONDS: float = 0.05
+    HEDGE_MAX_DELAY_SECONDS: float = 2.0
+    RETRY_MAX_ATTEMPTS: int = 2
+    RETRY_BACKOFF_BASE_SECONDS: float = 0.05
+    RETRY_BACKOFF_MAX_SECONDS: float = 1.0
+
+    UPLOAD_WAIT_DEFAULT_SECONDS: float = 30.0
+    UPLOAD_WAIT_MAX_SECONDS: float = 120.0
+    UPLOAD_WAIT_POLL_SECONDS: float = 25.0
+
+    BATCH_STATUS_MAX_IDS: int = 500
+    BATCH_STATUS_CONCURRENCY: int = 16
+    BATCH_STATUS_PUSHDOWN: bool = True
+    BATCH_STATUS_BULK_RETRY_SECONDS: float = 300.0
+
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_ENCODINGS: str = "zstd,br,gzip"
+    COMPRESSION_MIME_TYPES: str = "application/json,text/,application/xml,application/javascript,image/svg+xml"
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_FAILURE_RATE_THRESHOLD: float = 0.5
+    CIRCUIT_MINIMUM_CALLS: int = 20
+    CIRCUIT_WINDOW_SIZE: int = 50
+    CIRCUIT_SLOW_CALL_SECONDS: float = 5.0
+    CIRCUIT_OPEN_SECONDS: float = 10.0
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 5
+    CIRCUIT_HALF_OPEN_TIMEOUT_SECONDS: float = 30.0
+    CIRCUIT_PROBE_TIMEOUT_SECONDS: float = 1.0
+
+    CONCURRENCY_LIMIT_ENABLED: bool = True
+    CONCURRENCY_INITIAL_LIMIT: int = 20
+    CONCURRENCY_MIN_LIMIT: int = 2
+    CONCURRENCY_MAX_LIMIT: int = 200
+    CONCURRENCY_LATENCY_TARGET_SECONDS: float = 1.0
+    CONCURRENCY_BACKOFF_RATIO: float = 0.9
+    CONCURRENCY_RETRY_AFTER_SECONDS: int = 1
 
     model_config = SettingsConfigDict(env_file=env_path, extra='ignore')
 
@@ -1,60 +1,423 @@
 from fastapi import HTTPException, Request, Response, FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import random
+import time
 import httpx
 from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from cache import CacheEntry, ResponseCache, etag_matches, latest_analysis, response_cache
+from config import settings
+from resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+from singleflight import SingleFlight, request_coalescer
+from upstreams import Replica, Upstream, create_upstream
 from logging_config import get_logger
 
 logger = get_logger(__name__)
 
-client_store = {}
+upstream_store = {}
+
+def _resilience_components(name: str) -> dict:
+    components = {"probe_timeout": settings.CIRCUIT_PROBE_TIMEOUT_SECONDS, "strategy": settings.LOAD_BALANCER_STRATEGY}
+    if settings.CIRCUIT_BREAKER_ENABLED:
+        components["breaker"] = CircuitBreaker(
+            name,
+            failure_rate_threshold=settings.CIRCUIT_FAILURE_RATE_THRESHOLD,
+            minimum_calls=settings.CIRCUIT_MINIMUM_CALLS,
+            window_size=settings.CIRCUIT_WINDOW_SIZE,
+            slow_call_seconds=settings.CIRCUIT_SLOW_CALL_SECONDS,
+            open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+            half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS,
+            half_open_timeout_seconds=settings.CIRCUIT_HALF_OPEN_TIMEOUT_SECONDS,
+        )
+    if settings.CONCURRENCY_LIMIT_ENABLED:
+        components["limiter"] = AdaptiveConcurrencyLimiter(
+            name,
+            initial_limit=settings.CONCURRENCY_INITIAL_LIMIT,
+            min_limit=settings.CONCURRENCY_MIN_LIMIT,
+            max_limit=settings.CONCURRENCY_MAX_LIMIT,
+            latency_target_seconds=settings.CONCURRENCY_LATENCY_TARGET_SECONDS,
+            backoff_ratio=settings.CONCURRENCY_BACKOFF_RATIO,
+        )
+    return components
 
 @asynccontextmanager
 async def lifespan_manager(app: FastAPI):
-    logger.info("API Gateway: Initializing HTTP client")
-    client_store["client"] = httpx.AsyncClient()
+    logger.info("API Gateway: Initializing upstream HTTP clients")
+    upstream_store["fss"] = create_upstream(
+        "fss", settings.FSS_URL,
+        max_connections=settings.FSS_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.FSS_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.FSS_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.FSS_CONNECT_TIMEOUT,
+        read_timeout=settings.FSS_READ_TIMEOUT,
+        write_timeout=settings.FSS_WRITE_TIMEOUT,
+        pool_timeout=settings.FSS_POOL_TIMEOUT,
+        http2=settings.FSS_HTTP2,
+        **_resilience_components("fss"),
+    )
+    upstream_store["fas"] = create_upstream(
+        "fas", settings.FAS_URL,
+        max_connections=settings.FAS_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.FAS_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.FAS_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.FAS_CONNECT_TIMEOUT,
+        read_timeout=settings.FAS_READ_TIMEOUT,
+        write_timeout=settings.FAS_WRITE_TIMEOUT,
+        pool_timeout=settings.FAS_POOL_TIMEOUT,
+        http2=settings.FAS_HTTP2,
+        **_resilience_components("fas"),
+    )
+    health_check_tasks = []
+    if settings.HEALTH_CHECK_ENABLED:
+        for upstream in upstream_store.values():
+            health_check_tasks.append(asyncio.create_task(upstream.run_health_checks(
+                settings.HEALTH_CHECK_INTERVAL_SECONDS,
+                settings.HEALTH_CHECK_UNHEALTHY_THRESHOLD,
+                settings.HEALTH_CHECK_HEALTHY_THRESHOLD,
+            )))
     yield
-    logger.info("API Gateway: Closing HTTP client")
-    if "client" in client_store:
-        await client_store["client"].aclose()
-        client_store.pop("client", None) 
+    logger.info("API Gateway: Closing upstream HTTP clients")
+    for task in health_check_tasks:
+        task.cancel()
+    await asyncio.gather(*health_check_tasks, return_exceptions=True)
+    for name in list(upstream_store):
+        await upstream_store.pop(name).aclose()
+    response_cache.clear()
+    request_coalescer.reset()
+
+def _filter_response_headers(headers: httpx.Headers) -> dict:
+    response_headers = dict(headers)
+    response_headers.pop("transfer-encoding", None)
+    return response_headers
+
+def _forwarded_headers(request: Request, header_overrides: Optional[Dict[str, Optional[str]]] = None) -> List[Tuple[str, str]]:
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in ("host", "connection", "user-agent")]
+    if header_overrides:
+        headers = [(k, v) for k, v in headers if k.lower() not in header_overrides]
+        headers.extend((k, v) for k, v in header_overrides.items() if v is not None)
+    return headers
+
+async def _iter_upstream_body(rp: httpx.Response, chunk_size: int):
+    try:
+        async for chunk in rp.aiter_raw(chunk_size):
+            yield chunk
+    finally:
+        await rp.aclose()
+
+class UpstreamUnavailable(HTTPException):
+    pass
 
 async def forward_request_to_service(
-    request: Request, 
+    request: Request,
     target_url: str,
     target_path: str,
-    client: httpx.AsyncClient
+    client: httpx.AsyncClient,
+    stream: bool = False,
+    header_overrides: Optional[Dict[str, Optional[str]]] = None
 ):
     full_target_url = f"{target_url.rstrip('/')}{target_path}"
     if request.url.query:
         full_target_url += f"?{request.url.query}"
-    
-    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in ("host", "connection", "user-agent")]
-    
+
+    headers = _forwarded_headers(request, header_overrides)
+
     content = None
     if request.method in ["POST", "PUT", "PATCH"]:
-        content = await request.body()
+        content = request.stream() if stream else await request.body()
 
-    logger.info(f"Forwarding {request.method} request to {full_target_url}")
+    logger.info(f"Forwarding {request.method} request to {full_target_url} (stream={stream})")
     try:
+        if stream:
+            upstream_request = client.build_request(
+                method=request.method,
+                url=full_target_url,
+                headers=headers,
+                content=content,
+            )
+            rp = await client.send(upstream_request, stream=True)
+            return StreamingResponse(
+                _iter_upstream_body(rp, settings.STREAM_CHUNK_SIZE),
+                status_code=rp.status_code,
+                headers=_filter_response_headers(rp.headers),
+                background=BackgroundTask(rp.aclose),
+            )
         rp = await client.request(
             method=request.method,
             url=full_target_url,
             headers=headers,
             content=content,
         )
-        response_headers = dict(rp.headers)
-        response_headers.pop("transfer-encoding", None)
-        return Response(content=rp.content, status_code=rp.status_code, headers=response_headers)
+        return Response(content=rp.content, status_code=rp.status_code, headers=_filter_response_headers(rp.headers))
+    except httpx.PoolTimeout as e:
+        logger.error(f"Connection pool exhausted for {full_target_url} - {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Upstream connection pool exhausted: {target_url}{target_path}")
     except httpx.ConnectError as e:
         logger.error(f"Service unavailable: {full_target_url} - {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {target_url}{target_path} - {str(e)}")
+        raise UpstreamUnavailable(status_code=503, detail=f"Service unavailable: {target_url}{target_path} - {str(e)}")
     except httpx.TimeoutException as e:
         logger.error(f"Gateway timeout: {full_target_url} - {str(e)}")
         raise HTTPException(status_code=504, detail=f"Gateway timeout: {target_url}{target_path} - {str(e)}")
     except httpx.HTTPStatusError as e:
         logger.warning(f"HTTP error from {full_target_url}: {e.response.status_code} - {e.response.text}")
-        response_headers = dict(e.response.headers)
-        response_headers.pop("transfer-encoding", None)
-        return Response(content=e.response.content, status_code=e.response.status_code, headers=response_headers)
+        return Response(content=e.response.content, status_code=e.response.status_code, headers=_filter_response_headers(e.response.headers))
     except Exception as e:
         logger.exception(f"An unexpected error occurred while forwarding request to {full_target_url}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred while forwarding request to {target_url}{target_path}: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred while forwarding request to {target_url}{target_path}: {str(e)}")
+
+async def forward_to_upstream(
+    request: Request,
+    upstream: Upstream,
+    target_path: str,
+    stream: bool = False,
+    header_overrides: Optional[Dict[str, Optional[str]]] = None,
+    replica: Optional[Replica] = None
+) -> Response:
+    limiter, breaker = upstream.limiter, upstream.breaker
+    if limiter is not None and not limiter.try_acquire():
+        logger.warning(f"Shedding {request.method} {target_path} for '{upstream.name}': concurrency limit {int(limiter.limit)} reached")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service overloaded, request shed: {upstream.name}",
+            headers={"Retry-After": str(settings.CONCURRENCY_RETRY_AFTER_SECONDS)},
+        )
+    if breaker is not None and not await breaker.allow_request(upstream.ping):
+        if limiter is not None:
+            limiter.cancel()
+        logger.warning(f"Rejecting {request.method} {target_path} for '{upstream.name}': circuit {breaker.state}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service temporarily unavailable (circuit open): {upstream.name}",
+            headers={"Retry-After": str(breaker.retry_after())},
+        )
+
+    trial = breaker is not None and breaker.state == CircuitBreaker.HALF_OPEN
+    timed = not (stream and request.method in ("POST", "PUT", "PATCH"))
+    replica = replica or upstream.choose_replica()
+    replica.on_start()
+    started = time.monotonic()
+    finished = False
+    latency = None
+
+    def finish(success: bool, cancelled: bool = False):
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        replica.on_finish(latency, success or cancelled)
+        if cancelled:
+            if limiter is not None:
+                limiter.cancel()
+            if trial:
+                breaker.release_trial()
+            return
+        if limiter is not None:
+            limiter.release(latency, dropped=not success)
+        if breaker is not None:
+            breaker.record(success, latency)
+
+    try:
+        response = await forward_request_to_service(request, replica.base_url, target_path, upstream.client, stream=stream, header_overrides=header_overrides)
+    except asyncio.CancelledError:
+        latency = time.monotonic() - started if timed else None
+        finish(False, cancelled=True)
+        raise
+    except BaseException:
+        latency = time.monotonic() - started if timed else None
+        finish(False)
+        raise
+    latency = time.monotonic() - started if timed else None
+    success = response.status_code < 500
+    if isinstance(response, StreamingResponse):
+        return _finish_after_body(response, lambda body_complete: finish(success and body_complete))
+    finish(success)
+    return response
+
+def _finish_after_body(response: StreamingResponse, finish: Callable[[bool], None]) -> StreamingResponse:
+    body_iterator, background = response.body_iterator, response.background
+
+    async def tracked_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        except Exception:
+            finish(False)
+            raise
+        finally:
+            finish(True)
+
+    async def close():
+        finish(True)
+        if background is not None:
+            await background()
+
+    response.body_iterator = tracked_body()
+    response.background = BackgroundTask(close)
+    return response
+
+async def _forward_with_retries(
+    request: Request,
+    upstream: Upstream,
+    target_path: str,
+    header_overrides: Optional[Dict[str, Optional[str]]],
+    replica: Replica
+) -> Response:
+    attempt = 0
+    while True:
+        try:
+            return await forward_to_upstream(request, upstream, target_path, header_overrides=header_overrides, replica=replica)
+        except UpstreamUnavailable:
+            if attempt >= settings.RETRY_MAX_ATTEMPTS:
+                raise
+            backoff = random.uniform(0, min(settings.RETRY_BACKOFF_MAX_SECONDS, settings.RETRY_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+            attempt += 1
+            upstream.retries_total += 1
+            logger.warning(f"Connection to {replica.base_url} failed for GET {target_path}; retry {attempt}/{settings.RETRY_MAX_ATTEMPTS} in {backoff:.3f}s")
+            await asyncio.sleep(backoff)
+            replica = upstream.choose_replica(exclude=replica)
+
+async def forward_idempotent_request(
+    request: Request,
+    upstream: Upstream,
+    target_path: str,
+    header_overrides: Optional[Dict[str, Optional[str]]] = None
+) -> Response:
+    primary_replica = upstream.choose_replica()
+    primary = asyncio.ensure_future(_forward_with_retries(request, upstream, target_path, header_overrides, primary_replica))
+    if not settings.HEDGING_ENABLED or len(upstream.replicas) < 2:
+        return await primary
+
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=upstream.hedge_delay(
+            settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_DELAY_SECONDS, settings.HEDGE_MAX_DELAY_SECONDS))
+        if done:
+            return primary.result()
+
+        hedge_replica = upstream.choose_replica(exclude=primary_replica)
+        logger.info(f"GET {target_path} on {primary_replica.base_url} exceeded hedge delay, hedging to {hedge_replica.base_url}")
+        upstream.hedges_sent += 1
+        hedge = asyncio.ensure_future(_forward_with_retries(request, upstream, target_path, header_overrides, hedge_replica))
+        tasks.add(hedge)
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    if task is hedge:
+                        upstream.hedges_won += 1
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+COALESCING_KEY_HEADERS = (
+    "accept", "accept-encoding", "accept-language", "authorization", "cookie",
+    "range", "if-range", "if-none-match", "if-modified-since",
+)
+
+def coalescing_key(request: Request, upstream_name: str, target_path: str, header_overrides: Optional[Dict[str, Optional[str]]] = None) -> str:
+    headers = _forwarded_headers(request, header_overrides)
+    relevant = sorted((k.lower(), v) for k, v in headers if k.lower() in COALESCING_KEY_HEADERS)
+    return f"{request.method} {upstream_name}:{target_path}?{request.url.query} {relevant}"
+
+async def forward_coalesced_request(
+    request: Request,
+    upstream: Upstream,
+    target_path: str,
+    header_overrides: Optional[Dict[str, Optional[str]]] = None,
+    flights: SingleFlight = request_coalescer
+) -> Response:
+    if request.method != "GET":
+        return await forward_to_upstream(request, upstream, target_path, header_overrides=header_overrides)
+    if not settings.COALESCE_GET_REQUESTS:
+        return await forward_idempotent_request(request, upstream, target_path, header_overrides=header_overrides)
+
+    key = coalescing_key(request, upstream.name, target_path, header_overrides)
+    shared = await flights.do(key, lambda: forward_idempotent_request(request, upstream, target_path, header_overrides=header_overrides))
+    return Response(content=shared.body, status_code=shared.status_code, headers=dict(shared.headers))
+
+async def forward_cached_request(
+    request: Request,
+    upstream: Upstream,
+    target_path: str,
+    ttl_policy: Callable[[str, int, Mapping[str, str], bytes], Optional[float]],
+    cache: ResponseCache = response_cache
+) -> Response:
+    cache_key = f"{upstream.name}:{target_path}?{request.url.query}"
+    entry = cache.get(cache_key)
+    if entry is not None and entry.is_fresh():
+        cache.hits += 1
+        logger.debug(f"Cache hit for {cache_key}")
+        return entry.to_response(request)
+
+    header_overrides = {"accept-encoding": "identity", "if-none-match": None, "if-modified-since": None}
+    if entry is not None and entry.etag:
+        header_overrides["if-none-match"] = entry.etag
+
+    response = await forward_coalesced_request(request, upstream, target_path, header_overrides=header_overrides)
+
+    if entry is not None and response.status_code == 304:
+        ttl = ttl_policy(target_path, entry.status_code, {**entry.headers, **response.headers}, entry.body)
+        entry.refresh(ttl or 0.0)
+        cache.revalidations += 1
+        cache.hits += 1
+        logger.debug(f"Cache entry revalidated for {cache_key}")
+        return entry.to_response(request)
+
+    cache.misses += 1
+    ttl = ttl_policy(target_path, response.status_code, response.headers, response.body)
+    if ttl is None:
+        cache.invalidate(cache_key)
+    else:
+        cache.put(cache_key, CacheEntry(response.status_code, dict(response.headers), response.body, ttl))
+
+    response.headers["x-cache"] = "MISS"
+    if etag_matches(request.headers.get("if-none-match"), response.headers.get("etag")):
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+        return Response(status_code=304, headers=headers)
+    return response
+
+async def read_streaming_body(response: Response) -> bytes:
+    if not isinstance(response, StreamingResponse):
+        return response.body
+    chunks = [chunk async for chunk in response.body_iterator]
+    if response.background is not None:
+        await response.background()
+    return b"".join(chunks)
+
+def summarize_analysis_status(analyses: List[dict]) -> Optional[str]:
+    latest = latest_analysis(analyses)
+    return latest.get("analysis_status") if latest is not None else None
+
+async def wait_for_file_analysis(fas: Upstream, file_id: str, timeout: float) -> Tuple[Optional[str], List[dict], bool]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    analyses: List[dict] = []
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return summarize_analysis_status(analyses), analyses, True
+        poll_timeout = round(min(remaining, settings.UPLOAD_WAIT_POLL_SECONDS), 2)
+        replica = fas.choose_replica()
+        wait_url = f"{replica.base_url}/analysis/file/{file_id}/wait"
+        try:
+            rp = await fas.client.get(wait_url, params={"timeout": poll_timeout}, timeout=poll_timeout + settings.FAS_READ_TIMEOUT)
+        except httpx.TimeoutException as e:
+            logger.error(f"Gateway timeout while waiting for analysis at {wait_url} - {str(e)}")
+            raise HTTPException(status_code=504, detail=f"Gateway timeout while waiting for analysis of file {file_id}")
+        except httpx.TransportError as e:
+            logger.error(f"Service unavailable while waiting for analysis at {wait_url} - {str(e)}")
+            raise HTTPException(status_code=503, detail=f"Service unavailable while waiting for analysis of file {file_id}")
+        if rp.status_code != 200:
+            logger.error(f"Unexpected response {rp.status_code} from {wait_url}: {rp.text}")
+            raise HTTPException(status_code=502, detail=f"Analysis service returned {rp.status_code} while waiting for file {file_id}")
+        analyses = rp.json()
+        status = summarize_analysis_status(analyses)
+        if status in ("COMPLETED", "FAILED"):
+            return status, analyses, False
@@ -1,15 +1,38 @@
-from fastapi import FastAPI, Request, Depends
+import json
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request, Depends, Query, Response
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import httpx
 
 from config import Settings, settings
-from http_client import lifespan_manager, forward_request_to_service, client_store
+from http_client import (
+    lifespan_manager, forward_to_upstream, forward_coalesced_request, forward_cached_request,
+    read_streaming_body, wait_for_file_analysis, upstream_store
+)
+from singleflight import request_coalescer
+from batch_status import AnalysisStatusBatchRequest, analysis_status_batcher
+from compression import CompressionMiddleware, compression_stats
+from cache import analysis_cache_ttl, response_cache
+from upstreams import Upstream
 from logging_config import get_logger
 
 logger = get_logger(__name__)
 
 app = FastAPI(lifespan=lifespan_manager)
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        encodings=[e.strip() for e in settings.COMPRESSION_ENCODINGS.split(",") if e.strip()],
+        mime_types=[m.strip() for m in settings.COMPRESSION_MIME_TYPES.split(",") if m.strip()],
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
+    )
+
 @app.get("/ping", tags=["Health"])
 async def ping():
     logger.debug("Ping endpoint was called")
@@ -24,23 +47,82 @@ async def read_root(current_settings: Settings = Depends(lambda: settings)):
         "fas_url": current_settings.FAS_URL
     }
 
-async def get_http_client():
-    return client_store["client"]
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    return {
+        "upstreams": {name: upstream.snapshot() for name, upstream in upstream_store.items()},
+        "cache": response_cache.snapshot(),
+        "coalescing": request_coalescer.snapshot(),
+        "batch_status": analysis_status_batcher.snapshot(),
+        "compression": compression_stats.snapshot(),
+    }
+
+async def get_fss_upstream() -> Upstream:
+    return upstream_store["fss"]
+
+async def get_fas_upstream() -> Upstream:
+    return upstream_store["fas"]
+
+def should_stream(request: Request, path: str) -> bool:
+    return request.method in ("POST", "PUT") or path.rstrip("/").endswith("/download")
+
+@app.post("/api/v1/files/upload-and-wait", tags=["Files"])
+async def upload_and_wait_for_analysis(
+    request: Request,
+    timeout: Optional[float] = Query(None, ge=0),
+    fss: Upstream = Depends(get_fss_upstream),
+    fas: Upstream = Depends(get_fas_upstream),
+    current_settings: Settings = Depends(lambda: settings)
+):
+    wait_seconds = min(timeout if timeout is not None else current_settings.UPLOAD_WAIT_DEFAULT_SECONDS, current_settings.UPLOAD_WAIT_MAX_SECONDS)
+    upload_response = await forward_to_upstream(request, fss, "/upload", stream=True, header_overrides={"accept-encoding": "identity"})
+    upload_body = await read_streaming_body(upload_response)
+    if upload_response.status_code != 200:
+        logger.warning(f"Upload-and-wait: FSS upload failed with status {upload_response.status_code}")
+        return Response(content=upload_body, status_code=upload_response.status_code, media_type=upload_response.headers.get("content-type"))
+
+    file_metadata = json.loads(upload_body)
+    logger.info(f"Upload-and-wait: file {file_metadata['id']} stored, waiting up to {wait_seconds}s for analysis")
+    status, analyses, timed_out = await wait_for_file_analysis(fas, file_metadata["id"], wait_seconds)
+    return JSONResponse(
+        status_code=202 if timed_out else 200,
+        content={"file": file_metadata, "analysis_status": status, "timed_out": timed_out, "analyses": analyses},
+    )
 
 @app.api_route("/api/v1/files/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def proxy_to_fss(request: Request, path: str, client: httpx.AsyncClient = Depends(get_http_client), current_settings: Settings = Depends(lambda: settings)):
-    logger.info(f"Proxying request for /api/v1/files/{path} to FSS ({current_settings.FSS_URL})")
-    return await forward_request_to_service(request, current_settings.FSS_URL, f"/{path}", client)
+async def proxy_to_fss(request: Request, path: str, upstream: Upstream = Depends(get_fss_upstream)):
+    logger.info(f"Proxying request for /api/v1/files/{path} to FSS")
+    if should_stream(request, path):
+        return await forward_to_upstream(request, upstream, f"/{path}", stream=True)
+    return await forward_coalesced_request(request, upstream, f"/{path}")
+
+@app.post("/api/v1/analysis/files/status", tags=["Analysis"])
+async def get_analysis_statuses_for_files(
+    batch_request: AnalysisStatusBatchRequest,
+    request: Request,
+    upstream: Upstream = Depends(get_fas_upstream),
+    current_settings: Settings = Depends(lambda: settings)
+):
+    file_ids = list(dict.fromkeys(batch_request.file_ids))
+    if len(file_ids) > current_settings.BATCH_STATUS_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Too many file ids: {len(file_ids)} > {current_settings.BATCH_STATUS_MAX_IDS}")
+    logger.info(f"Batch status request for {len(file_ids)} file(s)")
+    strategy, results, errors = await analysis_status_batcher.fetch(request, upstream, file_ids)
+    return JSONResponse(content={"results": results, "errors": errors}, headers={"x-batch-strategy": strategy})
 
 @app.api_route("/api/v1/analysis/{full_path:path}", methods=["GET", "POST"])
 async def proxy_to_fas(
     full_path: str,
     request: Request,
-    client: httpx.AsyncClient = Depends(get_http_client),
+    upstream: Upstream = Depends(get_fas_upstream),
     current_settings: Settings = Depends(lambda: settings)
 ):
-    logger.info(f"Proxying request for /api/v1/analysis/{full_path} to FAS ({current_settings.FAS_URL})")
-    return await forward_request_to_service(request, current_settings.FAS_URL, "/analysis/" + full_path, client)
+    logger.info(f"Proxying request for /api/v1/analysis/{full_path} to FAS")
+    if full_path.rstrip("/").endswith("/wait"):
+        return await forward_to_upstream(request, upstream, "/analysis/" + full_path)
+    if request.method == "GET" and current_settings.CACHE_ENABLED:
+        return await forward_cached_request(request, upstream, "/analysis/" + full_path, analysis_cache_ttl)
+    return await forward_to_upstream(request, upstream, "/analysis/" + full_path)
 
 if __name__ == "__main__":
     import uvicorn
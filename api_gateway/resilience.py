@@ -0,0 +1,164 @@
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+class CircuitBreaker:
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float,
+        minimum_calls: int,
+        window_size: int,
+        slow_call_seconds: float,
+        open_seconds: float,
+        half_open_max_calls: int,
+        half_open_timeout_seconds: float = 30.0
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_timeout_seconds = half_open_timeout_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.half_opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._half_open_calls = 0
+        self._half_open_successes = 0
+        self._probing = False
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    def retry_after(self) -> int:
+        remaining = self.opened_at + self.open_seconds - time.monotonic()
+        return max(1, math.ceil(remaining))
+
+    async def allow_request(self, probe: Callable[[], Awaitable[bool]]) -> bool:
+        if self.state == self.HALF_OPEN and time.monotonic() >= self.half_opened_at + self.half_open_timeout_seconds:
+            logger.warning(f"Circuit '{self.name}': no verdict from trial calls within {self.half_open_timeout_seconds}s, probing again")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic() - self.open_seconds
+
+        if self.state == self.OPEN:
+            if time.monotonic() < self.opened_at + self.open_seconds or self._probing:
+                self.rejected_total += 1
+                return False
+            self._probing = True
+            try:
+                healthy = await probe()
+            finally:
+                self._probing = False
+            if not healthy:
+                logger.warning(f"Circuit '{self.name}': health probe failed, staying OPEN")
+                self._open()
+                self.rejected_total += 1
+                return False
+            logger.info(f"Circuit '{self.name}': health probe succeeded, moving to HALF_OPEN")
+            self.state = self.HALF_OPEN
+            self.half_opened_at = time.monotonic()
+            self._half_open_calls = 0
+            self._half_open_successes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                self.rejected_total += 1
+                return False
+            self._half_open_calls += 1
+        return True
+
+    def release_trial(self):
+        if self.state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record(self, success: bool, latency: Optional[float]):
+        failed = not success or (latency is not None and latency > self.slow_call_seconds)
+        if self.state == self.HALF_OPEN:
+            if failed:
+                logger.warning(f"Circuit '{self.name}': trial call failed in HALF_OPEN, reopening")
+                self._open()
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                logger.info(f"Circuit '{self.name}': trial calls succeeded, closing")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            return
+
+        if self.state != self.CLOSED:
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.minimum_calls:
+            failure_rate = sum(self._outcomes) / len(self._outcomes)
+            if failure_rate >= self.failure_rate_threshold:
+                logger.error(f"Circuit '{self.name}': failure rate {failure_rate:.2f} over {len(self._outcomes)} calls, opening")
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.opened_total += 1
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        window = len(self._outcomes)
+        return {
+            "state": self.state,
+            "failure_rate": round(sum(self._outcomes) / window, 4) if window else 0.0,
+            "window_calls": window,
+            "opened_total": self.opened_total,
+            "rejected_total": self.rejected_total,
+        }
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target_seconds: float,
+        backoff_ratio: float
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_seconds = latency_target_seconds
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.shed_total = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            self.shed_total += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def cancel(self):
+        self.in_flight -= 1
+
+    def release(self, latency: Optional[float], dropped: bool):
+        in_flight_before = self.in_flight
+        self.in_flight -= 1
+        if dropped or (latency is not None and latency > self.latency_target_seconds):
+            new_limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            if int(new_limit) < int(self.limit):
+                logger.warning(f"Concurrency limit for '{self.name}' decreased to {int(new_limit)} (latency={latency}, dropped={dropped})")
+            self.limit = new_limit
+        elif in_flight_before * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def snapshot(self) -> dict:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "shed_total": self.shed_total}
@@ -0,0 +1,39 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"Coalescing request into in-flight call for {key}")
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def reset(self):
+        self.leaders = 0
+        self.coalesced = 0
+
+    def snapshot(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+request_coalescer = SingleFlight()
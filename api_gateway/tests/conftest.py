@@ -4,9 +4,11 @@ from typing import AsyncGenerator
 
 from httpx import AsyncClient
 
-from main import app 
+from main import app
+from http_client import lifespan_manager
 
 @pytest_asyncio.fixture(scope="function")
 async def async_client() -> AsyncGenerator[AsyncClient, None]:
-    async with AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testapigateway") as client:
-        yield client
+    async with lifespan_manager(app):
+        async with AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testapigateway") as client:
+            yield client
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from batch_status import analysis_status_batcher
+from config import settings
+
+BULK_URL = f"{settings.FAS_URL}/analysis/files/status"
+
+@pytest.fixture(autouse=True)
+def reset_batcher():
+    analysis_status_batcher.reset()
+    yield
+    analysis_status_batcher.reset()
+
+@pytest.mark.asyncio
+async def test_batch_status_is_pushed_down_to_fas_bulk_query(async_client: AsyncClient, httpx_mock):
+    body = {"results": {"a": [{"analysis_status": "COMPLETED"}], "b": []}, "errors": {}}
+    httpx_mock.add_response(method="POST", url=BULK_URL, json=body)
+
+    response = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": ["a", "b", "a"]})
+    assert response.status_code == 200
+    assert response.headers["x-batch-strategy"] == "bulk"
+    assert response.json() == body
+    (bulk_request,) = httpx_mock.get_requests()
+    assert json.loads(bulk_request.content) == {"file_ids": ["a", "b"]}
+
+@pytest.mark.asyncio
+async def test_batch_status_falls_back_to_fanout_when_bulk_query_is_rejected(async_client: AsyncClient, httpx_mock, monkeypatch):
+    import batch_status
+
+    async def circuit_open(*args, **kwargs):
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable (circuit open): fas")
+
+    monkeypatch.setattr(batch_status, "forward_to_upstream", circuit_open)
+    httpx_mock.add_response(method="GET", url=f"{settings.FAS_URL}/analysis/file/a", json=[{"analysis_status": "PENDING"}])
+
+    response = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": ["a"]})
+    assert response.status_code == 200
+    assert response.headers["x-batch-strategy"] == "fanout"
+    assert response.json() == {"results": {"a": [{"analysis_status": "PENDING"}]}, "errors": {}}
+    assert analysis_status_batcher.snapshot()["bulk_supported"] is True
+
+@pytest.mark.asyncio
+async def test_batch_status_falls_back_to_fanout_with_partial_failures(async_client: AsyncClient, httpx_mock):
+    httpx_mock.add_response(method="POST", url=BULK_URL, status_code=405, json={"detail": "Method Not Allowed"})
+    httpx_mock.add_response(method="GET", url=f"{settings.FAS_URL}/analysis/file/ok", json=[{"analysis_status": "COMPLETED"}], is_reusable=True)
+    httpx_mock.add_response(method="GET", url=f"{settings.FAS_URL}/analysis/file/bad", status_code=422, json={"detail": "Invalid file id"}, is_reusable=True)
+
+    response = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": ["ok", "bad"]})
+    assert response.status_code == 200
+    assert response.headers["x-batch-strategy"] == "fanout"
+    assert response.json() == {
+        "results": {"ok": [{"analysis_status": "COMPLETED"}]},
+        "errors": {"bad": {"status_code": 422, "detail": "Invalid file id"}},
+    }
+
+    again = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": ["ok"]})
+    assert again.headers["x-batch-strategy"] == "fanout"
+    assert len([r for r in httpx_mock.get_requests() if r.method == "POST"]) == 1
+    assert analysis_status_batcher.snapshot()["bulk_supported"] is False
+
+@pytest.mark.asyncio
+async def test_batch_status_fanout_respects_concurrency_bound(async_client: AsyncClient, httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_STATUS_PUSHDOWN", False)
+    monkeypatch.setattr(settings, "BATCH_STATUS_CONCURRENCY", 3)
+    in_flight = peak = 0
+
+    async def slow_status(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json=[])
+
+    httpx_mock.add_callback(slow_status, url=re.compile(rf"{settings.FAS_URL}/analysis/file/.*"), is_reusable=True)
+
+    file_ids = [f"file-{i}" for i in range(12)]
+    response = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": file_ids})
+    assert response.status_code == 200
+    assert sorted(response.json()["results"]) == sorted(file_ids)
+    assert peak == 3
+    assert analysis_status_batcher.snapshot()["fanout_requests"] == 12
+
+@pytest.mark.asyncio
+async def test_batch_status_rejects_oversized_batch(async_client: AsyncClient, httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_STATUS_MAX_IDS", 2)
+    response = await async_client.post("/api/v1/analysis/files/status", json={"file_ids": ["a", "b", "c"]})
+    assert response.status_code == 413
+    assert not httpx_mock.get_requests()
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from cache import CacheEntry, ResponseCache, analysis_cache_ttl, etag_matches, parse_cache_control
+from config import settings
+
+def json_headers(**extra):
+    return {"content-type": "application/json", **extra}
+
+def test_parse_cache_control():
+    directives = parse_cache_control('public, max-age=60, no-transform, community="UCI"')
+    assert directives == {"public": None, "max-age": "60", "no-transform": None, "community": "UCI"}
+    assert parse_cache_control(None) == {}
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"other"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+def test_analysis_cache_ttl_by_status():
+    completed = json.dumps([
+        {"analysis_status": "FAILED", "created_at": "2026-01-01T10:00:00"},
+        {"analysis_status": "COMPLETED", "created_at": "2026-01-01T10:05:00"},
+    ]).encode()
+    retry_pending = json.dumps([
+        {"analysis_status": "COMPLETED", "created_at": "2026-01-01T10:00:00"},
+        {"analysis_status": "PENDING", "created_at": "2026-01-01T10:05:00"},
+    ]).encode()
+    pending = json.dumps([{"analysis_status": "PROCESSING"}]).encode()
+    list_failed = json.dumps([{"analysis_status": "FAILED"}]).encode()
+    single_failed = json.dumps({"analysis_status": "FAILED"}).encode()
+    single_completed = json.dumps({"analysis_status": "COMPLETED"}).encode()
+
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(), completed) == settings.CACHE_COMPLETED_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(), retry_pending) == settings.CACHE_PENDING_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(), pending) == settings.CACHE_PENDING_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(), b"[]") == settings.CACHE_PENDING_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(), list_failed) == settings.CACHE_PENDING_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/123", 200, json_headers(), single_failed) == settings.CACHE_PENDING_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/123", 200, json_headers(), single_completed) == settings.CACHE_COMPLETED_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/wordclouds/1/1_a.png", 200, {"content-type": "image/png"}, b"png") == settings.CACHE_IMMUTABLE_TTL_SECONDS
+    assert analysis_cache_ttl("/analysis/file/1", 404, json_headers(), b"{}") is None
+
+def test_analysis_cache_ttl_respects_upstream_cache_control():
+    body = json.dumps([{"analysis_status": "COMPLETED"}]).encode()
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(**{"cache-control": "no-store"}), body) is None
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(**{"cache-control": "no-cache"}), body) == 0.0
+    assert analysis_cache_ttl("/analysis/file/1", 200, json_headers(**{"cache-control": "max-age=42"}), body) == 42.0
+
+def test_response_cache_evicts_least_recently_used_by_size():
+    cache = ResponseCache(max_bytes=300, max_entry_bytes=200)
+    for key in ("a", "b", "c"):
+        cache.put(key, CacheEntry(200, {}, b"x" * 100, ttl=60))
+    assert cache.snapshot()["entries"] == 3
+
+    cache.get("a")
+    cache.put("d", CacheEntry(200, {}, b"x" * 100, ttl=60))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+    assert cache.current_bytes <= 300
+
+    cache.put("huge", CacheEntry(200, {}, b"x" * 201, ttl=60))
+    assert cache.get("huge") is None
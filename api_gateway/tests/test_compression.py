@@ -0,0 +1,94 @@
+import gzip
+
+import brotli
+import httpx
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from compression import CompressionMiddleware, CompressionStats, negotiate_encoding
+
+TEXT = b"word cloud analysis text " * 400
+
+def build_app(stats: CompressionStats, chunks_seen: list) -> Starlette:
+    async def text(request):
+        return Response(TEXT, media_type="text/plain", headers={"etag": '"abc"'})
+
+    async def small(request):
+        return Response(b'{"ok": true}', media_type="application/json")
+
+    async def png(request):
+        return Response(TEXT, media_type="image/png")
+
+    async def stream(request):
+        async def body():
+            for _ in range(4):
+                chunks_seen.append(len(TEXT))
+                yield TEXT
+        return StreamingResponse(body(), media_type="text/plain")
+
+    app = Starlette(routes=[Route("/text", text), Route("/small", small), Route("/png", png), Route("/stream", stream)])
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=1024, encodings=["zstd", "br", "gzip"],
+        mime_types=["application/json", "text/"], stats=stats,
+    )
+    return app
+
+@pytest.fixture
+def stats():
+    return CompressionStats()
+
+@pytest.fixture
+def chunks_seen():
+    return []
+
+@pytest.fixture
+async def client(stats, chunks_seen):
+    transport = httpx.ASGITransport(app=build_app(stats, chunks_seen))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+def test_negotiate_encoding_honours_q_values_and_server_preference():
+    encodings = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, br", encodings) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", encodings) == "gzip"
+    assert negotiate_encoding("*", encodings) == "zstd"
+    assert negotiate_encoding("*;q=0, gzip", encodings) == "gzip"
+    assert negotiate_encoding("identity", encodings) is None
+    assert negotiate_encoding(None, encodings) is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding, decode", [
+    ("gzip", gzip.decompress),
+    ("br", brotli.decompress),
+    ("zstd", lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)),
+])
+async def test_text_is_compressed_with_negotiated_encoding(client, stats, encoding, decode):
+    async with client.stream("GET", "/text", headers={"accept-encoding": encoding}) as response:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert decode(raw) == TEXT
+    assert stats.snapshot()["encodings"][encoding]["bytes_in"] == len(TEXT)
+
+@pytest.mark.asyncio
+async def test_small_and_already_compressed_bodies_are_left_alone(client):
+    small = await client.get("/small", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.json() == {"ok": True}
+
+    png = await client.get("/png", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in png.headers
+    assert png.headers["content-length"] == str(len(TEXT))
+
+@pytest.mark.asyncio
+async def test_streaming_body_is_compressed_incrementally(client, chunks_seen):
+    async with client.stream("GET", "/stream", headers={"accept-encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        body = await response.aread()
+    assert body == TEXT * 4
+    assert chunks_seen == [len(TEXT)] * 4
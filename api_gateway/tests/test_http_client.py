@@ -1,11 +1,13 @@
+import asyncio
 import pytest
 import httpx
 import json
 from httpx import AsyncClient, Response, Request, ConnectError, TimeoutException, HTTPStatusError
 from fastapi import Request as FastAPIRequest, HTTPException
+from fastapi.responses import StreamingResponse
 from unittest.mock import patch, MagicMock
 
-from http_client import forward_request_to_service, lifespan_manager, client_store
+from http_client import forward_request_to_service, forward_idempotent_request, lifespan_manager, upstream_store
 from config import settings
 
 @pytest.mark.asyncio
@@ -96,11 +98,18 @@ async def test_forward_request_to_service_post_with_body(httpx_mock):
 async def test_lifespan_manager():
     app_mock = MagicMock()
     async with lifespan_manager(app_mock):
-        assert "client" in client_store
-        assert isinstance(client_store["client"], httpx.AsyncClient)
-        assert not client_store["client"].is_closed
-    
-    assert "client" not in client_store 
+        assert set(upstream_store) == {"fss", "fas"}
+        fss_client = upstream_store["fss"].client
+        fas_client = upstream_store["fas"].client
+        assert isinstance(fss_client, httpx.AsyncClient)
+        assert fss_client is not fas_client
+        assert not fss_client.is_closed
+        assert fss_client.timeout.read == settings.FSS_READ_TIMEOUT
+        assert fas_client.timeout.connect == settings.FAS_CONNECT_TIMEOUT
+
+    assert upstream_store == {}
+    assert fss_client.is_closed
+    assert fas_client.is_closed
 
 @pytest.mark.asyncio
 async def test_forward_request_to_service_connect_error(httpx_mock):
@@ -173,4 +182,137 @@ async def test_forward_request_to_service_generic_exception(httpx_mock):
         async with AsyncClient() as client:
             await forward_request_to_service(fastapi_request, base_url, path, client)
     assert exc_info.value.status_code == 500
-    assert "An unexpected error occurred" in exc_info.value.detail 
\ No newline at end of file
+    assert "An unexpected error occurred" in exc_info.value.detail 
+
+@pytest.mark.asyncio
+async def test_forward_request_to_service_stream_get(httpx_mock):
+    base_url = "http://testservice"
+    path = "/files/123/download"
+    full_url = f"{base_url}{path}"
+    file_content = b"x" * (3 * settings.STREAM_CHUNK_SIZE + 17)
+
+    httpx_mock.add_response(method="GET", url=full_url, content=file_content, headers={"content-type": "text/plain"})
+
+    scope = {"type": "http", "method": "GET", "headers": [], "path": path, "query_string": b"", "asgi": {"version": "3.0"}}
+    fastapi_request = FastAPIRequest(scope)
+
+    async with AsyncClient() as client:
+        response = await forward_request_to_service(fastapi_request, base_url, path, client, stream=True)
+        assert isinstance(response, StreamingResponse)
+        chunks = [chunk async for chunk in response.body_iterator]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain"
+    assert b"".join(chunks) == file_content
+    assert max(len(chunk) for chunk in chunks) <= settings.STREAM_CHUNK_SIZE
+
+@pytest.mark.asyncio
+async def test_forward_request_to_service_stream_post_body(httpx_mock):
+    base_url = "http://testservice"
+    path = "/upload"
+    full_url = f"{base_url}{path}"
+    body_parts = [b"first-part-", b"second-part-", b"third-part"]
+
+    httpx_mock.add_response(method="POST", url=full_url, json={"id": "1"}, status_code=200)
+
+    messages = [{"type": "http.request", "body": part, "more_body": i < len(body_parts) - 1} for i, part in enumerate(body_parts)]
+
+    async def receive():
+        return messages.pop(0)
+
+    total_length = sum(len(part) for part in body_parts)
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"application/octet-stream"), (b"content-length", str(total_length).encode())],
+        "path": path,
+        "query_string": b"",
+        "asgi": {"version": "3.0"}
+    }
+    fastapi_request = FastAPIRequest(scope, receive=receive)
+
+    async with AsyncClient() as client:
+        response = await forward_request_to_service(fastapi_request, base_url, path, client, stream=True)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+
+    assert response.status_code == 200
+    assert json.loads(body) == {"id": "1"}
+
+    http_request: Request = httpx_mock.get_requests()[0]
+    assert http_request.headers["content-length"] == str(total_length)
+    assert "transfer-encoding" not in http_request.headers
+    assert await http_request.aread() == b"".join(body_parts)
+
+def make_two_replica_upstream():
+    from upstreams import create_upstream
+    return create_upstream(
+        "test", "http://replica1,http://replica2",
+        max_connections=10, max_keepalive_connections=10, keepalive_expiry=5.0,
+        connect_timeout=1.0, read_timeout=5.0, write_timeout=1.0, pool_timeout=1.0,
+    )
+
+def get_request(path: str) -> FastAPIRequest:
+    return FastAPIRequest({"type": "http", "method": "GET", "headers": [], "path": path, "query_string": b"", "asgi": {"version": "3.0"}})
+
+@pytest.mark.asyncio
+async def test_forward_idempotent_request_hedges_slow_replica(httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MAX_DELAY_SECONDS", 0.05)
+    upstream = make_two_replica_upstream()
+    slow, fast = upstream.replicas
+
+    async def slow_response(request: Request):
+        await asyncio.sleep(1)
+        return Response(200, json={"replica": "slow"})
+
+    httpx_mock.add_callback(slow_response, url="http://replica1/analysis/1", is_optional=True)
+    httpx_mock.add_response(url="http://replica2/analysis/1", json={"replica": "fast"})
+
+    monkeypatch.setattr(upstream, "choose_replica", lambda exclude=None: fast if exclude is slow else slow)
+    response = await forward_idempotent_request(get_request("/analysis/1"), upstream, "/analysis/1")
+
+    assert json.loads(response.body) == {"replica": "fast"}
+    assert upstream.hedges_sent == 1
+    assert upstream.hedges_won == 1
+    assert slow.outstanding == 0 and fast.outstanding == 0
+    assert upstream.stats.in_flight == 0
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_forward_idempotent_request_skips_hedge_for_fast_primary(httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MAX_DELAY_SECONDS", 1.0)
+    upstream = make_two_replica_upstream()
+    httpx_mock.add_response(url="http://replica1/analysis/1", json={"ok": True})
+    upstream.replicas[1].outstanding = 1
+
+    response = await forward_idempotent_request(get_request("/analysis/1"), upstream, "/analysis/1")
+    assert response.status_code == 200
+    assert upstream.hedges_sent == 0
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_forward_idempotent_request_retries_connect_errors_on_other_replica(httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGING_ENABLED", False)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_BASE_SECONDS", 0.001)
+    upstream = make_two_replica_upstream()
+    upstream.replicas[1].outstanding = 1
+    httpx_mock.add_exception(ConnectError("refused"), url="http://replica1/files/1/metadata")
+    httpx_mock.add_response(url="http://replica2/files/1/metadata", json={"id": "1"})
+
+    response = await forward_idempotent_request(get_request("/files/1/metadata"), upstream, "/files/1/metadata")
+    assert response.status_code == 200
+    assert upstream.retries_total == 1
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_forward_idempotent_request_gives_up_after_max_retries(httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGING_ENABLED", False)
+    monkeypatch.setattr(settings, "RETRY_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_BASE_SECONDS", 0.001)
+    upstream = make_two_replica_upstream()
+    httpx_mock.add_exception(ConnectError("refused"), is_reusable=True)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await forward_idempotent_request(get_request("/analysis/1"), upstream, "/analysis/1")
+    assert exc_info.value.status_code == 503
+    assert upstream.retries_total == 1
+    await upstream.aclose()
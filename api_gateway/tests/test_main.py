@@ -2,9 +2,11 @@ import pytest
 import httpx
 from httpx import AsyncClient, Response
 import json
+import re
+import asyncio
 
 from config import settings
-from main import app, get_http_client, client_store
+from main import app, upstream_store
 
 @pytest.mark.asyncio
 async def test_ping(async_client: AsyncClient):
@@ -30,16 +32,10 @@ async def test_proxy_to_fss_get(async_client: AsyncClient, httpx_mock):
     
     httpx_mock.add_response(method="GET", url=fss_target_url, json=mock_content, status_code=200)
     
-    actual_outgoing_client = httpx.AsyncClient()
-    client_store["client"] = actual_outgoing_client
-
     response = await async_client.get(f"/api/v1/files{path}?{query_params}")
     assert response.status_code == 200
     assert response.json() == mock_content
 
-    await actual_outgoing_client.aclose()
-    client_store.pop("client", None)
-
 @pytest.mark.asyncio
 async def test_proxy_to_fas_post(async_client: AsyncClient, httpx_mock):
     path = "/initiate"
@@ -55,9 +51,6 @@ async def test_proxy_to_fas_post(async_client: AsyncClient, httpx_mock):
         status_code=202
     )
     
-    actual_outgoing_client = httpx.AsyncClient()
-    client_store["client"] = actual_outgoing_client
-
     response = await async_client.post(f"/api/v1/analysis{path}?{query_params}", json=request_payload)
     assert response.status_code == 202
     assert response.json() == mock_response_content
@@ -65,7 +58,227 @@ async def test_proxy_to_fas_post(async_client: AsyncClient, httpx_mock):
     mock_request = httpx_mock.get_requests()[0]
     assert mock_request.method == "POST"
     assert str(mock_request.url) == fas_target_url
-    assert json.loads(mock_request.content) == request_payload
+    assert json.loads(mock_request.content) == request_payload 
+
+@pytest.mark.asyncio
+async def test_proxy_to_fss_download_is_streamed(async_client: AsyncClient, httpx_mock):
+    file_id = "123e4567-e89b-12d3-a456-426614174000"
+    fss_target_url = f"{settings.FSS_URL}/{file_id}/download"
+    file_content = b"streamed file content " * 10000
+
+    httpx_mock.add_response(method="GET", url=fss_target_url, content=file_content, headers={"content-type": "text/plain"})
+
+    response = await async_client.get(f"/api/v1/files/{file_id}/download", headers={"accept-encoding": "identity"})
+    assert response.status_code == 200
+    assert response.content == file_content
+    assert response.headers["content-length"] == str(len(file_content))
+
+@pytest.mark.asyncio
+async def test_proxy_to_fss_download_is_compressed_for_capable_clients(async_client: AsyncClient, httpx_mock):
+    file_id = "123e4567-e89b-12d3-a456-426614174000"
+    file_content = b"streamed file content " * 10000
+    httpx_mock.add_response(method="GET", url=f"{settings.FSS_URL}/{file_id}/download", content=file_content, headers={"content-type": "text/plain"})
+
+    response = await async_client.get(f"/api/v1/files/{file_id}/download", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == file_content
+
+@pytest.mark.asyncio
+async def test_metrics_reports_each_upstream_pool(async_client: AsyncClient, httpx_mock):
+    httpx_mock.add_response(method="GET", url=f"{settings.FAS_URL}/analysis/file/abc", json=[])
+
+    await async_client.get("/api/v1/analysis/file/abc")
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    upstreams = response.json()["upstreams"]
+    assert set(upstreams) == {"fss", "fas"}
+    assert upstreams["fas"]["pool"]["requests_total"] == 1
+    assert upstreams["fss"]["pool"]["requests_total"] == 0
+    assert upstreams["fas"]["pool"]["max_connections"] == settings.FAS_MAX_CONNECTIONS
+
+@pytest.mark.asyncio
+async def test_proxy_to_fas_caches_completed_analysis(async_client: AsyncClient, httpx_mock):
+    fas_target_url = f"{settings.FAS_URL}/analysis/file/completed-id"
+    body = [{"id": "a1", "analysis_status": "COMPLETED"}]
+    httpx_mock.add_response(method="GET", url=fas_target_url, json=body)
+
+    first = await async_client.get("/api/v1/analysis/file/completed-id")
+    second = await async_client.get("/api/v1/analysis/file/completed-id")
+
+    assert first.json() == body and second.json() == body
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert len(httpx_mock.get_requests()) == 1
+    assert httpx_mock.get_requests()[0].headers["accept-encoding"] == "identity"
+
+    cache_stats = (await async_client.get("/metrics")).json()["cache"]
+    assert cache_stats["hits"] == 1
+    assert cache_stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_proxy_to_fas_revalidates_stale_entry_with_etag(async_client: AsyncClient, httpx_mock, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_IMMUTABLE_TTL_SECONDS", 0.0)
+    image_path = "wordclouds/a1/a1_cloud.png"
+    fas_target_url = f"{settings.FAS_URL}/analysis/{image_path}"
+    httpx_mock.add_response(method="GET", url=fas_target_url, content=b"png-bytes", headers={"content-type": "image/png", "etag": '"v1"'})
+    httpx_mock.add_response(method="GET", url=fas_target_url, status_code=304, headers={"etag": '"v1"'}, is_reusable=True)
+
+    first = await async_client.get(f"/api/v1/analysis/{image_path}")
+    second = await async_client.get(f"/api/v1/analysis/{image_path}")
+    assert first.content == second.content == b"png-bytes"
+    assert httpx_mock.get_requests()[1].headers["if-none-match"] == '"v1"'
+
+    not_modified = await async_client.get(f"/api/v1/analysis/{image_path}", headers={"if-none-match": '"v1"'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+@pytest.mark.asyncio
+async def test_proxy_to_fas_does_not_cache_post(async_client: AsyncClient, httpx_mock):
+    fas_target_url = f"{settings.FAS_URL}/analysis/"
+    httpx_mock.add_response(method="POST", url=fas_target_url, json={"analysis_status": "PENDING"}, status_code=202)
+    httpx_mock.add_response(method="POST", url=fas_target_url, json={"analysis_status": "PENDING"}, status_code=202)
+
+    await async_client.post("/api/v1/analysis/", json={})
+    await async_client.post("/api/v1/analysis/", json={})
+    assert len(httpx_mock.get_requests()) == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_gets_are_coalesced(async_client: AsyncClient, httpx_mock):
+    file_id = "123e4567-e89b-12d3-a456-426614174000"
+    fss_target_url = f"{settings.FSS_URL}/{file_id}/metadata"
+    upstream_calls = 0
+
+    async def slow_metadata(request: httpx.Request):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"id": file_id})
+
+    httpx_mock.add_callback(slow_metadata, method="GET", url=fss_target_url, is_reusable=True)
+
+    responses = await asyncio.gather(*[async_client.get(f"/api/v1/files/{file_id}/metadata") for _ in range(10)])
+
+    assert all(r.status_code == 200 and r.json() == {"id": file_id} for r in responses)
+    assert upstream_calls == 1
+    coalescing = (await async_client.get("/metrics")).json()["coalescing"]
+    assert coalescing["leaders"] == 1
+    assert coalescing["coalesced"] == 9
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast_with_retry_after(async_client: AsyncClient, httpx_mock):
+    breaker = upstream_store["fas"].breaker
+    breaker._open()
+
+    response = await async_client.post("/api/v1/analysis/", json={})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert not httpx_mock.get_requests()
+
+    metrics = (await async_client.get("/metrics")).json()
+    assert metrics["upstreams"]["fas"]["circuit"]["state"] == "OPEN"
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_sheds_excess_requests(async_client: AsyncClient, httpx_mock):
+    limiter = upstream_store["fas"].limiter
+    limiter.in_flight = int(limiter.limit)
+
+    response = await async_client.post("/api/v1/analysis/", json={})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(settings.CONCURRENCY_RETRY_AFTER_SECONDS)
+    assert limiter.shed_total == 1
+
+@pytest.mark.asyncio
+async def test_upload_and_wait_returns_completed_analysis(async_client: AsyncClient, httpx_mock):
+    file_metadata = {"id": "file-1", "filename": "a.txt"}
+    analysis = {"id": "an-1", "original_file_id": "file-1", "analysis_status": "COMPLETED"}
+    httpx_mock.add_response(method="POST", url=f"{settings.FSS_URL}/upload?timeout=5", json=file_metadata)
+    httpx_mock.add_response(
+        method="GET",
+        url=httpx.URL(f"{settings.FAS_URL}/analysis/file/file-1/wait", params={"timeout": 5.0}),
+        json=[analysis],
+    )
+
+    response = await async_client.post(
+        "/api/v1/files/upload-and-wait?timeout=5", files={"file": ("a.txt", b"hello", "text/plain")}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"file": file_metadata, "analysis_status": "COMPLETED", "timed_out": False, "analyses": [analysis]}
+
+@pytest.mark.asyncio
+async def test_upload_and_wait_returns_202_when_analysis_is_still_running(async_client: AsyncClient, httpx_mock):
+    httpx_mock.add_response(method="POST", url=f"{settings.FSS_URL}/upload?timeout=0.05", json={"id": "file-2"})
+    httpx_mock.add_response(
+        method="GET",
+        url=re.compile(rf"{settings.FAS_URL}/analysis/file/file-2/wait\?timeout=.*"),
+        json=[{"id": "an-2", "analysis_status": "PROCESSING"}],
+        is_reusable=True,
+    )
+
+    response = await async_client.post(
+        "/api/v1/files/upload-and-wait?timeout=0.05", files={"file": ("b.txt", b"data", "text/plain")}
+    )
+    assert response.status_code == 202
+    assert response.json()["analysis_status"] == "PROCESSING"
+    assert response.json()["timed_out"] is True
+
+@pytest.mark.asyncio
+async def test_upload_and_wait_keeps_waiting_for_retry_after_failure(async_client: AsyncClient, httpx_mock):
+    httpx_mock.add_response(method="POST", url=f"{settings.FSS_URL}/upload?timeout=0.05", json={"id": "file-3"})
+    httpx_mock.add_response(
+        method="GET",
+        url=re.compile(rf"{settings.FAS_URL}/analysis/file/file-3/wait\?timeout=.*"),
+        json=[
+            {"id": "an-3", "analysis_status": "FAILED", "created_at": "2026-01-01T10:00:00"},
+            {"id": "an-4", "analysis_status": "PENDING", "created_at": "2026-01-01T10:05:00"},
+        ],
+        is_reusable=True,
+    )
+
+    response = await async_client.post(
+        "/api/v1/files/upload-and-wait?timeout=0.05", files={"file": ("d.txt", b"retry", "text/plain")}
+    )
+    assert response.status_code == 202
+    assert response.json()["analysis_status"] == "PENDING"
+    assert response.json()["timed_out"] is True
+
+@pytest.mark.asyncio
+async def test_upload_and_wait_passes_through_upload_errors(async_client: AsyncClient, httpx_mock):
+    httpx_mock.add_response(method="POST", url=f"{settings.FSS_URL}/upload", json={"detail": "Empty file"}, status_code=400)
+
+    response = await async_client.post(
+        "/api/v1/files/upload-and-wait", files={"file": ("c.txt", b"", "text/plain")}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Empty file"}
+    assert len(httpx_mock.get_requests()) == 1
+
+@pytest.mark.asyncio
+async def test_download_passes_range_and_conditional_headers_through(async_client: AsyncClient, httpx_mock):
+    file_id = "123e4567-e89b-12d3-a456-426614174000"
+    fss_target_url = f"{settings.FSS_URL}/{file_id}/download"
+    etag = '"abc123"'
+    httpx_mock.add_response(
+        method="GET", url=fss_target_url, status_code=206, content=b"56789",
+        headers={"content-type": "text/plain", "content-range": "bytes 5-9/2000", "etag": etag},
+    )
+    httpx_mock.add_response(method="GET", url=fss_target_url, status_code=304, headers={"etag": etag})
+
+    partial = await async_client.get(
+        f"/api/v1/files/{file_id}/download",
+        headers={"range": "bytes=5-9", "if-range": etag, "accept-encoding": "gzip"},
+    )
+    assert partial.status_code == 206
+    assert partial.content == b"56789"
+    assert partial.headers["content-range"] == "bytes 5-9/2000"
+    assert partial.headers["etag"] == etag
+    assert "content-encoding" not in partial.headers
+
+    not_modified = await async_client.get(f"/api/v1/files/{file_id}/download", headers={"if-none-match": etag})
+    assert not_modified.status_code == 304
 
-    await actual_outgoing_client.aclose()
-    client_store.pop("client", None) 
\ No newline at end of file
+    range_request, conditional_request = httpx_mock.get_requests()
+    assert range_request.headers["range"] == "bytes=5-9"
+    assert range_request.headers["if-range"] == etag
+    assert conditional_request.headers["if-none-match"] == etag
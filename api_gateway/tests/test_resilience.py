@@ -0,0 +1,205 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Request as FastAPIRequest
+
+from http_client import forward_to_upstream
+from resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+from upstreams import create_upstream
+
+def make_breaker(**overrides):
+    options = dict(
+        failure_rate_threshold=0.5, minimum_calls=4, window_size=10,
+        slow_call_seconds=1.0, open_seconds=30.0, half_open_max_calls=2,
+    )
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+async def healthy_probe():
+    return True
+
+async def failing_probe():
+    return False
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_failure_rate_threshold():
+    breaker = make_breaker()
+    for success in (True, False, True, False):
+        assert await breaker.allow_request(healthy_probe)
+        breaker.record(success, latency=0.01)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not await breaker.allow_request(healthy_probe)
+    assert breaker.retry_after() > 0
+    assert breaker.snapshot()["rejected_total"] == 1
+
+@pytest.mark.asyncio
+async def test_breaker_counts_slow_calls_as_failures():
+    breaker = make_breaker(minimum_calls=2)
+    breaker.record(True, latency=5.0)
+    breaker.record(True, latency=5.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+@pytest.mark.asyncio
+async def test_breaker_half_open_probe_and_recovery():
+    breaker = make_breaker(open_seconds=0.0)
+    breaker._open()
+
+    assert not await breaker.allow_request(failing_probe)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert await breaker.allow_request(healthy_probe)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert await breaker.allow_request(healthy_probe)
+    assert not await breaker.allow_request(healthy_probe)
+
+    breaker.record(True, latency=0.01)
+    breaker.record(True, latency=0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_breaker_reopens_on_half_open_failure():
+    breaker = make_breaker(open_seconds=0.0)
+    breaker._open()
+    assert await breaker.allow_request(healthy_probe)
+    breaker.record(False, latency=0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened_total == 2
+
+def test_limiter_sheds_above_limit_and_adapts():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=2, min_limit=1, max_limit=4, latency_target_seconds=0.5, backoff_ratio=0.5)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert limiter.shed_total == 1
+
+    limiter.release(latency=0.01, dropped=False)
+    limiter.release(latency=0.01, dropped=False)
+    assert limiter.limit > 2
+
+    assert limiter.try_acquire()
+    limiter.release(latency=2.0, dropped=False)
+    assert limiter.limit < 2
+    assert limiter.limit >= limiter.min_limit
+    assert limiter.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_frees_its_slot():
+    breaker = make_breaker(open_seconds=0.01, half_open_max_calls=2)
+    breaker._open()
+    await asyncio.sleep(0.02)
+
+    assert await breaker.allow_request(healthy_probe)
+    breaker.release_trial()
+    assert await breaker.allow_request(healthy_probe)
+    breaker.record(True, latency=0.01)
+    assert await breaker.allow_request(healthy_probe)
+    breaker.record(True, latency=0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_half_open_without_verdict_times_out_and_probes_again():
+    breaker = make_breaker(open_seconds=0.01, half_open_max_calls=1, half_open_timeout_seconds=0.05)
+    breaker._open()
+    await asyncio.sleep(0.02)
+    assert await breaker.allow_request(healthy_probe)
+    assert not await breaker.allow_request(healthy_probe)
+
+    await asyncio.sleep(0.06)
+    assert not await breaker.allow_request(failing_probe)
+    assert breaker.state == CircuitBreaker.OPEN
+    await asyncio.sleep(0.02)
+    assert await breaker.allow_request(healthy_probe)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+def make_guarded_upstream(handler, breaker=None, limiter=None):
+    upstream = create_upstream(
+        "test", "http://upstream",
+        max_connections=10, max_keepalive_connections=10, keepalive_expiry=5.0,
+        connect_timeout=1.0, read_timeout=1.0, write_timeout=1.0, pool_timeout=1.0,
+        breaker=breaker, limiter=limiter,
+    )
+    upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return upstream
+
+def make_request(method: str, body: bytes = b"") -> FastAPIRequest:
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    scope = {"type": "http", "method": method, "headers": [(b"content-length", str(len(body)).encode())],
+             "path": "/x", "query_string": b"", "asgi": {"version": "3.0"}}
+    return FastAPIRequest(scope, receive=receive)
+
+@pytest.mark.asyncio
+async def test_cancelled_forward_releases_half_open_trial():
+    async def hanging(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    breaker = make_breaker(open_seconds=0.0, half_open_max_calls=1)
+    upstream = make_guarded_upstream(hanging, breaker=breaker)
+    upstream.ping = healthy_probe
+    breaker._open()
+
+    task = asyncio.ensure_future(forward_to_upstream(make_request("GET"), upstream, "/x"))
+    await asyncio.sleep(0.01)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert await breaker.allow_request(healthy_probe)
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_streamed_upload_duration_is_not_a_latency_signal():
+    async def slow(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={})
+
+    breaker = make_breaker(minimum_calls=1, slow_call_seconds=0.01)
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=4, min_limit=1, max_limit=8, latency_target_seconds=0.01, backoff_ratio=0.5)
+    upstream = make_guarded_upstream(slow, breaker=breaker, limiter=limiter)
+
+    response = await forward_to_upstream(make_request("POST", b"payload"), upstream, "/upload", stream=True)
+    await response.background()
+    assert limiter.limit == 4
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not upstream.replicas[0].latencies
+
+    await forward_to_upstream(make_request("GET"), upstream, "/x")
+    assert limiter.limit == 2
+    assert breaker.state == CircuitBreaker.OPEN
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_streamed_download_holds_limiter_slot_until_body_is_sent_but_reports_time_to_headers():
+    async def slow_body():
+        yield b"first"
+        await asyncio.sleep(0.1)
+        yield b"second"
+
+    async def download(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=slow_body())
+
+    breaker = make_breaker(minimum_calls=1, slow_call_seconds=0.05)
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=4, min_limit=1, max_limit=8, latency_target_seconds=0.05, backoff_ratio=0.5)
+    upstream = make_guarded_upstream(download, breaker=breaker, limiter=limiter)
+    replica = upstream.replicas[0]
+
+    response = await forward_to_upstream(make_request("GET"), upstream, "/1/download", stream=True)
+    assert limiter.in_flight == 1
+    assert replica.outstanding == 1
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    await response.background()
+    assert body == b"firstsecond"
+    assert limiter.in_flight == 0
+    assert replica.outstanding == 0
+    assert replica.latencies[-1] < 0.05
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert limiter.limit == 4
+    await upstream.aclose()
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call_between_waiters():
+    flights = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.create_task(flights.do("key", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    assert flights.snapshot()["in_flight"] == 1
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert calls == 1
+    assert flights.snapshot() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_and_allows_retry():
+    flights = SingleFlight()
+
+    async def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await flights.do("key", failing)
+
+    async def succeeding():
+        return 42
+
+    assert await flights.do("key", succeeding) == 42
+    assert flights.leaders == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_leader_cancellation():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "shared"
+
+    leader = asyncio.create_task(flights.do("key", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("key", fetch))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    release.set()
+    assert await follower == "shared"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
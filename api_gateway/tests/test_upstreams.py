@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+import httpx
+
+from upstreams import create_upstream, parse_replica_urls, PoolStats, Replica
+
+def make_upstream(max_connections: int = 2, pool_timeout: float = 5.0):
+    return create_upstream(
+        "test", "http://testupstream",
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=5.0,
+        connect_timeout=1.0,
+        read_timeout=1.0,
+        write_timeout=1.0,
+        pool_timeout=pool_timeout,
+    )
+
+@pytest.mark.asyncio
+async def test_pool_stats_track_buffered_requests(httpx_mock):
+    httpx_mock.add_response(url="http://testupstream/a", json={"ok": True})
+    upstream = make_upstream()
+
+    response = await upstream.client.get("http://testupstream/a")
+    assert response.json() == {"ok": True}
+
+    stats = upstream.snapshot()["pool"]
+    assert stats["requests_total"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["peak_in_flight"] == 1
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_pool_stats_hold_slot_until_stream_is_closed(httpx_mock):
+    httpx_mock.add_response(url="http://testupstream/download", content=b"data")
+    upstream = make_upstream()
+
+    request = upstream.client.build_request("GET", "http://testupstream/download")
+    response = await upstream.client.send(request, stream=True)
+    assert upstream.stats.in_flight == 1
+
+    await response.aread()
+    await response.aclose()
+    assert upstream.stats.in_flight == 0
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_pool_stats_release_on_transport_error(httpx_mock):
+    httpx_mock.add_exception(httpx.ConnectError("refused"), url="http://testupstream/fail")
+    upstream = make_upstream()
+
+    with pytest.raises(httpx.ConnectError):
+        await upstream.client.get("http://testupstream/fail")
+    assert upstream.stats.in_flight == 0
+    assert upstream.stats.requests_total == 1
+    await upstream.aclose()
+
+def test_pool_stats_count_saturation():
+    stats = PoolStats(max_connections=1)
+    stats.on_start()
+    stats.on_start()
+    assert stats.saturated_total == 1
+    assert stats.peak_in_flight == 2
+    stats.on_finish()
+    stats.on_finish()
+    assert stats.in_flight == 0
+
+def make_replicated_upstream(replica_urls):
+    return create_upstream(
+        "test", ",".join(replica_urls),
+        max_connections=10, max_keepalive_connections=10, keepalive_expiry=5.0,
+        connect_timeout=1.0, read_timeout=1.0, write_timeout=1.0, pool_timeout=1.0,
+    )
+
+def test_parse_replica_urls():
+    assert parse_replica_urls("http://a:8000/, http://b:8000 ,") == ["http://a:8000", "http://b:8000"]
+
+@pytest.mark.asyncio
+async def test_choose_replica_prefers_least_outstanding():
+    upstream = make_replicated_upstream(["http://r1", "http://r2", "http://r3"])
+    r1, r2, r3 = upstream.replicas
+    r1.outstanding, r2.outstanding, r3.outstanding = 5, 0, 5
+
+    chosen = [upstream.choose_replica() for _ in range(50)]
+    assert r2 in chosen
+    assert all(replica is r2 or replica.outstanding == 5 for replica in chosen)
+
+    upstream.strategy = "least_outstanding"
+    assert all(upstream.choose_replica() is r2 for _ in range(10))
+    assert upstream.choose_replica(exclude=r2) in (r1, r3)
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_health_checks_eject_and_readmit_replicas(httpx_mock):
+    upstream = make_replicated_upstream(["http://r1", "http://r2"])
+    r1, r2 = upstream.replicas
+    httpx_mock.add_response(url="http://r1/ping", json={"ok": True}, is_reusable=True)
+    httpx_mock.add_exception(httpx.ConnectError("down"), url="http://r2/ping")
+    httpx_mock.add_exception(httpx.ConnectError("down"), url="http://r2/ping")
+
+    await upstream.check_replicas(unhealthy_threshold=2, healthy_threshold=2)
+    assert r2.healthy
+    await upstream.check_replicas(unhealthy_threshold=2, healthy_threshold=2)
+    assert not r2.healthy
+    assert all(upstream.choose_replica() is r1 for _ in range(10))
+
+    httpx_mock.add_response(url="http://r2/ping", json={"ok": True}, is_reusable=True)
+    await upstream.check_replicas(unhealthy_threshold=2, healthy_threshold=2)
+    assert not r2.healthy
+    await upstream.check_replicas(unhealthy_threshold=2, healthy_threshold=2)
+    assert r2.healthy
+    await upstream.aclose()
+
+@pytest.mark.asyncio
+async def test_all_replicas_unhealthy_falls_back_to_every_replica():
+    upstream = make_replicated_upstream(["http://r1", "http://r2"])
+    for replica in upstream.replicas:
+        replica.healthy = False
+    assert upstream.choose_replica() in upstream.replicas
+    await upstream.aclose()
+
+def test_replica_latency_stats():
+    replica = Replica("http://r1")
+    for latency in range(1, 101):
+        replica.on_start()
+        replica.on_finish(latency / 1000.0, success=latency != 100)
+
+    snapshot = replica.snapshot()
+    assert snapshot["requests_total"] == 100
+    assert snapshot["errors_total"] == 1
+    assert snapshot["outstanding"] == 0
+    assert snapshot["latency_p50_seconds"] == pytest.approx(0.05, abs=0.002)
+    assert snapshot["latency_p95_seconds"] == pytest.approx(0.095, abs=0.002)
+
+@pytest.mark.asyncio
+async def test_forward_to_upstream_spreads_load_over_replicas(httpx_mock):
+    from fastapi import Request as FastAPIRequest
+    from http_client import forward_to_upstream
+
+    upstream = make_replicated_upstream(["http://r1", "http://r2"])
+    httpx_mock.add_response(url="http://r1/items", json={"replica": 1}, is_reusable=True)
+    httpx_mock.add_response(url="http://r2/items", json={"replica": 2}, is_reusable=True)
+
+    async def call():
+        scope = {"type": "http", "method": "GET", "headers": [], "path": "/items", "query_string": b"", "asgi": {"version": "3.0"}}
+        return await forward_to_upstream(FastAPIRequest(scope), upstream, "/items")
+
+    upstream.replicas[0].outstanding = 1
+    await call()
+    assert upstream.replicas[1].requests_total == 1
+    upstream.replicas[0].outstanding = 0
+    upstream.replicas[1].outstanding = 1
+    await call()
+    assert upstream.replicas[0].requests_total == 1
+    await upstream.aclose()
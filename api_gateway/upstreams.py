@@ -0,0 +1,256 @@
+import asyncio
+import random
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+import httpx
+
+from logging_config import get_logger
+from resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+
+logger = get_logger(__name__)
+
+class PoolStats:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.saturated_total = 0
+        self.pool_timeouts = 0
+
+    def on_start(self):
+        if self.in_flight >= self.max_connections:
+            self.saturated_total += 1
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def on_finish(self):
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests_total": self.requests_total,
+            "saturated_total": self.saturated_total,
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close: Optional[Callable[[], None]] = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: PoolStats):
+        self._transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.on_start()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.stats.pool_timeouts += 1
+            self.stats.on_finish()
+            raise
+        except BaseException:
+            self.stats.on_finish()
+            raise
+        response.stream = _ReleasingStream(response.stream, self.stats.on_finish)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def _percentile(values, percentile: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def parse_replica_urls(base_url: str) -> List[str]:
+    return [url.strip().rstrip("/") for url in base_url.split(",") if url.strip()]
+
+class Replica:
+    def __init__(self, base_url: str, latency_window: int = 256):
+        self.base_url = base_url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.consecutive_check_failures = 0
+        self.consecutive_check_successes = 0
+        self.ewma_latency: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+
+    def on_start(self):
+        self.outstanding += 1
+        self.requests_total += 1
+
+    def on_finish(self, latency: Optional[float], success: bool):
+        self.outstanding -= 1
+        if not success:
+            self.errors_total += 1
+        if latency is None:
+            return
+        self.latencies.append(latency)
+        self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        return _percentile(self.latencies, percentile)
+
+    def snapshot(self) -> dict:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 4) if value is not None else None
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "latency_ewma_seconds": rounded(self.ewma_latency),
+            "latency_p50_seconds": rounded(self.latency_percentile(50)),
+            "latency_p95_seconds": rounded(self.latency_percentile(95)),
+            "latency_p99_seconds": rounded(self.latency_percentile(99)),
+        }
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        replicas: List[Replica],
+        client: httpx.AsyncClient,
+        stats: PoolStats,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        probe_timeout: float = 1.0,
+        strategy: str = "p2c"
+    ):
+        self.name = name
+        self.replicas = replicas
+        self.client = client
+        self.stats = stats
+        self.breaker = breaker
+        self.limiter = limiter
+        self.probe_timeout = probe_timeout
+        self.strategy = strategy
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.retries_total = 0
+
+    def hedge_delay(self, percentile: float, min_delay: float, max_delay: float) -> float:
+        observed = _percentile([latency for replica in self.replicas for latency in replica.latencies], percentile)
+        if observed is None:
+            return max_delay
+        return min(max_delay, max(min_delay, observed))
+
+    def choose_replica(self, exclude: Optional[Replica] = None) -> Replica:
+        candidates = [r for r in self.replicas if r.healthy and r is not exclude]
+        if not candidates:
+            candidates = [r for r in self.replicas if r is not exclude] or self.replicas
+            logger.warning(f"No healthy replicas available for '{self.name}', routing to all {len(candidates)} replica(s)")
+        if len(candidates) > 2 and self.strategy == "p2c":
+            candidates = random.sample(candidates, 2)
+        return min(candidates, key=lambda r: (r.outstanding, r.ewma_latency or 0.0))
+
+    async def ping_replica(self, replica: Replica) -> bool:
+        try:
+            response = await self.client.get(f"{replica.base_url}/ping", timeout=self.probe_timeout)
+            return response.status_code == 200
+        except httpx.HTTPError as e:
+            logger.warning(f"Health probe to '{self.name}' replica {replica.base_url} failed: {str(e)}")
+            return False
+
+    async def ping(self) -> bool:
+        return await self.ping_replica(self.choose_replica())
+
+    async def check_replicas(self, unhealthy_threshold: int, healthy_threshold: int):
+        results = await asyncio.gather(*[self.ping_replica(replica) for replica in self.replicas])
+        for replica, ok in zip(self.replicas, results):
+            if ok:
+                replica.consecutive_check_failures = 0
+                replica.consecutive_check_successes += 1
+                if not replica.healthy and replica.consecutive_check_successes >= healthy_threshold:
+                    replica.healthy = True
+                    logger.info(f"Replica {replica.base_url} of '{self.name}' passed health checks, re-admitted")
+            else:
+                replica.consecutive_check_successes = 0
+                replica.consecutive_check_failures += 1
+                if replica.healthy and replica.consecutive_check_failures >= unhealthy_threshold:
+                    replica.healthy = False
+                    logger.error(f"Replica {replica.base_url} of '{self.name}' failed {replica.consecutive_check_failures} health checks, ejected")
+
+    async def run_health_checks(self, interval: float, unhealthy_threshold: int, healthy_threshold: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_replicas(unhealthy_threshold, healthy_threshold)
+            except Exception:
+                logger.exception(f"Health check round for '{self.name}' failed")
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            "strategy": self.strategy,
+            "replicas": [replica.snapshot() for replica in self.replicas],
+            "pool": self.stats.snapshot(),
+            "hedging": {"hedges_sent": self.hedges_sent, "hedges_won": self.hedges_won, "retries_total": self.retries_total},
+        }
+        if self.breaker is not None:
+            snapshot["circuit"] = self.breaker.snapshot()
+        if self.limiter is not None:
+            snapshot["concurrency"] = self.limiter.snapshot()
+        return snapshot
+
+    async def aclose(self):
+        await self.client.aclose()
+
+def create_upstream(
+    name: str,
+    base_url: str,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    connect_timeout: float,
+    read_timeout: float,
+    write_timeout: float,
+    pool_timeout: float,
+    http2: bool = False,
+    breaker: Optional[CircuitBreaker] = None,
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    probe_timeout: float = 1.0,
+    strategy: str = "p2c"
+) -> Upstream:
+    stats = PoolStats(max_connections)
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    client = httpx.AsyncClient(
+        transport=InstrumentedTransport(transport, stats),
+        timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout),
+    )
+    logger.info(f"Upstream '{name}' configured: replicas={base_url}, strategy={strategy}, max_connections={max_connections}, "
+                f"max_keepalive={max_keepalive_connections}, keepalive_expiry={keepalive_expiry}s, http2={http2}")
+    replicas = [Replica(url) for url in parse_replica_urls(base_url)]
+    return Upstream(name, replicas, client, stats, breaker=breaker, limiter=limiter, probe_timeout=probe_timeout, strategy=strategy)
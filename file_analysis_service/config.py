@@ -11,11 +11,35 @@ class Settings(BaseSettings):
     FAS_URL: Optional[HttpUrl] = None
     FSS_URL: HttpUrl
     WORDCLOUD_API_URL: HttpUrl = HttpUrl("https://quickchart.io/wordcloud")
+    WORDCLOUD_ENGINE: str = "local"
+    WORDCLOUD_FORMAT: str = "png"
+    WORDCLOUD_WIDTH: int = 500
+    WORDCLOUD_HEIGHT: int = 500
+    WORDCLOUD_MAX_WORDS: int = 200
+    WORDCLOUD_FONT_PATH: Optional[str] = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+    WORDCLOUD_RENDER_WORKERS: int = 2
+    WORDCLOUD_RENDER_QUEUE_SIZE: int = 8
+    WORDCLOUD_RENDER_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    ANALYSIS_TOP_TERMS: int = 20
+    ANALYSIS_MIN_TERM_LENGTH: int = 2
+    ANALYSIS_STOP_WORDS: str = "ru,en"
+    ANALYSIS_EXTRA_STOP_WORDS: str = ""
     MAX_FILE_SIZE_MB: int = 10
     STORAGE_BASE_PATH_FAS: str = "wordclouds_fas"
-    CELERY_BROKER_URL: str = "redis://localhost:6379/0"
-    CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
     LOG_LEVEL: str = "INFO"
+    ANALYSIS_WAIT_MAX_SECONDS: float = 30.0
+    ANALYSIS_WAIT_MIN_POLL_SECONDS: float = 0.1
+    ANALYSIS_WAIT_MAX_POLL_SECONDS: float = 2.0
+    ANALYSIS_STATUS_BATCH_MAX_IDS: int = 1000
+    ANALYSIS_BATCH_MAX_ITEMS: int = 1000
+    ANALYSIS_EXECUTOR: str = "background"
+    ANALYSIS_WORKER_CONCURRENCY: int = 4
+    ANALYSIS_JOB_LEASE_SECONDS: float = 60.0
+    ANALYSIS_JOB_HEARTBEAT_SECONDS: float = 15.0
+    ANALYSIS_JOB_POLL_SECONDS: float = 1.0
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = 3
+    ANALYSIS_JOB_RETRY_BASE_SECONDS: float = 5.0
+    ANALYSIS_JOB_RETRY_MAX_SECONDS: float = 300.0
 
     model_config = SettingsConfigDict(
         env_file=".env", 
@@ -1,21 +1,82 @@
 import uuid
+from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 
+from sqlalchemy import and_, delete, func, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 import models, schemas
+from status_events import analysis_status_notifier
 
-async def create_analysis_request(db: AsyncSession, analysis_request: schemas.FileAnalysisRequest) -> models.FileAnalysisResult:
+def build_analysis_job(analysis_id: uuid.UUID, analysis_request: schemas.FileAnalysisRequest) -> models.AnalysisJob:
+    return models.AnalysisJob(analysis_id=analysis_id, payload=analysis_request.model_dump(mode="json"))
+
+def build_analysis(analysis_request: schemas.FileAnalysisRequest, cached: Optional[models.FileAnalysisResult] = None) -> models.FileAnalysisResult:
     db_analysis = models.FileAnalysisResult(
+        id=uuid.uuid4(),
         original_file_id=analysis_request.file_id,
+        file_hash=analysis_request.file_hash,
         analysis_status="PENDING"
     )
+    if cached is not None:
+        db_analysis.analysis_status = "COMPLETED"
+        db_analysis.word_cloud_image_location = cached.word_cloud_image_location
+        db_analysis.other_analysis_data = cached.other_analysis_data
+        db_analysis.reused_from_id = cached.reused_from_id or cached.id
+    return db_analysis
+
+async def create_analysis_request(
+    db: AsyncSession,
+    analysis_request: schemas.FileAnalysisRequest,
+    enqueue: bool = False,
+    cached: Optional[models.FileAnalysisResult] = None
+) -> models.FileAnalysisResult:
+    db_analysis = build_analysis(analysis_request, cached)
     db.add(db_analysis)
+    if enqueue and cached is None:
+        db.add(build_analysis_job(db_analysis.id, analysis_request))
     await db.commit()
     await db.refresh(db_analysis)
+    analysis_status_notifier.notify(db_analysis.original_file_id)
     return db_analysis
 
+async def create_analysis_requests_bulk(
+    db: AsyncSession,
+    analysis_requests: List[schemas.FileAnalysisRequest],
+    enqueue: bool = False,
+    cached_by_hash: Optional[Dict[str, models.FileAnalysisResult]] = None
+) -> List[models.FileAnalysisResult]:
+    if not analysis_requests:
+        return []
+    cached_by_hash = cached_by_hash or {}
+    cached = [cached_by_hash.get(analysis_request.file_hash) for analysis_request in analysis_requests]
+    db_analyses = [build_analysis(analysis_request, hit) for analysis_request, hit in zip(analysis_requests, cached)]
+    ids = [db_analysis.id for db_analysis in db_analyses]
+    db.add_all(db_analyses)
+    if enqueue:
+        db.add_all([
+            build_analysis_job(db_analysis.id, analysis_request)
+            for db_analysis, analysis_request, hit in zip(db_analyses, analysis_requests, cached)
+            if hit is None
+        ])
+    await db.commit()
+    result = await db.execute(select(models.FileAnalysisResult).filter(models.FileAnalysisResult.id.in_(ids)))
+    by_id = {db_analysis.id: db_analysis for db_analysis in result.scalars().all()}
+    for db_analysis in by_id.values():
+        analysis_status_notifier.notify(db_analysis.original_file_id)
+    return [by_id[analysis_id] for analysis_id in ids]
+
+async def get_completed_analyses_by_hashes(db: AsyncSession, file_hashes: List[str]) -> Dict[str, models.FileAnalysisResult]:
+    if not file_hashes:
+        return {}
+    result = await db.execute(
+        select(models.FileAnalysisResult)
+        .filter(models.FileAnalysisResult.file_hash.in_(file_hashes), models.FileAnalysisResult.analysis_status == "COMPLETED")
+        .order_by(models.FileAnalysisResult.updated_at)
+    )
+    return {db_analysis.file_hash: db_analysis for db_analysis in result.scalars().all()}
+
 async def get_analysis_result(db: AsyncSession, analysis_id: uuid.UUID) -> Optional[models.FileAnalysisResult]:
     result = await db.execute(select(models.FileAnalysisResult).filter(models.FileAnalysisResult.id == analysis_id))
     return result.scalars().first()
@@ -24,6 +85,12 @@ async def get_analysis_results_by_original_id(db: AsyncSession, original_file_id
     result = await db.execute(select(models.FileAnalysisResult).filter(models.FileAnalysisResult.original_file_id == original_file_id))
     return result.scalars().all()
 
+async def get_analysis_results_by_original_ids(db: AsyncSession, original_file_ids: List[uuid.UUID]) -> List[models.FileAnalysisResult]:
+    if not original_file_ids:
+        return []
+    result = await db.execute(select(models.FileAnalysisResult).filter(models.FileAnalysisResult.original_file_id.in_(original_file_ids)))
+    return result.scalars().all()
+
 async def update_analysis_status_and_data(
     db: AsyncSession, 
     db_obj: Optional[models.FileAnalysisResult],
@@ -46,4 +113,86 @@ async def update_analysis_status_and_data(
 
     await db.commit()
     await db.refresh(db_obj)
-    return db_obj 
\ No newline at end of file
+    analysis_status_notifier.notify(db_obj.original_file_id)
+    return db_obj
+
+def _claimable_job_filter(now: datetime):
+    return or_(
+        and_(models.AnalysisJob.locked_by.is_(None), models.AnalysisJob.available_at <= now),
+        models.AnalysisJob.lease_expires_at < now,
+    )
+
+async def claim_analysis_jobs(db: AsyncSession, worker_id: str, limit: int, lease_seconds: float) -> List[schemas.AnalysisJobClaim]:
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(models.AnalysisJob)
+        .filter(_claimable_job_filter(now))
+        .order_by(models.AnalysisJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    jobs = result.scalars().all()
+    for job in jobs:
+        job.locked_by = worker_id
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        job.attempts += 1
+    claims = [schemas.AnalysisJobClaim.model_validate(job) for job in jobs]
+    await db.commit()
+    return claims
+
+async def extend_analysis_job_leases(db: AsyncSession, worker_id: str, job_ids: List[int], lease_seconds: float) -> int:
+    if not job_ids:
+        return 0
+    result = await db.execute(
+        update(models.AnalysisJob)
+        .where(models.AnalysisJob.id.in_(job_ids), models.AnalysisJob.locked_by == worker_id)
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    await db.commit()
+    return result.rowcount
+
+async def get_leased_analysis_job_ids(db: AsyncSession, worker_id: str, job_ids: List[int]) -> List[int]:
+    if not job_ids:
+        return []
+    result = await db.execute(
+        select(models.AnalysisJob.id).filter(models.AnalysisJob.id.in_(job_ids), models.AnalysisJob.locked_by == worker_id)
+    )
+    return result.scalars().all()
+
+async def complete_analysis_job(db: AsyncSession, worker_id: str, job_id: int):
+    await db.execute(delete(models.AnalysisJob).where(models.AnalysisJob.id == job_id, models.AnalysisJob.locked_by == worker_id))
+    await db.commit()
+
+async def release_analysis_job(db: AsyncSession, worker_id: str, job_id: int, error: str, retry_delay: float):
+    await db.execute(
+        update(models.AnalysisJob)
+        .where(models.AnalysisJob.id == job_id, models.AnalysisJob.locked_by == worker_id)
+        .values(
+            locked_by=None,
+            lease_expires_at=None,
+            last_error=error[:1000],
+            available_at=datetime.utcnow() + timedelta(seconds=retry_delay),
+        )
+    )
+    await db.commit()
+
+async def get_analysis_queue_stats(db: AsyncSession) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    queued_count, oldest_queued = (await db.execute(
+        select(func.count(models.AnalysisJob.id), func.min(models.AnalysisJob.enqueued_at))
+        .filter(models.AnalysisJob.locked_by.is_(None))
+    )).one()
+    running = (await db.execute(
+        select(func.count(models.AnalysisJob.id))
+        .filter(models.AnalysisJob.locked_by.is_not(None), models.AnalysisJob.lease_expires_at >= now)
+    )).scalar_one()
+    expired = (await db.execute(
+        select(func.count(models.AnalysisJob.id))
+        .filter(models.AnalysisJob.locked_by.is_not(None), models.AnalysisJob.lease_expires_at < now)
+    )).scalar_one()
+    return {
+        "queued": queued_count,
+        "running": running,
+        "expired_leases": expired,
+        "oldest_queued_age_seconds": round((now - oldest_queued).total_seconds(), 3) if oldest_queued else None,
+    }
@@ -1,7 +1,12 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from config import Settings
+from logging_config import get_logger
+from models import Base
+
+logger = get_logger(__name__)
 
 settings = Settings()
 
@@ -12,4 +17,23 @@ AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=F
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session 
\ No newline at end of file
+        yield session 
+
+def add_missing_nullable_columns(sync_conn):
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        added = set()
+        for column in table.columns:
+            if column.name not in existing_columns and column.nullable:
+                logger.info(f"Adding missing column {table.name}.{column.name}")
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"))
+                added.add(column.name)
+        for index in table.indexes:
+            if added & {column.name for column in index.columns}:
+                index.create(sync_conn, checkfirst=True)
+
+async def create_db_and_tables(db_engine: AsyncEngine = engine):
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_nullable_columns)
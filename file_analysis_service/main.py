@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Depends
 from fastapi.responses import FileResponse
 from pathlib import Path
@@ -5,16 +6,28 @@ import logging
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import crud
 from config import settings 
-from database import get_db
+from database import create_db_and_tables, get_db
 from logging_config import get_logger
 from routers import analysis as analysis_router 
+from wordcloud_renderer import is_supported, wordcloud_renderer
 
 logger = get_logger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_db_and_tables()
+    logger.info(f"File Analysis Service started, analyses run via '{settings.ANALYSIS_EXECUTOR}' executor")
+    if settings.WORDCLOUD_ENGINE == "local" and not is_supported(settings.WORDCLOUD_FORMAT):
+        logger.warning(f"Local word cloud format '{settings.WORDCLOUD_FORMAT}' is not available, renders will fail")
+    yield
+    await wordcloud_renderer.aclose()
+
 app = FastAPI(
     title="File Analysis Service",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 @app.get("/ping", tags=["Health"])
@@ -22,6 +35,10 @@ async def ping():
     logger.debug("Ping endpoint was called")
     return {"message": "File Analysis Service is alive!"}
 
+@app.get("/metrics", tags=["Health"])
+async def metrics(db: AsyncSession = Depends(get_db)):
+    return {"analysis_queue": await crud.get_analysis_queue_stats(db), "wordcloud_renderer": wordcloud_renderer.snapshot()}
+
 @app.get("/", tags=["Root"])
 async def read_root():
     logger.info("Root endpoint was called")
@@ -0,0 +1,7 @@
+from typing import Iterable, Optional
+
+def percentile(values: Iterable[float], percent: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))], 4)
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, String, DateTime, func, JSON
+from sqlalchemy import Column, String, Integer, DateTime, func, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 
@@ -12,6 +12,8 @@ class FileAnalysisResult(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     original_file_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    file_hash = Column(String(64), nullable=True, index=True)
+    reused_from_id = Column(UUID(as_uuid=True), nullable=True)
     
     analysis_status = Column(String, nullable=False, default="PENDING")
     
@@ -25,4 +27,20 @@ class FileAnalysisResult(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     def __repr__(self):
-        return f"<FileAnalysisResult(id={self.id}, file_id={self.original_file_id}, status='{self.analysis_status}')>"
\ No newline at end of file
+        return f"<FileAnalysisResult(id={self.id}, file_id={self.original_file_id}, status='{self.analysis_status}')>"
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    analysis_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    last_error = Column(String, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    enqueued_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<AnalysisJob(id={self.id}, analysis_id={self.analysis_id}, attempts={self.attempts}, locked_by={self.locked_by})>"
@@ -1,9 +1,10 @@
+import asyncio
 import uuid
 from typing import Optional, List
 from pathlib import Path
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import FileResponse
 import aiofiles
@@ -12,6 +13,10 @@ import crud, models, schemas
 from database import get_db
 from config import Settings
 from logging_config import get_logger
+from status_events import analysis_status_notifier
+from term_frequencies import TermCounter, build_stop_words
+from text_stats import stream_text_stats
+from wordcloud_renderer import RenderError, render_options, wordcloud_renderer
 
 logger = get_logger(__name__)
 
@@ -21,6 +26,11 @@ router = APIRouter(
 
 WORDCLOUDS_STORAGE_DIR = Path("wordclouds_fas")
 
+def is_transient_error(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
 async def perform_file_analysis(
     db: AsyncSession,
     analysis_id: uuid.UUID,
@@ -28,21 +38,39 @@ async def perform_file_analysis(
     file_location: str,
     original_filename: str,
     mime_type: str,
-    settings: Settings
+    settings: Settings,
+    file_hash: Optional[str] = None,
+    retry_transient: bool = False
 ):
     logger.info(f"Starting analysis for analysis_id: {analysis_id}, original_file_id: {file_id}, file_location: {file_location}")
     await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
                                                schemas.FileAnalysisResultUpdate(analysis_status="PROCESSING"))
 
     try:
-        file_content_text = ""
+        if file_hash:
+            cached = (await crud.get_completed_analyses_by_hashes(db, [file_hash])).get(file_hash)
+            if cached is not None:
+                logger.info(f"[{analysis_id}] Reusing completed analysis {cached.id} with the same content hash {file_hash}")
+                await crud.update_analysis_status_and_data(
+                    db, await crud.get_analysis_result(db, analysis_id),
+                    schemas.FileAnalysisResultUpdate(
+                        analysis_status="COMPLETED",
+                        word_cloud_image_location=cached.word_cloud_image_location,
+                        other_analysis_data=cached.other_analysis_data,
+                        reused_from_id=cached.reused_from_id or cached.id
+                    )
+                )
+                return
+
+        text_chunks = [] if settings.WORDCLOUD_ENGINE == "remote" else None
+        terms = TermCounter(build_stop_words(settings.ANALYSIS_STOP_WORDS, settings.ANALYSIS_EXTRA_STOP_WORDS), settings.ANALYSIS_MIN_TERM_LENGTH)
         if "text" in mime_type.lower():
-            logger.info(f"[{analysis_id}] Downloading file content from FSS at: {file_location}")
+            logger.info(f"[{analysis_id}] Streaming file content from FSS at: {file_location}")
             async with httpx.AsyncClient() as client:
-                response = await client.get(str(file_location))
-                response.raise_for_status()
-                file_content_text = response.text
-            logger.info(f"[{analysis_id}] Successfully downloaded file content. Length: {len(file_content_text)}")
+                async with client.stream("GET", str(file_location)) as response:
+                    response.raise_for_status()
+                    stats = await stream_text_stats(response.aiter_bytes(), response.charset_encoding, sink=text_chunks, terms=terms)
+            logger.info(f"[{analysis_id}] Successfully streamed file content. Size: {stats.bytes} bytes")
         else:
             error_msg = f"File type '{mime_type}' not supported for word cloud analysis."
             logger.warning(f"[{analysis_id}] {error_msg}")
@@ -50,29 +78,44 @@ async def perform_file_analysis(
                                                        schemas.FileAnalysisResultUpdate(analysis_status="FAILED", error_message=error_msg))
             return
 
-        paragraphs = len([p for p in file_content_text.split('\n\n') if p.strip()])
-        words = len(file_content_text.split())
-        characters = len(file_content_text)
-        other_data = {"paragraphs": paragraphs, "words": words, "characters": characters}
-        logger.info(f"[{analysis_id}] Text statistics: {other_data}")
+        other_data = {**stats.as_dict(), **terms.summary(settings.ANALYSIS_TOP_TERMS)}
+        logger.info(f"[{analysis_id}] Text statistics: {stats.as_dict()}, {other_data['unique_terms']} unique term(s)")
 
-        logger.info(f"[{analysis_id}] Requesting word cloud from: {settings.WORDCLOUD_API_URL}")
-        word_cloud_params = {"text": file_content_text, "format": "png", "width": 500, "height": 500}
+        image_format = settings.WORDCLOUD_FORMAT
         word_cloud_image_bytes = None
-        async with httpx.AsyncClient() as client:
+        if settings.WORDCLOUD_ENGINE == "remote":
+            logger.info(f"[{analysis_id}] Requesting word cloud from: {settings.WORDCLOUD_API_URL}")
+            word_cloud_params = {"text": "".join(text_chunks), "format": image_format, "width": settings.WORDCLOUD_WIDTH, "height": settings.WORDCLOUD_HEIGHT}
+            async with httpx.AsyncClient() as client:
+                try:
+                    wc_response = await client.post(str(settings.WORDCLOUD_API_URL), json=word_cloud_params)
+                    wc_response.raise_for_status()
+                    word_cloud_image_bytes = wc_response.content
+                    logger.info(f"[{analysis_id}] Successfully received word cloud image. Size: {len(word_cloud_image_bytes)} bytes")
+                except httpx.HTTPStatusError as e:
+                    if retry_transient and is_transient_error(e):
+                        raise
+                    error_msg = f"Word Cloud API request failed: {e.response.status_code} - {e.response.text}"
+                    logger.error(f"[{analysis_id}] {error_msg}")
+                    await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
+                                                               schemas.FileAnalysisResultUpdate(analysis_status="FAILED", error_message=error_msg, other_analysis_data=other_data))
+                    return
+                except httpx.RequestError as e:
+                    if retry_transient and is_transient_error(e):
+                        raise
+                    error_msg = f"Word Cloud API request failed: {str(e)}"
+                    logger.error(f"[{analysis_id}] {error_msg}")
+                    await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
+                                                               schemas.FileAnalysisResultUpdate(analysis_status="FAILED", error_message=error_msg, other_analysis_data=other_data))
+                    return
+        else:
+            logger.info(f"[{analysis_id}] Rendering {image_format} word cloud locally ({settings.WORDCLOUD_WIDTH}x{settings.WORDCLOUD_HEIGHT})")
             try:
-                wc_response = await client.post(str(settings.WORDCLOUD_API_URL), json=word_cloud_params)
-                wc_response.raise_for_status()
-                word_cloud_image_bytes = wc_response.content
-                logger.info(f"[{analysis_id}] Successfully received word cloud image. Size: {len(word_cloud_image_bytes)} bytes")
-            except httpx.HTTPStatusError as e:
-                error_msg = f"Word Cloud API request failed: {e.response.status_code} - {e.response.text}"
-                logger.error(f"[{analysis_id}] {error_msg}")
-                await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
-                                                           schemas.FileAnalysisResultUpdate(analysis_status="FAILED", error_message=error_msg, other_analysis_data=other_data))
-                return
-            except httpx.RequestError as e:
-                error_msg = f"Word Cloud API request failed: {str(e)}"
+                frequencies = terms.top_terms(settings.WORDCLOUD_MAX_WORDS)
+                word_cloud_image_bytes = await wordcloud_renderer.render_frequencies(frequencies, render_options(settings))
+                logger.info(f"[{analysis_id}] Rendered word cloud image. Size: {len(word_cloud_image_bytes)} bytes")
+            except RenderError as e:
+                error_msg = f"Word cloud rendering failed: {str(e)}"
                 logger.error(f"[{analysis_id}] {error_msg}")
                 await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
                                                            schemas.FileAnalysisResultUpdate(analysis_status="FAILED", error_message=error_msg, other_analysis_data=other_data))
@@ -83,7 +126,7 @@ async def perform_file_analysis(
             logger.info(f"Creating word cloud storage directory at {wordclouds_storage_dir}")
             wordclouds_storage_dir.mkdir(parents=True, exist_ok=True)
         
-        image_filename = f"{analysis_id}_{original_filename.split('.')[0]}_wordcloud.png"
+        image_filename = f"{analysis_id}_{original_filename.split('.')[0]}_wordcloud.{image_format}"
         image_path = wordclouds_storage_dir / image_filename
         
         logger.info(f"[{analysis_id}] Saving word cloud image to: {image_path}")
@@ -103,6 +146,11 @@ async def perform_file_analysis(
         logger.info(f"Analysis COMPLETED for analysis_id: {analysis_id}, original_file_id: {file_id}")
 
     except Exception as e:
+        if retry_transient and is_transient_error(e):
+            logger.warning(f"[{analysis_id}] Transient error during file analysis, leaving it for retry: {str(e)}")
+            await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id),
+                                                       schemas.FileAnalysisResultUpdate(analysis_status="PENDING", error_message=str(e)))
+            raise
         logger.exception(f"Critical error during file analysis for analysis_id: {analysis_id}, original_file_id: {file_id}")
         current_other_data = locals().get("other_data")
         await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id), 
@@ -135,18 +183,104 @@ async def initiate_analysis(
                 raise HTTPException(status_code=409, detail=f"Analysis for file {analysis_request_schema.file_id} is already in progress with status: {existing_analysis.analysis_status}")
         logger.info(f"All existing analyses for {analysis_request_schema.file_id} were FAILED or other. Allowing re-trigger.")
 
-    new_analysis_db = await crud.create_analysis_request(db, analysis_request=analysis_request_schema)
-    logger.info(f"Created new PENDING analysis record {new_analysis_db.id} for original_file_id: {analysis_request_schema.file_id}")
+    cached = None
+    if analysis_request_schema.file_hash:
+        cached = (await crud.get_completed_analyses_by_hashes(db, [analysis_request_schema.file_hash])).get(analysis_request_schema.file_hash)
+
+    use_queue = settings.ANALYSIS_EXECUTOR == "queue"
+    new_analysis_db = await crud.create_analysis_request(db, analysis_request=analysis_request_schema, enqueue=use_queue, cached=cached)
 
-    background_tasks.add_task(
-        perform_file_analysis, db, new_analysis_db.id,
-        analysis_request_schema.file_id, analysis_request_schema.file_location,
-        analysis_request_schema.original_filename, analysis_request_schema.mime_type, settings
-    )
-    logger.info(f"Background task added for analysis_id: {new_analysis_db.id}")
+    if cached is not None:
+        logger.info(f"Reused completed analysis {new_analysis_db.reused_from_id} for original_file_id: {analysis_request_schema.file_id} by content hash, created {new_analysis_db.id}")
+    elif use_queue:
+        logger.info(f"Created new PENDING analysis record {new_analysis_db.id} and queued its job for original_file_id: {analysis_request_schema.file_id}")
+    else:
+        background_tasks.add_task(
+            perform_file_analysis, db, new_analysis_db.id,
+            analysis_request_schema.file_id, analysis_request_schema.file_location,
+            analysis_request_schema.original_filename, analysis_request_schema.mime_type, settings,
+            file_hash=analysis_request_schema.file_hash
+        )
+        logger.info(f"Background task added for analysis_id: {new_analysis_db.id}")
     
     return schemas.FileAnalysisResultPublic.model_validate(new_analysis_db, context={"request": request})
 
+REUSABLE_STATUS_PRIORITY = {"COMPLETED": 2, "PROCESSING": 1, "PENDING": 1}
+
+@router.post("/batch", response_model=List[schemas.FileAnalysisResultPublic], status_code=202)
+async def initiate_analysis_batch(
+    analysis_requests: List[schemas.FileAnalysisRequest],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings_dependency)
+):
+    requests_by_file = {analysis_request.file_id: analysis_request for analysis_request in analysis_requests}
+    if len(requests_by_file) > settings.ANALYSIS_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many files in batch: {len(requests_by_file)} > {settings.ANALYSIS_BATCH_MAX_ITEMS}")
+    logger.info(f"Batch analysis trigger received for {len(requests_by_file)} file(s)")
+
+    reusable_by_file = {}
+    for existing_analysis in await crud.get_analysis_results_by_original_ids(db, list(requests_by_file)):
+        priority = REUSABLE_STATUS_PRIORITY.get(existing_analysis.analysis_status)
+        current = reusable_by_file.get(existing_analysis.original_file_id)
+        if priority is not None and (current is None or priority > REUSABLE_STATUS_PRIORITY[current.analysis_status]):
+            reusable_by_file[existing_analysis.original_file_id] = existing_analysis
+    reusable = {
+        file_id: schemas.FileAnalysisResultPublic.model_validate(existing_analysis, context={"request": request})
+        for file_id, existing_analysis in reusable_by_file.items()
+    }
+
+    to_create = [analysis_request for file_id, analysis_request in requests_by_file.items() if file_id not in reusable]
+    cached_by_hash = await crud.get_completed_analyses_by_hashes(
+        db, list({analysis_request.file_hash for analysis_request in to_create if analysis_request.file_hash}))
+    use_queue = settings.ANALYSIS_EXECUTOR == "queue"
+    created = await crud.create_analysis_requests_bulk(db, to_create, enqueue=use_queue, cached_by_hash=cached_by_hash)
+    cache_hits = sum(1 for analysis_request in to_create if analysis_request.file_hash in cached_by_hash)
+    logger.info(f"Batch analysis: created {len(created)} record(s) ({cache_hits} from content-hash cache), reused {len(reusable)} existing")
+
+    results = dict(reusable)
+    for analysis_request, new_analysis_db in zip(to_create, created):
+        if not use_queue and analysis_request.file_hash not in cached_by_hash:
+            background_tasks.add_task(
+                perform_file_analysis, db, new_analysis_db.id,
+                analysis_request.file_id, analysis_request.file_location,
+                analysis_request.original_filename, analysis_request.mime_type, settings,
+                file_hash=analysis_request.file_hash
+            )
+        results[analysis_request.file_id] = schemas.FileAnalysisResultPublic.model_validate(new_analysis_db, context={"request": request})
+    return [results[file_id] for file_id in requests_by_file]
+
+@router.post("/files/status", response_model=schemas.FileAnalysisStatusBatchResponse)
+async def get_analysis_statuses_for_files(
+    batch_request: schemas.FileAnalysisStatusBatchRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings_dependency)
+):
+    requested_ids = list(dict.fromkeys(batch_request.file_ids))
+    if len(requested_ids) > settings.ANALYSIS_STATUS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Too many file ids: {len(requested_ids)} > {settings.ANALYSIS_STATUS_BATCH_MAX_IDS}")
+    logger.info(f"Batch status request for {len(requested_ids)} original_file_id(s)")
+
+    parsed_ids = {}
+    errors = {}
+    for raw_id in requested_ids:
+        try:
+            parsed_ids[raw_id] = uuid.UUID(raw_id)
+        except ValueError:
+            errors[raw_id] = schemas.FileAnalysisStatusError(status_code=422, detail="Invalid file id")
+
+    db_analyses = await crud.get_analysis_results_by_original_ids(db, list(set(parsed_ids.values())))
+    analyses_by_file = {}
+    for db_analysis in db_analyses:
+        analyses_by_file.setdefault(db_analysis.original_file_id, []).append(
+            schemas.FileAnalysisResultPublic.model_validate(db_analysis, context={"request": request}))
+
+    results = {raw_id: analyses_by_file.get(file_id, []) for raw_id, file_id in parsed_ids.items()}
+    logger.debug(f"Batch status: {len(db_analyses)} analysis(es) across {len(results)} file(s), {len(errors)} invalid id(s)")
+    return schemas.FileAnalysisStatusBatchResponse(results=results, errors=errors)
+
 @router.get("/{analysis_id}", response_model=schemas.FileAnalysisResultPublic)
 async def get_single_analysis_status(
     analysis_id: uuid.UUID,
@@ -172,6 +306,38 @@ async def get_all_analysis_statuses_for_file(
     logger.debug(f"Returning {len(db_analyses)} status(es) for original_file_id: {original_file_id}")
     return [schemas.FileAnalysisResultPublic.model_validate(db_analysis, context={"request": request}) for db_analysis in db_analyses]
 
+TERMINAL_ANALYSIS_STATUSES = ("COMPLETED", "FAILED")
+
+def latest_analysis(db_analyses: List[models.FileAnalysisResult]) -> Optional[models.FileAnalysisResult]:
+    return max(db_analyses, key=lambda db_analysis: db_analysis.created_at, default=None)
+
+@router.get("/file/{original_file_id}/wait", response_model=List[schemas.FileAnalysisResultPublic])
+async def wait_for_analysis_of_file(
+    original_file_id: uuid.UUID,
+    request: Request,
+    timeout: float = Query(10.0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings_dependency)
+):
+    timeout = min(timeout, settings.ANALYSIS_WAIT_MAX_SECONDS)
+    logger.info(f"Long-poll request for original_file_id: {original_file_id} (timeout={timeout}s)")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    poll_interval = settings.ANALYSIS_WAIT_MIN_POLL_SECONDS
+    while True:
+        db_analyses = await crud.get_analysis_results_by_original_id(db, original_file_id)
+        latest = latest_analysis(db_analyses)
+        if latest is not None and latest.analysis_status in TERMINAL_ANALYSIS_STATUSES:
+            break
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            logger.debug(f"Long-poll for {original_file_id} timed out with {len(db_analyses)} non-terminal analysis(es)")
+            break
+        await db.rollback()
+        await analysis_status_notifier.wait(original_file_id, min(remaining, poll_interval))
+        poll_interval = min(poll_interval * 2, settings.ANALYSIS_WAIT_MAX_POLL_SECONDS)
+    return [schemas.FileAnalysisResultPublic.model_validate(db_analysis, context={"request": request}) for db_analysis in db_analyses]
+
 @router.get("/wordclouds/{analysis_id}/{filename}", tags=["analysis_results"])
 async def download_word_cloud_image(
     analysis_id: uuid.UUID,
@@ -181,10 +347,6 @@ async def download_word_cloud_image(
 ):
     logger.info(f"Word cloud image request: analysis_id={analysis_id}, filename={filename}")
     
-    if not filename.startswith(str(analysis_id)):
-        logger.warning(f"Requested filename {filename} does not match analysis_id {analysis_id}")
-        raise HTTPException(status_code=400, detail="Requested filename does not match analysis ID.")
-
     if ".." in filename or filename.count("/") > 0:
         logger.warning(f"Invalid path characters in filename: {filename}")
         raise HTTPException(status_code=400, detail="Invalid filename or path.")
@@ -199,6 +361,9 @@ async def download_word_cloud_image(
         raise HTTPException(status_code=404, detail="Analysis result not found or image not available.")
 
     if Path(analysis_record.word_cloud_image_location).name != filename:
+        if not filename.startswith(str(analysis_id)):
+            logger.warning(f"Requested filename {filename} does not match analysis_id {analysis_id}")
+            raise HTTPException(status_code=400, detail="Requested filename does not match analysis ID.")
         logger.warning(f"Requested filename '{filename}' does not match stored filename '{analysis_record.word_cloud_image_location}' for analysis {analysis_id}.")
         raise HTTPException(status_code=400, detail="Requested filename does not match stored filename.")
 
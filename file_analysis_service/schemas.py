@@ -16,6 +16,7 @@ class FileAnalysisRequest(BaseModel):
     file_location: HttpUrl
     original_filename: str
     mime_type: str
+    file_hash: Optional[str] = Field(None, pattern=r"^[0-9a-f]{64}$")
 
 class FileAnalysisResultCreate(FileAnalysisBaseFields):
     word_cloud_image_location: Optional[str] = None
@@ -26,6 +27,7 @@ class FileAnalysisResultUpdate(BaseModel):
     word_cloud_image_location: Optional[str] = None
     other_analysis_data: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
+    reused_from_id: Optional[uuid.UUID] = None
 
 class FileAnalysisResultInDB(FileAnalysisResultCreate):
     id: uuid.UUID
@@ -74,4 +76,24 @@ class FileAnalysisResultPublic(FileAnalysisBaseFields):
 
         return self
 
-    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class FileAnalysisStatusBatchRequest(BaseModel):
+    file_ids: List[str] = Field(..., min_length=1)
+
+class FileAnalysisStatusError(BaseModel):
+    status_code: int
+    detail: str
+
+class FileAnalysisStatusBatchResponse(BaseModel):
+    results: Dict[str, List[FileAnalysisResultPublic]]
+    errors: Dict[str, FileAnalysisStatusError]
+
+class AnalysisJobClaim(BaseModel):
+    id: int
+    analysis_id: uuid.UUID
+    payload: Dict[str, Any]
+    attempts: int
+    enqueued_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,33 @@
+import asyncio
+import uuid
+from typing import Dict
+
+class AnalysisStatusNotifier:
+    def __init__(self):
+        self._events: Dict[uuid.UUID, asyncio.Event] = {}
+        self._waiters: Dict[uuid.UUID, int] = {}
+
+    async def wait(self, original_file_id: uuid.UUID, timeout: float) -> bool:
+        event = self._events.get(original_file_id)
+        if event is None:
+            event = asyncio.Event()
+            self._events[original_file_id] = event
+        self._waiters[original_file_id] = self._waiters.get(original_file_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters[original_file_id] -= 1
+            if self._waiters[original_file_id] == 0:
+                del self._waiters[original_file_id]
+                if self._events.get(original_file_id) is event:
+                    del self._events[original_file_id]
+
+    def notify(self, original_file_id: uuid.UUID):
+        event = self._events.pop(original_file_id, None)
+        if event is not None:
+            event.set()
+
+analysis_status_notifier = AnalysisStatusNotifier()
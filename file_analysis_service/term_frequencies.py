@@ -0,0 +1,78 @@
+import re
+from collections import Counter
+from typing import FrozenSet, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+MAX_CARRY_CHARS = 1 << 16
+
+STOP_WORDS = {
+    "ru": frozenset("""
+        а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до его ее ей ему если
+        есть еще же за здесь и из или им их к как какой когда кто ли либо между меня мне много может мы на над надо наш не
+        него нее нет ни них но ну о об однако он она они оно от очень по под при про с сам свой себя со так также такой там
+        те тем то того тоже той только том ты у уже хотя чего чей чем что чтобы эта эти это этого этой этом этот я
+        бы будет будут вдруг ведь всегда впрочем всю где-то раз теперь тогда тут чуть этих ими ею нам нами сейчас ж
+    """.split()),
+    "en": frozenset("""
+        a about above after again against all am an and any are as at be because been before being below between both but
+        by can could did do does doing down during each few for from further had has have having he her here hers herself
+        him himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or
+        other our ours ourselves out over own same she should so some such than that the their theirs them themselves then
+        there these they this those through to too under until up very was we were what when where which while who whom
+        why will with would you your yours yourself yourselves
+    """.split()),
+}
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+def build_stop_words(languages: str, extra: str = "") -> FrozenSet[str]:
+    words = set()
+    for language in (language.strip().lower() for language in languages.split(",")):
+        if language:
+            words |= STOP_WORDS.get(language, frozenset())
+    words |= {normalize(word.strip()) for word in extra.split(",") if word.strip()}
+    return frozenset(words)
+
+class TermCounter:
+    def __init__(self, stop_words: FrozenSet[str] = frozenset(), min_length: int = 2):
+        self.stop_words = stop_words
+        self.min_length = min_length
+        self.counts: Counter = Counter()
+        self._carry = ""
+
+    def feed(self, text: str):
+        text = self._carry + text
+        cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"), text.rfind("\r"))
+        if cut < 0 and len(text) < MAX_CARRY_CHARS:
+            self._carry = text
+            return
+        if cut < 0:
+            cut = len(text) - 1
+        self._carry = text[cut + 1:]
+        self.counts.update(TOKEN_PATTERN.findall(normalize(text[:cut + 1])))
+
+    def finish(self):
+        if self._carry:
+            self.counts.update(TOKEN_PATTERN.findall(normalize(self._carry)))
+            self._carry = ""
+
+    @property
+    def tokens(self) -> int:
+        return sum(self.counts.values())
+
+    def top_terms(self, limit: int) -> List[Tuple[str, int]]:
+        terms = Counter({
+            term: count for term, count in self.counts.items()
+            if len(term) >= self.min_length and term not in self.stop_words
+        })
+        return terms.most_common(limit)
+
+    def summary(self, top_n: int) -> dict:
+        tokens = self.tokens
+        return {
+            "tokens": tokens,
+            "unique_terms": len(self.counts),
+            "type_token_ratio": round(len(self.counts) / tokens, 4) if tokens else 0.0,
+            "top_terms": [{"term": term, "count": count} for term, count in self.top_terms(top_n)],
+        }
@@ -3,7 +3,7 @@ import uuid
 from unittest.mock import AsyncMock, patch, MagicMock
 import asyncio
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from httpx import AsyncClient
 from fastapi import FastAPI, BackgroundTasks, Request
@@ -262,4 +262,212 @@ async def test_download_word_cloud(mock_path_is_file, mock_crud_get_result, asyn
     assert response.content == b"dummy image data"
     assert response.headers["content-type"] == "image/png"
 
-    Path(full_path_on_server).unlink(missing_ok=True) 
\ No newline at end of file
+    Path(full_path_on_server).unlink(missing_ok=True) 
+def make_analysis_mock(original_file_id, status, analysis_id=None, created_at=None):
+    return MagicMock(
+        id=analysis_id or uuid.uuid4(), original_file_id=original_file_id, analysis_status=status,
+        word_cloud_image_location=None, other_analysis_data=None, error_message=None,
+        created_at=created_at or datetime.utcnow(), updated_at=datetime.utcnow(),
+        word_cloud_image_url=None, analysis_data=None
+    )
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.get_analysis_results_by_original_id", new_callable=AsyncMock)
+async def test_wait_for_analysis_returns_immediately_when_terminal(mock_crud_get_all_results, async_client_fas: AsyncClient, mock_settings):
+    original_file_id = uuid.uuid4()
+    mock_crud_get_all_results.return_value = [make_analysis_mock(original_file_id, "COMPLETED")]
+
+    response = await async_client_fas.get(f"/analysis/file/{original_file_id}/wait", params={"timeout": 5})
+    assert response.status_code == 200
+    assert [a["analysis_status"] for a in response.json()] == ["COMPLETED"]
+    assert mock_crud_get_all_results.call_count == 1
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.get_analysis_results_by_original_id", new_callable=AsyncMock)
+async def test_wait_for_analysis_times_out_with_current_state(mock_crud_get_all_results, async_client_fas: AsyncClient, mock_settings):
+    original_file_id = uuid.uuid4()
+    mock_crud_get_all_results.return_value = [make_analysis_mock(original_file_id, "PROCESSING")]
+
+    response = await async_client_fas.get(f"/analysis/file/{original_file_id}/wait", params={"timeout": 0.3})
+    assert response.status_code == 200
+    assert [a["analysis_status"] for a in response.json()] == ["PROCESSING"]
+    assert 2 <= mock_crud_get_all_results.call_count <= 5
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.get_analysis_results_by_original_id", new_callable=AsyncMock)
+async def test_wait_for_analysis_keeps_waiting_for_retry_after_failure(mock_crud_get_all_results, async_client_fas: AsyncClient, mock_settings):
+    original_file_id = uuid.uuid4()
+    failed_at = datetime.utcnow() - timedelta(minutes=5)
+    mock_crud_get_all_results.return_value = [
+        make_analysis_mock(original_file_id, "PENDING"),
+        make_analysis_mock(original_file_id, "FAILED", created_at=failed_at),
+    ]
+
+    response = await async_client_fas.get(f"/analysis/file/{original_file_id}/wait", params={"timeout": 0.3})
+    assert response.status_code == 200
+    assert [a["analysis_status"] for a in response.json()] == ["PENDING", "FAILED"]
+    assert mock_crud_get_all_results.call_count >= 2
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.get_analysis_results_by_original_id", new_callable=AsyncMock)
+async def test_wait_for_analysis_wakes_up_on_status_notification(mock_crud_get_all_results, async_client_fas: AsyncClient, mock_settings, monkeypatch):
+    from status_events import analysis_status_notifier
+
+    monkeypatch.setattr(mock_settings, "ANALYSIS_WAIT_MIN_POLL_SECONDS", 5.0)
+    original_file_id = uuid.uuid4()
+    analysis_id = uuid.uuid4()
+    mock_crud_get_all_results.side_effect = [
+        [make_analysis_mock(original_file_id, "PROCESSING", analysis_id)],
+        [make_analysis_mock(original_file_id, "COMPLETED", analysis_id)],
+    ]
+
+    async def complete_later():
+        await asyncio.sleep(0.05)
+        analysis_status_notifier.notify(original_file_id)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    notifier_task = asyncio.create_task(complete_later())
+    response = await async_client_fas.get(f"/analysis/file/{original_file_id}/wait", params={"timeout": 10})
+    await notifier_task
+
+    assert response.status_code == 200
+    assert [a["analysis_status"] for a in response.json()] == ["COMPLETED"]
+    assert loop.time() - started < 2.0
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.get_analysis_results_by_original_ids", new_callable=AsyncMock)
+async def test_get_analysis_statuses_for_files(mock_crud_get_bulk, async_client_fas: AsyncClient, mock_settings):
+    completed_file_id = uuid.uuid4()
+    unknown_file_id = uuid.uuid4()
+    mock_crud_get_bulk.return_value = [make_analysis_mock(completed_file_id, "COMPLETED")]
+
+    response = await async_client_fas.post("/analysis/files/status", json={
+        "file_ids": [str(completed_file_id), str(unknown_file_id), "not-a-uuid", str(completed_file_id)]
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [a["analysis_status"] for a in body["results"][str(completed_file_id)]] == ["COMPLETED"]
+    assert body["results"][str(unknown_file_id)] == []
+    assert body["errors"] == {"not-a-uuid": {"status_code": 422, "detail": "Invalid file id"}}
+    assert mock_crud_get_bulk.call_count == 1
+    assert sorted(mock_crud_get_bulk.call_args.args[1], key=str) == sorted([completed_file_id, unknown_file_id], key=str)
+
+@pytest.mark.asyncio
+async def test_get_analysis_statuses_for_files_rejects_oversized_batch(async_client_fas: AsyncClient, mock_settings, monkeypatch):
+    monkeypatch.setattr(mock_settings, "ANALYSIS_STATUS_BATCH_MAX_IDS", 2)
+    response = await async_client_fas.post("/analysis/files/status", json={"file_ids": [str(uuid.uuid4()) for _ in range(3)]})
+    assert response.status_code == 413
+
+@pytest.mark.asyncio
+@patch("routers.analysis.crud.create_analysis_requests_bulk", new_callable=AsyncMock)
+@patch("routers.analysis.crud.get_analysis_results_by_original_ids", new_callable=AsyncMock)
+@patch("fastapi.BackgroundTasks.add_task")
+async def test_initiate_analysis_batch_reuses_existing_and_creates_rest(
+    mock_add_task: MagicMock,
+    mock_crud_get_bulk: AsyncMock,
+    mock_crud_create_bulk: AsyncMock,
+    async_client_fas: AsyncClient,
+    mock_settings
+):
+    completed_id, failed_id, new_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    mock_crud_get_bulk.return_value = [
+        make_analysis_mock(completed_id, "COMPLETED"),
+        make_analysis_mock(failed_id, "FAILED"),
+    ]
+    mock_crud_create_bulk.side_effect = lambda db, requests, enqueue=False, cached_by_hash=None: [make_analysis_mock(r.file_id, "PENDING") for r in requests]
+
+    payload = [
+        {"file_id": str(file_id), "file_location": f"{mock_settings.FSS_URL}{file_id}/download",
+         "original_filename": f"{file_id}.txt", "mime_type": "text/plain"}
+        for file_id in (completed_id, failed_id, new_id)
+    ]
+    response = await async_client_fas.post("/analysis/batch", json=payload)
+
+    assert response.status_code == 202, response.text
+    assert [(a["original_file_id"], a["analysis_status"]) for a in response.json()] == [
+        (str(completed_id), "COMPLETED"), (str(failed_id), "PENDING"), (str(new_id), "PENDING"),
+    ]
+    created_requests = mock_crud_create_bulk.call_args.args[1]
+    assert [r.file_id for r in created_requests] == [failed_id, new_id]
+    assert mock_add_task.call_count == 2
+
+async def make_completed_analysis(db_session: AsyncSession, file_hash: str, image_name: str) -> uuid.UUID:
+    import crud, schemas
+    file_id = uuid.uuid4()
+    analysis = await crud.create_analysis_request(db_session, schemas.FileAnalysisRequest(
+        file_id=file_id, file_location=f"http://fss/{file_id}/download", original_filename="a.txt", mime_type="text/plain", file_hash=file_hash))
+    analysis_id = analysis.id
+    await crud.update_analysis_status_and_data(db_session, analysis, schemas.FileAnalysisResultUpdate(
+        analysis_status="COMPLETED", word_cloud_image_location=f"{analysis_id}_{image_name}", other_analysis_data={"words": 2}))
+    return analysis_id
+
+@pytest.mark.asyncio
+@patch("fastapi.BackgroundTasks.add_task")
+async def test_initiate_analysis_reuses_completed_result_with_same_content_hash(
+    mock_add_task: MagicMock, async_client_fas: AsyncClient, db_session: AsyncSession, mock_settings
+):
+    file_hash = "ab" * 32
+    source_id = await make_completed_analysis(db_session, file_hash, "a_wordcloud.png")
+    image_path = Path(mock_settings.STORAGE_BASE_PATH_FAS) / f"{source_id}_a_wordcloud.png"
+    image_path.write_bytes(b"shared image")
+
+    file_id = uuid.uuid4()
+    payload = {"file_id": str(file_id), "file_location": f"http://fss/{file_id}/download", "original_filename": "copy.txt",
+               "mime_type": "text/plain", "file_hash": file_hash}
+    response = await async_client_fas.post("/analysis/", json=payload)
+
+    assert response.status_code == 202, response.text
+    reused = response.json()
+    assert reused["id"] != str(source_id)
+    assert reused["analysis_status"] == "COMPLETED"
+    assert reused["analysis_data"] == {"words": 2}
+    assert reused["word_cloud_image_url"].endswith(f"/analysis/wordclouds/{reused['id']}/{source_id}_a_wordcloud.png")
+    mock_add_task.assert_not_called()
+
+    image = await async_client_fas.get(reused["word_cloud_image_url"])
+    assert image.status_code == 200
+    assert image.content == b"shared image"
+    assert list(Path(mock_settings.STORAGE_BASE_PATH_FAS).glob(f"{reused['id']}*")) == []
+    image_path.unlink()
+
+    bad_hash = await async_client_fas.post("/analysis/", json={**payload, "file_id": str(uuid.uuid4()), "file_hash": "not-a-hash"})
+    assert bad_hash.status_code == 422
+
+@pytest.mark.asyncio
+@patch("fastapi.BackgroundTasks.add_task")
+async def test_initiate_analysis_batch_runs_pipeline_only_for_hash_misses(
+    mock_add_task: MagicMock, async_client_fas: AsyncClient, db_session: AsyncSession, mock_settings
+):
+    known_hash, unknown_hash = "cd" * 32, "ef" * 32
+    await make_completed_analysis(db_session, known_hash, "known.png")
+    file_ids = [uuid.uuid4(), uuid.uuid4(), uuid.uuid4()]
+    payload = [
+        {"file_id": str(file_id), "file_location": f"http://fss/{file_id}/download", "original_filename": "x.txt",
+         "mime_type": "text/plain", "file_hash": file_hash}
+        for file_id, file_hash in zip(file_ids, (known_hash, unknown_hash, None))
+    ]
+    response = await async_client_fas.post("/analysis/batch", json=payload)
+
+    assert response.status_code == 202, response.text
+    assert [a["analysis_status"] for a in response.json()] == ["COMPLETED", "PENDING", "PENDING"]
+    assert [call.args[3] for call in mock_add_task.call_args_list] == file_ids[1:]
+    assert [call.kwargs["file_hash"] for call in mock_add_task.call_args_list] == [unknown_hash, None]
+
+@pytest.mark.asyncio
+async def test_perform_file_analysis_reuses_result_completed_while_queued(db_session: AsyncSession, mock_settings):
+    import crud, schemas
+    file_hash = "12" * 32
+    file_id = uuid.uuid4()
+    pending = await crud.create_analysis_request(db_session, schemas.FileAnalysisRequest(
+        file_id=file_id, file_location="http://unreachable.invalid/file", original_filename="b.txt", mime_type="text/plain", file_hash=file_hash))
+    pending_id = pending.id
+    source_id = await make_completed_analysis(db_session, file_hash, "b.png")
+
+    await fas_routers_analysis_module.perform_file_analysis(
+        db_session, pending_id, file_id, "http://unreachable.invalid/file", "b.txt", "text/plain", mock_settings, file_hash=file_hash)
+
+    result = await crud.get_analysis_result(db_session, pending_id)
+    assert result.analysis_status == "COMPLETED"
+    assert result.word_cloud_image_location == f"{source_id}_b.png"
+    assert result.reused_from_id == source_id
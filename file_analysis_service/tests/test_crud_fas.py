@@ -7,7 +7,9 @@ from crud import (
     create_analysis_request,
     get_analysis_result,
     update_analysis_status_and_data,
-    get_analysis_results_by_original_id
+    get_analysis_results_by_original_id,
+    get_analysis_results_by_original_ids,
+    create_analysis_requests_bulk
 )
 from schemas import FileAnalysisRequest, FileAnalysisResultUpdate
 from models import FileAnalysisResult
@@ -133,4 +135,76 @@ async def test_get_analysis_results_by_original_id(db_session: AsyncSession):
 
     non_existent_original_id = uuid.uuid4()
     results_none = await get_analysis_results_by_original_id(db_session, non_existent_original_id)
-    assert len(results_none) == 0 
\ No newline at end of file
+    assert len(results_none) == 0
+
+@pytest.mark.asyncio
+async def test_get_analysis_results_by_original_ids(db_session: AsyncSession):
+    file_ids = [uuid.uuid4() for _ in range(3)]
+    for file_id in file_ids:
+        await create_analysis_request(db_session, FileAnalysisRequest(
+            file_id=file_id,
+            file_location=f"http://mockfss/files/{file_id}",
+            original_filename="bulk.txt",
+            mime_type="text/plain"
+        ))
+
+    results = await get_analysis_results_by_original_ids(db_session, file_ids[:2] + [uuid.uuid4()])
+    assert sorted(str(r.original_file_id) for r in results) == sorted(str(f) for f in file_ids[:2])
+    assert await get_analysis_results_by_original_ids(db_session, []) == []
+
+@pytest.mark.asyncio
+async def test_create_analysis_requests_bulk(db_session: AsyncSession):
+    requests = [
+        FileAnalysisRequest(
+            file_id=uuid.uuid4(),
+            file_location=f"http://mockfss/files/bulk{i}.txt",
+            original_filename=f"bulk{i}.txt",
+            mime_type="text/plain"
+        )
+        for i in range(3)
+    ]
+
+    created = await create_analysis_requests_bulk(db_session, requests)
+    assert [c.original_file_id for c in created] == [r.file_id for r in requests]
+    assert all(c.analysis_status == "PENDING" for c in created)
+    assert len(await get_analysis_results_by_original_ids(db_session, [r.file_id for r in requests])) == 3
+    assert await create_analysis_requests_bulk(db_session, []) == []
+
+@pytest.mark.asyncio
+async def test_startup_adds_new_columns_to_existing_results_table():
+    from sqlalchemy import inspect, text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from crud import get_completed_analyses_by_hashes
+    from database import create_db_and_tables
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE file_analysis_results (id CHAR(32) PRIMARY KEY, original_file_id CHAR(32) NOT NULL, "
+            "analysis_status VARCHAR NOT NULL, word_cloud_image_location VARCHAR, other_analysis_data JSON, "
+            "error_message VARCHAR, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO file_analysis_results VALUES ('00000000000000000000000000000001', '00000000000000000000000000000002', "
+            "'COMPLETED', NULL, NULL, NULL, '2024-01-01 00:00:00', '2024-01-01 00:00:00')"
+        ))
+
+    await create_db_and_tables(engine)
+    await create_db_and_tables(engine)
+
+    async with engine.connect() as conn:
+        columns = await conn.run_sync(lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("file_analysis_results")})
+        indexes = await conn.run_sync(lambda sync_conn: {i["name"] for i in inspect(sync_conn).get_indexes("file_analysis_results")})
+    assert {"file_hash", "reused_from_id"} <= columns
+    assert "ix_file_analysis_results_file_hash" in indexes
+
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        legacy = await get_analysis_result(db, uuid.UUID(int=1))
+        assert legacy.analysis_status == "COMPLETED" and legacy.file_hash is None
+        created = await create_analysis_request(db, FileAnalysisRequest(
+            file_id=uuid.uuid4(), file_location="http://mockfss/f", original_filename="f.txt", mime_type="text/plain", file_hash="aa" * 32))
+        await update_analysis_status_and_data(db, created, FileAnalysisResultUpdate(analysis_status="COMPLETED"))
+        assert list(await get_completed_analyses_by_hashes(db, ["aa" * 32])) == ["aa" * 32]
+    await engine.dispose()
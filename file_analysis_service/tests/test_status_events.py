@@ -0,0 +1,27 @@
+import asyncio
+import uuid
+
+import pytest
+
+from status_events import AnalysisStatusNotifier
+
+@pytest.mark.asyncio
+async def test_notify_wakes_all_waiters_for_file():
+    notifier = AnalysisStatusNotifier()
+    file_id = uuid.uuid4()
+
+    waiters = [asyncio.create_task(notifier.wait(file_id, timeout=5)) for _ in range(3)]
+    await asyncio.sleep(0)
+    notifier.notify(file_id)
+
+    assert await asyncio.gather(*waiters) == [True, True, True]
+    assert notifier._events == {} and notifier._waiters == {}
+
+@pytest.mark.asyncio
+async def test_wait_times_out_without_notification():
+    notifier = AnalysisStatusNotifier()
+    file_id = uuid.uuid4()
+
+    assert await notifier.wait(file_id, timeout=0.01) is False
+    notifier.notify(uuid.uuid4())
+    assert notifier._events == {} and notifier._waiters == {}
@@ -0,0 +1,52 @@
+import random
+
+from term_frequencies import TermCounter, build_stop_words
+
+TEXT = """Ёжик в тумане. Ежик шёл по лесу, и ёжик молчал!
+The hedgehog walked in the fog; the hedgehog's friend — медвежонок — ждал 42 минуты.
+Кто-то сказал: "по-русски ёжик" and a well-known e-mail"""
+
+def count_all(text: str, stop_words=frozenset()) -> TermCounter:
+    terms = TermCounter(stop_words)
+    terms.feed(text)
+    terms.finish()
+    return terms
+
+def test_tokenizes_cyrillic_and_latin_with_inner_hyphens_and_apostrophes():
+    counts = count_all(TEXT).counts
+    assert counts["ежик"] == 4
+    assert counts["кто-то"] == 1
+    assert counts["по-русски"] == 1
+    assert counts["hedgehog's"] == 1
+    assert counts["well-known"] == 1
+    assert "42" not in counts and "—" not in counts
+
+def test_stop_words_are_removed_from_top_terms_but_not_from_ratio():
+    stop_words = build_stop_words("ru, en", extra="Лесу, туман")
+    assert {"и", "по", "the", "лесу"} <= stop_words
+    terms = count_all(TEXT, stop_words)
+    summary = terms.summary(3)
+
+    assert summary["tokens"] == sum(terms.counts.values())
+    assert summary["unique_terms"] == len(terms.counts)
+    assert summary["type_token_ratio"] == round(len(terms.counts) / summary["tokens"], 4)
+    assert summary["top_terms"][0] == {"term": "ежик", "count": 4}
+    assert len(summary["top_terms"]) == 3
+    assert all(term["term"] not in stop_words for term in terms.summary(100)["top_terms"])
+    assert "a" not in dict(TermCounter(min_length=2).top_terms(100))
+
+def test_counts_do_not_depend_on_chunk_boundaries():
+    expected = count_all(TEXT).counts
+    rng = random.Random(3)
+    for _ in range(50):
+        terms = TermCounter()
+        position = 0
+        while position < len(TEXT):
+            size = rng.randint(1, 12)
+            terms.feed(TEXT[position:position + size])
+            position += size
+        terms.finish()
+        assert terms.counts == expected
+
+def test_empty_text_has_zero_ratio():
+    assert count_all("  42 \n").summary(5) == {"tokens": 0, "unique_terms": 0, "type_token_ratio": 0.0, "top_terms": []}
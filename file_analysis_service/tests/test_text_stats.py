@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from text_stats import TextStats, stream_text_stats
+
+SAMPLES = [
+    "",
+    "one",
+    "\n\n\n",
+    "Первый абзац.\n\nВторой абзац\nс переносом.\n\n\n\nТретий  абзац \t",
+    "a\n\n\nb\n \nc\n\n",
+    "  leading space\r\n\r\nwindows\r\n",
+    "слово слово ещё\n",
+]
+
+def legacy_stats(text: str) -> dict:
+    return {
+        "paragraphs": len([p for p in text.split('\n\n') if p.strip()]),
+        "words": len(text.split()),
+        "characters": len(text),
+    }
+
+def chunked(data: bytes, rng: random.Random):
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, 7)
+        yield data[position:position + size]
+        position += size
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_stats_match_legacy_counts_for_any_chunking(text):
+    data = text.encode("utf-8")
+    rng = random.Random(len(text))
+    for _ in range(20):
+        stats = TextStats()
+        decoded = "".join(stats.feed_bytes(chunk) for chunk in chunked(data, rng)) + stats.finish()
+        assert decoded == text
+        result = stats.as_dict()
+        assert {key: result[key] for key in ("paragraphs", "words", "characters")} == legacy_stats(text)
+        assert result["lines"] == text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+        assert result["bytes"] == len(data)
+
+def test_stats_match_legacy_counts_on_random_text():
+    rng = random.Random(7)
+    alphabet = ["a", "б", "ё", " ", "\n", "\n", "\t", " ", "€"]
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        stats = TextStats()
+        for chunk in chunked(text.encode("utf-8"), rng):
+            stats.feed_bytes(chunk)
+        stats.finish()
+        result = stats.as_dict()
+        assert {key: result[key] for key in ("paragraphs", "words", "characters")} == legacy_stats(text)
+
+@pytest.mark.asyncio
+async def test_stream_text_stats_decodes_declared_charset():
+    text = "Привет, мир!\n\nПока."
+
+    async def chunks():
+        data = text.encode("cp1251")
+        for i in range(0, len(data), 3):
+            yield data[i:i + 3]
+
+    sink = []
+    stats = await stream_text_stats(chunks(), "windows-1251", sink=sink)
+    assert "".join(sink) == text
+    assert stats.as_dict() == {"paragraphs": 2, "words": 3, "characters": len(text), "lines": 3, "bytes": len(text)}
+
+    unknown = await stream_text_stats(chunks(), "no-such-charset")
+    assert unknown.bytes == len(text)
+    assert unknown.paragraphs == 2
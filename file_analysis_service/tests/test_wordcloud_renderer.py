@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+import uuid
+import xml.etree.ElementTree as ET
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import config as fas_config_module
+import crud, schemas
+import wordcloud_renderer
+from routers.analysis import perform_file_analysis
+from wordcloud_renderer import RenderError, RenderOptions, RenderQueueFull, WordCloudRenderer, layout_words, render_svg
+
+TEXT = "Облако слов облако слов облако and some English words words words <b>&amp;</b> 42 42"
+FREQUENCIES = [("облако", 3), ("words", 3), ("слов", 2), ("english", 1), ("<b>", 1)]
+
+def slow_render(seconds: float) -> bytes:
+    time.sleep(seconds)
+    return b"slow"
+
+@pytest_asyncio.fixture
+async def renderer():
+    renderer = WordCloudRenderer(max_workers=1, max_queue=0, queue_timeout=0.05)
+    yield renderer
+    await renderer.aclose()
+
+def test_layout_keeps_words_inside_the_canvas_without_overlaps():
+    options = RenderOptions(format="svg", width=300, height=200, max_words=50)
+    frequencies = [(f"word{chr(97 + i % 26)}{i}", 100 - i) for i in range(50)]
+    placed = layout_words(frequencies, options)
+
+    assert len(placed) > 10
+    assert placed == layout_words(frequencies, options)
+    assert placed[0].font_size >= placed[-1].font_size
+    for index, word in enumerate(placed):
+        assert 0 <= word.x and word.x + word.width <= options.width
+        assert 0 <= word.y and word.y + word.height <= options.height
+        for other in placed[index + 1:]:
+            assert (word.x + word.width <= other.x or other.x + other.width <= word.x
+                    or word.y + word.height <= other.y or other.y + other.height <= word.y)
+
+def test_svg_output_is_well_formed_and_escaped():
+    options = RenderOptions(format="svg", width=400, height=300)
+    svg = render_svg(layout_words([("<b>", 5), ("облако", 3)], options), options)
+    root = ET.fromstring(svg)
+    assert root.attrib["width"] == "400"
+    assert sorted(text.text for text in root.iter("{http://www.w3.org/2000/svg}text")) == ["<b>", "облако"]
+
+@pytest.mark.asyncio
+async def test_renderer_runs_in_process_pool_and_records_timings(renderer):
+    svg = await renderer.render_frequencies(FREQUENCIES, RenderOptions(format="svg", width=200, height=200))
+    assert svg.startswith(b"<svg")
+    with pytest.raises(RenderError):
+        await renderer.render_frequencies(FREQUENCIES, RenderOptions(format="gif"))
+
+    snapshot = renderer.snapshot()
+    assert snapshot["rendered_total"] == 1
+    assert snapshot["failed_total"] == 1
+    assert snapshot["bytes_total"] == len(svg)
+    assert snapshot["render_p50_seconds"] is not None
+    assert snapshot["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_renderer_rejects_work_when_queue_is_full(renderer):
+    running = asyncio.ensure_future(renderer.render(slow_render, 0.5))
+    await asyncio.sleep(0)
+    with pytest.raises(RenderQueueFull):
+        await renderer.render(slow_render, 0)
+    assert await running == b"slow"
+    assert renderer.snapshot()["rejected_total"] == 1
+
+def crash_render() -> bytes:
+    os._exit(1)
+
+@pytest.mark.asyncio
+async def test_renderer_shuts_down_broken_pool_and_starts_a_new_one(renderer):
+    broken_pool = renderer._pool()
+    shutdowns = []
+    shutdown = broken_pool.shutdown
+    broken_pool.shutdown = lambda **kwargs: shutdowns.append(kwargs) or shutdown(**kwargs)
+    with pytest.raises(RenderError, match="process died"):
+        await renderer.render(crash_render)
+    assert renderer._executor is None
+    assert shutdowns == [{"wait": False, "cancel_futures": True}]
+
+    assert await renderer.render(slow_render, 0) == b"slow"
+    assert renderer.snapshot()["failed_total"] == 1
+
+@pytest.mark.asyncio
+async def test_renderer_renders_png(renderer):
+    pytest.importorskip("PIL")
+    png = await renderer.render_frequencies(FREQUENCIES, RenderOptions(format="png", width=200, height=120))
+    assert png.startswith(b"\x89PNG")
+
+@pytest.mark.asyncio
+async def test_perform_file_analysis_stores_locally_rendered_svg(test_engine, tmp_path, monkeypatch):
+    settings = fas_config_module.settings.model_copy(update={
+        "WORDCLOUD_ENGINE": "local", "WORDCLOUD_FORMAT": "svg", "STORAGE_BASE_PATH_FAS": str(tmp_path)})
+    real_async_client = httpx.AsyncClient
+
+    def fss(request: httpx.Request) -> httpx.Response:
+        assert request.url.host == "fss"
+        return httpx.Response(200, text=TEXT)
+
+    monkeypatch.setattr(httpx, "AsyncClient", lambda *args, **kwargs: real_async_client(transport=httpx.MockTransport(fss)))
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    file_id = uuid.uuid4()
+    async with session_factory() as db:
+        analysis = await crud.create_analysis_request(db, schemas.FileAnalysisRequest(
+            file_id=file_id, file_location=f"http://fss/{file_id}/download", original_filename="cloud.txt", mime_type="text/plain"))
+        try:
+            await perform_file_analysis(db, analysis.id, file_id, f"http://fss/{file_id}/download", "cloud.txt", "text/plain", settings)
+        finally:
+            await wordcloud_renderer.wordcloud_renderer.aclose()
+        result = await crud.get_analysis_result(db, analysis.id)
+
+    assert result.analysis_status == "COMPLETED", result.error_message
+    assert result.word_cloud_image_location == f"{analysis.id}_cloud_wordcloud.svg"
+    assert {key: result.other_analysis_data[key] for key in ("paragraphs", "words", "characters", "lines", "bytes")} == {
+        "paragraphs": 1, "words": 14, "characters": len(TEXT), "lines": 1, "bytes": len(TEXT.encode("utf-8"))}
+    assert result.other_analysis_data["top_terms"][:2] == [{"term": "облако", "count": 3}, {"term": "words", "count": 3}]
+    svg = (tmp_path / result.word_cloud_image_location).read_text(encoding="utf-8")
+    assert ">облако<" in svg and ">and<" not in svg
+
+def test_default_font_draws_distinct_cyrillic_glyphs():
+    pytest.importorskip("PIL")
+    font_path = fas_config_module.Settings().WORDCLOUD_FONT_PATH
+    if not font_path or not os.path.exists(font_path):
+        pytest.skip(f"Word cloud font {font_path} is not installed")
+    font = wordcloud_renderer._load_font(font_path, 32)
+    first, second = font.getmask("облако"), font.getmask("слово")
+    assert first.size != second.size or bytes(first) != bytes(second)
+    assert bytes(font.getmask("облако")) != bytes(font.getmask("оооооо"))
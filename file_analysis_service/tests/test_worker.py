@@ -0,0 +1,179 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import config as fas_config_module
+import crud, models, schemas
+import routers.analysis as fas_routers_analysis_module
+import worker as worker_module
+from worker import AnalysisWorker
+
+@pytest.fixture
+def queue_settings(monkeypatch):
+    queue_settings = fas_config_module.settings.model_copy(update={"ANALYSIS_EXECUTOR": "queue", "ANALYSIS_JOB_MAX_ATTEMPTS": 2})
+    monkeypatch.setattr(fas_routers_analysis_module, "global_settings", queue_settings)
+    return queue_settings
+
+@pytest.fixture
+def session_factory(test_engine):
+    return sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+
+@pytest.fixture
+def analyses_run(monkeypatch):
+    runs = []
+
+    async def fake_perform_file_analysis(db, analysis_id, file_id, file_location, original_filename, mime_type, settings, file_hash=None, retry_transient=False):
+        runs.append((analysis_id, file_id, file_location, original_filename))
+        await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, analysis_id),
+                                                   schemas.FileAnalysisResultUpdate(analysis_status="COMPLETED"))
+
+    monkeypatch.setattr(worker_module, "perform_file_analysis", fake_perform_file_analysis)
+    return runs
+
+def make_request(file_id: uuid.UUID = None) -> schemas.FileAnalysisRequest:
+    file_id = file_id or uuid.uuid4()
+    return schemas.FileAnalysisRequest(
+        file_id=file_id, file_location=f"http://fss/{file_id}/download", original_filename="a.txt", mime_type="text/plain")
+
+async def jobs(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(models.AnalysisJob))).scalars().all()
+
+@pytest.mark.asyncio
+async def test_queued_analyses_are_run_by_the_worker(async_client_fas: AsyncClient, session_factory, queue_settings, analyses_run):
+    file_id = uuid.uuid4()
+    payload = {"file_id": str(file_id), "file_location": f"http://fss/{file_id}/download", "original_filename": "a.txt", "mime_type": "text/plain"}
+    response = await async_client_fas.post("/analysis/", json=payload)
+    assert response.status_code == 202
+    batch = await async_client_fas.post("/analysis/batch", json=[{**payload, "file_id": str(uuid.uuid4())} for _ in range(2)])
+    assert batch.status_code == 202
+
+    metrics = (await async_client_fas.get("/metrics")).json()["analysis_queue"]
+    assert metrics["queued"] == 3
+    assert metrics["oldest_queued_age_seconds"] >= 0
+
+    worker = AnalysisWorker(session_factory, queue_settings, worker_id="w1", concurrency=2)
+    await worker.drain()
+
+    assert len(analyses_run) == 3
+    assert analyses_run[0][1] == file_id
+    assert await jobs(session_factory) == []
+    assert worker.snapshot()["completed_total"] == 3
+    assert worker.snapshot()["queue_wait_p95_seconds"] is not None
+    statuses = (await async_client_fas.get(f"/analysis/file/{file_id}")).json()
+    assert [s["analysis_status"] for s in statuses] == ["COMPLETED"]
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_reclaimed_and_stale_worker_cannot_complete(session_factory, queue_settings):
+    async with session_factory() as db:
+        await crud.create_analysis_request(db, make_request(), enqueue=True)
+        (first,) = await crud.claim_analysis_jobs(db, "w1", 10, 60.0)
+        assert await crud.claim_analysis_jobs(db, "w2", 10, 60.0) == []
+        assert await crud.extend_analysis_job_leases(db, "w1", [first.id], 60.0) == 1
+
+        await db.execute(update(models.AnalysisJob).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+        assert (await crud.get_analysis_queue_stats(db))["expired_leases"] == 1
+        (second,) = await crud.claim_analysis_jobs(db, "w2", 10, 60.0)
+        assert second.id == first.id
+        assert second.attempts == 2
+
+        assert await crud.extend_analysis_job_leases(db, "w1", [first.id], 60.0) == 0
+        await crud.complete_analysis_job(db, "w1", first.id)
+    assert len(await jobs(session_factory)) == 1
+
+@pytest.mark.asyncio
+async def test_failing_job_is_released_with_backoff_then_abandoned(session_factory, queue_settings, monkeypatch):
+    async def broken_perform_file_analysis(*args, **kwargs):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(worker_module, "perform_file_analysis", broken_perform_file_analysis)
+    async with session_factory() as db:
+        analysis = await crud.create_analysis_request(db, make_request(), enqueue=True)
+    worker = AnalysisWorker(session_factory, queue_settings, worker_id="w1")
+
+    await worker.drain()
+    (job,) = await jobs(session_factory)
+    assert job.locked_by is None
+    assert job.available_at > datetime.utcnow()
+    assert "database went away" in job.last_error
+    assert worker.retried_total == 1
+
+    for _ in range(2):
+        async with session_factory() as db:
+            await db.execute(update(models.AnalysisJob).values(available_at=datetime.utcnow() - timedelta(seconds=1)))
+            await db.commit()
+        await worker.drain()
+
+    assert await jobs(session_factory) == []
+    assert worker.abandoned_total == 1
+    async with session_factory() as db:
+        result = await crud.get_analysis_result(db, analysis.id)
+    assert result.analysis_status == "FAILED"
+    assert "abandoned" in result.error_message
+
+@pytest.mark.asyncio
+async def test_transient_fss_error_is_retried_instead_of_failing_the_analysis(session_factory, queue_settings, monkeypatch):
+    outages = ["fss is restarting", "fss is still down"]
+
+    async def unreachable_fss(self, request, **kwargs):
+        raise httpx.ConnectError(outages.pop(0), request=request)
+
+    monkeypatch.setattr(httpx.AsyncClient, "send", unreachable_fss)
+    async with session_factory() as db:
+        analysis = await crud.create_analysis_request(db, make_request(), enqueue=True)
+    worker = AnalysisWorker(session_factory, queue_settings, worker_id="w1")
+
+    await worker.drain()
+    (job,) = await jobs(session_factory)
+    assert job.locked_by is None
+    assert "fss is restarting" in job.last_error
+    assert worker.retried_total == 1
+    async with session_factory() as db:
+        result = await crud.get_analysis_result(db, analysis.id)
+    assert result.analysis_status == "PENDING"
+
+    async with session_factory() as db:
+        await db.execute(update(models.AnalysisJob).values(available_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+    await worker.drain()
+
+    assert await jobs(session_factory) == []
+    async with session_factory() as db:
+        result = await crud.get_analysis_result(db, analysis.id)
+    assert result.analysis_status == "FAILED"
+    assert "fss is still down" in result.error_message
+
+@pytest.mark.asyncio
+async def test_job_is_cancelled_when_its_lease_is_lost(session_factory, queue_settings, monkeypatch):
+    started = asyncio.Event()
+
+    async def slow_perform_file_analysis(*args, **kwargs):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(worker_module, "perform_file_analysis", slow_perform_file_analysis)
+    async with session_factory() as db:
+        await crud.create_analysis_request(db, make_request(), enqueue=True)
+    worker = AnalysisWorker(session_factory, queue_settings, worker_id="w1")
+
+    assert await worker.claim_and_start() == 1
+    await started.wait()
+    (task,) = worker._active.values()
+    async with session_factory() as db:
+        await db.execute(update(models.AnalysisJob).values(locked_by="w2"))
+        await db.commit()
+
+    await worker.heartbeat()
+    await asyncio.gather(task, return_exceptions=True)
+    assert task.cancelled()
+    assert worker.leases_lost_total == 1
+    (job,) = await jobs(session_factory)
+    assert job.locked_by == "w2"
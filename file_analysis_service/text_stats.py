@@ -0,0 +1,97 @@
+import codecs
+from typing import AsyncIterator, Optional
+
+from term_frequencies import TermCounter
+
+class TextStats:
+    def __init__(self, encoding: str = "utf-8"):
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.bytes = 0
+        self.characters = 0
+        self.words = 0
+        self.newlines = 0
+        self.paragraphs = 0
+        self._in_word = False
+        self._in_paragraph = False
+        self._pending_newline = False
+        self._last_char = ""
+
+    def feed_bytes(self, chunk: bytes) -> str:
+        self.bytes += len(chunk)
+        text = self._decoder.decode(chunk)
+        self.feed(text)
+        return text
+
+    def feed(self, text: str):
+        if not text:
+            return
+        self.characters += len(text)
+        self.newlines += text.count("\n")
+        self._last_char = text[-1]
+
+        words = len(text.split())
+        if words and self._in_word and not text[0].isspace():
+            words -= 1
+        self.words += words
+        self._in_word = not text[-1].isspace()
+
+        pieces = ("\n" + text if self._pending_newline else text).split("\n\n")
+        last = pieces[-1]
+        self._pending_newline = last.endswith("\n")
+        if len(pieces) > 1:
+            if self._in_paragraph or _has_content(pieces[0]):
+                self.paragraphs += 1
+            self.paragraphs += sum(1 for piece in pieces[1:-1] if _has_content(piece))
+            self._in_paragraph = False
+        self._in_paragraph = self._in_paragraph or _has_content(last)
+
+    def finish(self) -> str:
+        text = self._decoder.decode(b"", final=True)
+        self.feed(text)
+        if self._in_paragraph:
+            self.paragraphs += 1
+            self._in_paragraph = False
+        return text
+
+    @property
+    def lines(self) -> int:
+        if self._last_char and self._last_char != "\n":
+            return self.newlines + 1
+        return self.newlines
+
+    def as_dict(self) -> dict:
+        return {
+            "paragraphs": self.paragraphs,
+            "words": self.words,
+            "characters": self.characters,
+            "lines": self.lines,
+            "bytes": self.bytes,
+        }
+
+def _has_content(piece: str) -> bool:
+    return bool(piece) and not piece.isspace()
+
+async def stream_text_stats(
+    chunks: AsyncIterator[bytes],
+    encoding: Optional[str] = None,
+    sink: Optional[list] = None,
+    terms: Optional[TermCounter] = None
+) -> TextStats:
+    stats = TextStats(encoding or "utf-8")
+    async for chunk in chunks:
+        _dispatch(stats.feed_bytes(chunk), sink, terms)
+    _dispatch(stats.finish(), sink, terms)
+    if terms is not None:
+        terms.finish()
+    return stats
+
+def _dispatch(text: str, sink: Optional[list], terms: Optional[TermCounter]):
+    if not text:
+        return
+    if sink is not None:
+        sink.append(text)
+    if terms is not None:
+        terms.feed(text)
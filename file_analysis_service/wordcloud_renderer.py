@@ -0,0 +1,303 @@
+import asyncio
+import io
+import math
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Callable, Deque, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from config import Settings, settings
+from logging_config import get_logger
+from metrics import percentile
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+logger = get_logger(__name__)
+
+SUPPORTED_FORMATS = ("png", "svg")
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+PALETTE = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#17becf")
+GRID_CELL = 4
+SPIRAL_SPACING = 1.5
+RELATIVE_SCALING = 0.5
+
+class RenderError(Exception):
+    pass
+
+class RenderQueueFull(RenderError):
+    pass
+
+class RenderOptions(NamedTuple):
+    format: str = "png"
+    width: int = 500
+    height: int = 500
+    max_words: int = 200
+    min_font_size: int = 10
+    max_font_size: int = 0
+    font_path: Optional[str] = None
+    background: str = "#ffffff"
+    seed: int = 0
+
+class PlacedWord(NamedTuple):
+    word: str
+    font_size: int
+    x: int
+    y: int
+    width: int
+    height: int
+    vertical: bool
+    color: str
+
+def is_supported(image_format: str) -> bool:
+    if image_format == "png":
+        return Image is not None
+    return image_format in SUPPORTED_FORMATS
+
+def estimate_text_size(word: str, font_size: int) -> Tuple[int, int]:
+    return int(len(word) * font_size * 0.6) + 1, int(font_size * 1.2) + 1
+
+class _Grid:
+    def __init__(self, width: int, height: int):
+        self.columns = max(1, width // GRID_CELL)
+        self.rows = [0] * max(1, height // GRID_CELL)
+
+    def _span(self, x: int, y: int, width: int, height: int):
+        left, top = x // GRID_CELL, y // GRID_CELL
+        right, bottom = (x + width - 1) // GRID_CELL, (y + height - 1) // GRID_CELL
+        if left < 0 or top < 0 or right >= self.columns or bottom >= len(self.rows):
+            return None
+        return top, bottom, ((1 << (right - left + 1)) - 1) << left
+
+    def fits(self, x: int, y: int, width: int, height: int) -> bool:
+        span = self._span(x, y, width, height)
+        if span is None:
+            return False
+        top, bottom, mask = span
+        return not any(self.rows[row] & mask for row in range(top, bottom + 1))
+
+    def occupy(self, x: int, y: int, width: int, height: int):
+        top, bottom, mask = self._span(x, y, width, height)
+        for row in range(top, bottom + 1):
+            self.rows[row] |= mask
+
+def _find_position(grid: _Grid, width: int, height: int, canvas_width: int, canvas_height: int, rng: random.Random):
+    center_x, center_y = canvas_width // 2, canvas_height // 2
+    start = rng.random() * 2 * math.pi
+    limit = math.hypot(canvas_width, canvas_height) / 2
+    theta = 0.0
+    while True:
+        radius = SPIRAL_SPACING * theta
+        if radius > limit:
+            return None
+        x = int(center_x + radius * math.cos(start + theta) - width / 2)
+        y = int(center_y + radius * math.sin(start + theta) * canvas_height / canvas_width - height / 2)
+        if grid.fits(x, y, width, height):
+            return x, y
+        theta += min(0.5, GRID_CELL * 1.5 / max(radius, 1.0))
+
+def layout_words(
+    frequencies: List[Tuple[str, int]],
+    options: RenderOptions,
+    measure: Callable[[str, int], Tuple[int, int]] = estimate_text_size
+) -> List[PlacedWord]:
+    if not frequencies:
+        return []
+    rng = random.Random(options.seed)
+    grid = _Grid(options.width, options.height)
+    font_size = options.max_font_size or max(options.min_font_size, options.height // 8)
+    last_count = frequencies[0][1]
+    placed = []
+    for index, (word, count) in enumerate(frequencies[:options.max_words]):
+        font_size = int(round(font_size * (RELATIVE_SCALING * count / last_count + 1 - RELATIVE_SCALING)))
+        last_count = count
+        vertical = index > 0 and rng.random() < 0.25
+        while font_size >= options.min_font_size:
+            width, height = measure(word, font_size)
+            if vertical:
+                width, height = height, width
+            if width <= options.width and height <= options.height:
+                position = _find_position(grid, width, height, options.width, options.height, rng)
+                if position is not None:
+                    grid.occupy(position[0], position[1], width, height)
+                    placed.append(PlacedWord(word, font_size, position[0], position[1], width, height, vertical, PALETTE[rng.randrange(len(PALETTE))]))
+                    break
+            font_size = min(font_size - 1, int(font_size * 0.85))
+        if font_size < options.min_font_size:
+            break
+    return placed
+
+def render_svg(placed: List[PlacedWord], options: RenderOptions) -> bytes:
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{options.width}" height="{options.height}" viewBox="0 0 {options.width} {options.height}">',
+        f'<rect width="100%" height="100%" fill="{options.background}"/>',
+    ]
+    for word in placed:
+        if word.vertical:
+            x, y = word.x + word.width * 0.8, word.y + word.height
+            transform = f' transform="rotate(-90 {x:.1f} {y:.1f})"'
+        else:
+            x, y = word.x, word.y + word.height * 0.8
+            transform = ""
+        parts.append(
+            f'<text x="{x:.1f}" y="{y:.1f}" font-family="sans-serif" font-size="{word.font_size}" fill="{word.color}"{transform}>{escape(word.word)}</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts).encode("utf-8")
+
+@lru_cache(maxsize=256)
+def _load_font(font_path: Optional[str], font_size: int):
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except OSError:
+            logger.warning(f"Word cloud font '{font_path}' could not be loaded, falling back to Pillow's default font")
+    try:
+        return ImageFont.load_default(size=font_size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def render_png(frequencies: List[Tuple[str, int]], options: RenderOptions) -> bytes:
+    if Image is None:
+        raise RenderError("PNG word clouds need Pillow installed")
+    fonts = {}
+
+    def font(font_size: int):
+        if font_size not in fonts:
+            fonts[font_size] = _load_font(options.font_path, font_size)
+        return fonts[font_size]
+
+    def measure(word: str, font_size: int) -> Tuple[int, int]:
+        left, top, right, bottom = font(font_size).getbbox(word)
+        return right + 1, bottom + 1
+
+    image = Image.new("RGB", (options.width, options.height), options.background)
+    draw = ImageDraw.Draw(image)
+    for word in layout_words(frequencies, options, measure):
+        if word.vertical:
+            label = Image.new("RGBA", (word.height, word.width), (0, 0, 0, 0))
+            ImageDraw.Draw(label).text((0, 0), word.word, font=font(word.font_size), fill=word.color)
+            rotated = label.rotate(90, expand=True)
+            image.paste(rotated, (word.x, word.y), rotated)
+        else:
+            draw.text((word.x, word.y), word.word, font=font(word.font_size), fill=word.color)
+    output = io.BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+def render_frequencies(frequencies: List[Tuple[str, int]], options: RenderOptions) -> bytes:
+    if options.format == "svg":
+        return render_svg(layout_words(frequencies, options), options)
+    if options.format == "png":
+        return render_png(frequencies, options)
+    raise RenderError(f"Unsupported word cloud format '{options.format}'")
+
+def _timed(render: Callable, *args) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    return render(*args), time.perf_counter() - started
+
+class WordCloudRenderer:
+    def __init__(self, max_workers: int, max_queue: int, queue_timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rendered_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self.bytes_total = 0
+        self.queue_wait_seconds: Deque[float] = deque(maxlen=1024)
+        self.render_seconds: Deque[float] = deque(maxlen=1024)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info(f"Started word cloud render pool with {self.max_workers} process(es), queue size {self.max_queue}")
+        return self._executor
+
+    async def render(self, render: Callable, *args) -> bytes:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_total += 1
+            raise RenderQueueFull(f"Word cloud render queue is full ({self.in_flight} in flight)")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        executor = self._pool()
+        try:
+            image_bytes, render_seconds = await asyncio.get_running_loop().run_in_executor(executor, _timed, render, *args)
+        except BrokenProcessPool as e:
+            self.failed_total += 1
+            logger.error(f"Word cloud render pool broke, restarting it: {e}")
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise RenderError("Word cloud render process died") from e
+        except RenderError:
+            self.failed_total += 1
+            raise
+        except Exception as e:
+            self.failed_total += 1
+            raise RenderError(f"{type(e).__name__}: {str(e)}") from e
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        self.rendered_total += 1
+        self.bytes_total += len(image_bytes)
+        self.render_seconds.append(render_seconds)
+        self.queue_wait_seconds.append(max(0.0, time.monotonic() - started - render_seconds))
+        return image_bytes
+
+    async def render_frequencies(self, frequencies: List[Tuple[str, int]], options: RenderOptions) -> bytes:
+        return await self.render(render_frequencies, frequencies, options)
+
+    async def aclose(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+        self._slots = None
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "queue_size": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rendered_total": self.rendered_total,
+            "failed_total": self.failed_total,
+            "rejected_total": self.rejected_total,
+            "bytes_total": self.bytes_total,
+            "queue_wait_p50_seconds": percentile(self.queue_wait_seconds, 50),
+            "queue_wait_p95_seconds": percentile(self.queue_wait_seconds, 95),
+            "render_p50_seconds": percentile(self.render_seconds, 50),
+            "render_p95_seconds": percentile(self.render_seconds, 95),
+        }
+
+def render_options(settings: Settings) -> RenderOptions:
+    return RenderOptions(
+        format=settings.WORDCLOUD_FORMAT,
+        width=settings.WORDCLOUD_WIDTH,
+        height=settings.WORDCLOUD_HEIGHT,
+        max_words=settings.WORDCLOUD_MAX_WORDS,
+        font_path=settings.WORDCLOUD_FONT_PATH,
+    )
+
+wordcloud_renderer = WordCloudRenderer(
+    settings.WORDCLOUD_RENDER_WORKERS,
+    settings.WORDCLOUD_RENDER_QUEUE_SIZE,
+    settings.WORDCLOUD_RENDER_QUEUE_TIMEOUT_SECONDS
+)
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional
+
+import crud, schemas
+from config import Settings, settings as global_settings
+from database import AsyncSessionLocal, create_db_and_tables
+from logging_config import get_logger
+from metrics import percentile
+from routers.analysis import perform_file_analysis
+from wordcloud_renderer import wordcloud_renderer
+
+logger = get_logger(__name__)
+
+class AnalysisWorker:
+    def __init__(self, session_factory, settings: Settings, worker_id: Optional[str] = None, concurrency: Optional[int] = None):
+        self.session_factory = session_factory
+        self.settings = settings
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency or settings.ANALYSIS_WORKER_CONCURRENCY
+        self._active: Dict[int, asyncio.Task] = {}
+        self.claimed_total = 0
+        self.completed_total = 0
+        self.retried_total = 0
+        self.abandoned_total = 0
+        self.leases_lost_total = 0
+        self.wait_seconds: Deque[float] = deque(maxlen=1024)
+        self.run_seconds: Deque[float] = deque(maxlen=1024)
+
+    async def run_job(self, job: schemas.AnalysisJobClaim):
+        self.wait_seconds.append((datetime.utcnow() - job.enqueued_at).total_seconds())
+        started = time.monotonic()
+        payload = job.payload
+        try:
+            async with self.session_factory() as db:
+                if job.attempts > self.settings.ANALYSIS_JOB_MAX_ATTEMPTS:
+                    logger.error(f"Analysis job {job.id} (analysis_id: {job.analysis_id}) exceeded {self.settings.ANALYSIS_JOB_MAX_ATTEMPTS} attempts, marking FAILED")
+                    await crud.update_analysis_status_and_data(db, await crud.get_analysis_result(db, job.analysis_id), schemas.FileAnalysisResultUpdate(
+                        analysis_status="FAILED", error_message=f"Analysis abandoned after {job.attempts - 1} attempt(s)"))
+                    self.abandoned_total += 1
+                else:
+                    await perform_file_analysis(
+                        db, job.analysis_id, uuid.UUID(payload["file_id"]), payload["file_location"],
+                        payload["original_filename"], payload["mime_type"], self.settings,
+                        file_hash=payload.get("file_hash"),
+                        retry_transient=job.attempts < self.settings.ANALYSIS_JOB_MAX_ATTEMPTS
+                    )
+                    self.completed_total += 1
+                await crud.complete_analysis_job(db, self.worker_id, job.id)
+        except Exception as e:
+            self.retried_total += 1
+            retry_delay = min(self.settings.ANALYSIS_JOB_RETRY_MAX_SECONDS, self.settings.ANALYSIS_JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+            logger.exception(f"Analysis job {job.id} failed on attempt {job.attempts}, retrying in {retry_delay}s")
+            async with self.session_factory() as db:
+                await crud.release_analysis_job(db, self.worker_id, job.id, f"{type(e).__name__}: {str(e)}", retry_delay)
+        except asyncio.CancelledError:
+            logger.warning(f"Analysis job {job.id} (analysis_id: {job.analysis_id}) was cancelled on worker {self.worker_id}")
+            raise
+        finally:
+            self.run_seconds.append(time.monotonic() - started)
+
+    async def claim_and_start(self) -> int:
+        free = self.concurrency - len(self._active)
+        if free <= 0:
+            return 0
+        async with self.session_factory() as db:
+            jobs = await crud.claim_analysis_jobs(db, self.worker_id, free, self.settings.ANALYSIS_JOB_LEASE_SECONDS)
+        for job in jobs:
+            logger.info(f"Claimed analysis job {job.id} (analysis_id: {job.analysis_id}, attempt {job.attempts})")
+            task = asyncio.create_task(self.run_job(job))
+            self._active[job.id] = task
+            task.add_done_callback(lambda _, job_id=job.id: self._active.pop(job_id, None))
+        self.claimed_total += len(jobs)
+        return len(jobs)
+
+    async def drain(self):
+        while await self.claim_and_start() or self._active:
+            await asyncio.gather(*list(self._active.values()), return_exceptions=True)
+
+    async def heartbeat(self):
+        job_ids = list(self._active)
+        if not job_ids:
+            return
+        async with self.session_factory() as db:
+            extended = await crud.extend_analysis_job_leases(db, self.worker_id, job_ids, self.settings.ANALYSIS_JOB_LEASE_SECONDS)
+        if extended < len(job_ids):
+            async with self.session_factory() as db:
+                leased = set(await crud.get_leased_analysis_job_ids(db, self.worker_id, job_ids))
+            lost = [job_id for job_id in job_ids if job_id not in leased]
+            self.leases_lost_total += len(lost)
+            logger.warning(f"Worker {self.worker_id} lost the lease on {len(lost)} of {len(job_ids)} running job(s), cancelling them")
+            for job_id in lost:
+                task = self._active.get(job_id)
+                if task is not None:
+                    task.cancel()
+
+    async def run_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.settings.ANALYSIS_JOB_HEARTBEAT_SECONDS)
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception("Analysis job heartbeat failed")
+
+    async def run(self, stop: asyncio.Event):
+        logger.info(f"Analysis worker {self.worker_id} started with concurrency {self.concurrency}")
+        heartbeats = asyncio.create_task(self.run_heartbeats())
+        last_report = time.monotonic()
+        try:
+            while not stop.is_set():
+                try:
+                    claimed = await self.claim_and_start()
+                except Exception:
+                    logger.exception("Claiming analysis jobs failed")
+                    claimed = 0
+                if time.monotonic() - last_report >= 60:
+                    logger.info(f"Analysis worker stats: {self.snapshot()}, renderer: {wordcloud_renderer.snapshot()}")
+                    last_report = time.monotonic()
+                if claimed and len(self._active) < self.concurrency:
+                    continue
+                waiters = [asyncio.ensure_future(stop.wait())] + list(self._active.values())
+                await asyncio.wait(waiters, timeout=self.settings.ANALYSIS_JOB_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                waiters[0].cancel()
+            if self._active:
+                logger.info(f"Analysis worker {self.worker_id} stopping, waiting for {len(self._active)} running job(s)")
+                await asyncio.gather(*list(self._active.values()), return_exceptions=True)
+        finally:
+            heartbeats.cancel()
+
+    def snapshot(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running": len(self._active),
+            "claimed_total": self.claimed_total,
+            "completed_total": self.completed_total,
+            "retried_total": self.retried_total,
+            "abandoned_total": self.abandoned_total,
+            "leases_lost_total": self.leases_lost_total,
+            "queue_wait_p50_seconds": percentile(self.wait_seconds, 50),
+            "queue_wait_p95_seconds": percentile(self.wait_seconds, 95),
+            "run_p50_seconds": percentile(self.run_seconds, 50),
+            "run_p95_seconds": percentile(self.run_seconds, 95),
+        }
+
+async def run_worker(concurrency: int):
+    await create_db_and_tables()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    worker = AnalysisWorker(AsyncSessionLocal, global_settings, concurrency=concurrency)
+    try:
+        await worker.run(stop)
+    finally:
+        await wordcloud_renderer.aclose()
+    logger.info(f"Analysis worker stopped: {worker.snapshot()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run FAS analysis jobs from the database queue.")
+    parser.add_argument("--concurrency", type=int, default=global_settings.ANALYSIS_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency))
+
+if __name__ == "__main__":
+    main()
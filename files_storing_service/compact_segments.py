@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import time
+
+import crud, storage_backends
+from config import settings
+from database import AsyncSessionLocal
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+async def compact_segments(
+    session_factory,
+    backend: storage_backends.PackedSegmentBackend,
+    min_live_ratio: float = 0.5,
+    min_age_seconds: float = 3600.0,
+    grace_seconds: float = 30.0
+) -> dict:
+    stats = {"segments_scanned": 0, "segments_compacted": 0, "blobs_moved": 0, "bytes_reclaimed": 0}
+    retired = []
+    cutoff = time.time() - min_age_seconds
+    async with session_factory() as db:
+        for segment in backend.segments():
+            if backend.is_active(segment.name) or segment.stat().st_mtime > cutoff:
+                continue
+            stats["segments_scanned"] += 1
+            rows = await crud.get_file_locations_with_prefix(db, f"{storage_backends.PACKED_KEY_PREFIX}{segment.name}/")
+            live_bytes = sum(storage_backends.parse_packed_key(location)[2] for _, location in rows)
+            total_bytes = segment.stat().st_size
+            if total_bytes and live_bytes / total_bytes >= min_live_ratio:
+                continue
+            for file_id, location in rows:
+                new_location = await backend.append(await backend.read_blob(location))
+                await crud.update_file_location(db, file_id, new_location)
+                stats["blobs_moved"] += 1
+            logger.info(f"Compacted segment {segment.name}: moved {len(rows)} live blob(s), {live_bytes}/{total_bytes} bytes live")
+            retired.append(segment)
+            stats["segments_compacted"] += 1
+            stats["bytes_reclaimed"] += total_bytes - live_bytes
+    if retired:
+        await asyncio.sleep(grace_seconds)
+        for segment in retired:
+            segment.unlink(missing_ok=True)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Reclaim space in FSS small-file segments by rewriting live blobs out of sparse segments.")
+    parser.add_argument("--min-live-ratio", type=float, default=0.5, help="Compact segments whose live bytes fall below this share.")
+    parser.add_argument("--min-age-seconds", type=float, default=max(3600.0, 2 * settings.STORAGE_SEGMENT_MAX_AGE_SECONDS),
+                        help="Only touch segments idle for this long; must exceed STORAGE_SEGMENT_MAX_AGE_SECONDS so writers have sealed them.")
+    parser.add_argument("--grace-seconds", type=float, default=30.0, help="Delay before deleting compacted segments, so in-flight downloads can finish.")
+    args = parser.parse_args()
+    if args.min_age_seconds <= settings.STORAGE_SEGMENT_MAX_AGE_SECONDS:
+        parser.error("--min-age-seconds must exceed STORAGE_SEGMENT_MAX_AGE_SECONDS")
+
+    backend = storage_backends.create_storage_backend(settings)
+    if not isinstance(backend, storage_backends.PackedSegmentBackend):
+        parser.error("Small-file packing is disabled (STORAGE_PACK_SMALL_FILES=false), nothing to compact")
+
+    async def run() -> dict:
+        try:
+            return await compact_segments(AsyncSessionLocal, backend, args.min_live_ratio, args.min_age_seconds, args.grace_seconds)
+        finally:
+            await backend.aclose()
+
+    stats = asyncio.run(run())
+    logger.info(f"Segment compaction finished: {stats}")
+
+if __name__ == "__main__":
+    main()
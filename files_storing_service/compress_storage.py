@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+import compression, crud, storage, storage_backends
+from config import settings
+from database import AsyncSessionLocal
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+async def compress_existing_files(
+    session_factory,
+    base_path: Path,
+    encoding: str,
+    level: int,
+    mime_prefixes: str,
+    min_bytes: int,
+    chunk_size: int,
+    batch_size: int = 100,
+    grace_seconds: float = 30.0,
+    pause_seconds: float = 0.0,
+    backend: Optional[storage_backends.LocalShardedBackend] = None
+) -> dict:
+    backend = backend or storage_backends.LocalShardedBackend([base_path])
+    stats = {"compressed": 0, "kept_raw": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    after_id = None
+    async with session_factory() as db:
+        while True:
+            batch = await crud.get_uncompressed_file_metadata(db, batch_size, after_id)
+            if not batch:
+                break
+            rows = [(m.id, m.file_location, m.mime_type, m.size_bytes) for m in batch]
+            after_id = rows[-1][0]
+            replaced = []
+            for file_id, file_location, mime_type, size_bytes in rows:
+                if storage_backends.is_packed_key(file_location):
+                    stats["skipped"] += 1
+                    continue
+                chosen = compression.choose_encoding(encoding, mime_type, size_bytes, mime_prefixes, min_bytes)
+                if chosen is None:
+                    stats["skipped"] += 1
+                    continue
+                source = backend.local_path(file_location)
+                if source is None:
+                    logger.error(f"Stored file {file_location} (file_id: {file_id}) is missing, skipping")
+                    stats["failed"] += 1
+                    continue
+                try:
+                    compressed_path, compressed_size = await storage.compress_in_staging(source, base_path, chosen, level, chunk_size)
+                except OSError as e:
+                    logger.error(f"Could not compress {source} (file_id: {file_id}): {str(e)}")
+                    stats["failed"] += 1
+                    continue
+                if compressed_size >= size_bytes:
+                    compressed_path.unlink(missing_ok=True)
+                    await crud.update_file_storage(db, file_id, file_location, "identity", size_bytes)
+                    stats["kept_raw"] += 1
+                    continue
+                try:
+                    compressed_location = await backend.put_file(compressed_path, file_location + compression.ENCODING_SUFFIXES[chosen])
+                except OSError as e:
+                    compressed_path.unlink(missing_ok=True)
+                    logger.error(f"Could not store compressed copy of {source} (file_id: {file_id}): {str(e)}")
+                    stats["failed"] += 1
+                    continue
+                await crud.update_file_storage(db, file_id, compressed_location, chosen, compressed_size)
+                replaced.append(source)
+                stats["compressed"] += 1
+                stats["bytes_before"] += size_bytes
+                stats["bytes_after"] += compressed_size
+            if replaced:
+                await asyncio.sleep(grace_seconds)
+                for source in replaced:
+                    source.unlink(missing_ok=True)
+            logger.info(f"Storage compression progress: {stats}")
+            if pause_seconds:
+                await asyncio.sleep(pause_seconds)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress files already stored by FSS and record the encoding in file_metadata.")
+    parser.add_argument("--encoding", choices=sorted(compression.ENCODING_SUFFIXES), default=settings.STORAGE_COMPRESSION if settings.STORAGE_COMPRESSION != "none" else "zstd")
+    parser.add_argument("--level", type=int, default=settings.STORAGE_COMPRESSION_LEVEL)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--grace-seconds", type=float, default=30.0, help="Delay before deleting raw originals, so in-flight downloads can finish.")
+    parser.add_argument("--pause-seconds", type=float, default=0.0, help="Pause between batches to limit I/O pressure.")
+    args = parser.parse_args()
+    backend = storage_backends.backend_for(settings)
+    if isinstance(backend, storage_backends.PackedSegmentBackend):
+        backend = backend.inner
+    if not isinstance(backend, storage_backends.LocalShardedBackend):
+        parser.error(f"Compressing existing files is only supported for local storage, not '{backend.name}'")
+
+    stats = asyncio.run(compress_existing_files(
+        AsyncSessionLocal, settings.STORAGE_BASE_PATH, args.encoding, args.level,
+        settings.STORAGE_COMPRESSION_MIME_TYPES, settings.STORAGE_COMPRESSION_MIN_BYTES, settings.UPLOAD_CHUNK_SIZE,
+        batch_size=args.batch_size, grace_seconds=args.grace_seconds, pause_seconds=args.pause_seconds, backend=backend
+    ))
+    logger.info(f"Storage compression finished: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from logging_config import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = get_logger(__name__)
+
+ENCODING_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+def is_supported(encoding: str) -> bool:
+    if encoding == "zstd":
+        return zstandard is not None
+    return encoding == "gzip"
+
+def should_compress(mime_type: Optional[str], size_bytes: int, mime_prefixes: str, min_bytes: int) -> bool:
+    if size_bytes < min_bytes or not mime_type:
+        return False
+    prefixes = [prefix.strip() for prefix in mime_prefixes.split(",") if prefix.strip()]
+    return any(mime_type.lower().startswith(prefix) for prefix in prefixes)
+
+def choose_encoding(configured: str, mime_type: Optional[str], size_bytes: int, mime_prefixes: str, min_bytes: int) -> Optional[str]:
+    if configured == "none":
+        return None
+    if not is_supported(configured):
+        logger.warning(f"Storage compression '{configured}' is not available, storing raw")
+        return None
+    if not should_compress(mime_type, size_bytes, mime_prefixes, min_bytes):
+        return None
+    return configured
+
+def _compressor(encoding: str, level: int):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+def _decompressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+def compress_file(source: Path, target: Path, encoding: str, level: int, chunk_size: int) -> int:
+    compressor = _compressor(encoding, level)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while chunk := src.read(chunk_size):
+            dst.write(compressor.compress(chunk))
+        dst.write(compressor.flush())
+        dst.flush()
+        os.fsync(dst.fileno())
+    return target.stat().st_size
+
+async def iter_decompressed(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    decompressor = _decompressor(encoding)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if encoding == "gzip":
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if name.lower() not in (encoding, "*"):
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
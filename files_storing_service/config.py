@@ -9,6 +9,39 @@ class Settings(BaseSettings):
     FSS_PORT: int = 8001
     FAS_URL: str = "http://localhost:8002"
     STORAGE_BASE_PATH: Path = Path("filestorage_fss")
+    STORAGE_BACKEND: str = "local"
+    STORAGE_MOUNTS: str = ""
+    STORAGE_PACK_SMALL_FILES: bool = False
+    STORAGE_PACK_MAX_BLOB_BYTES: int = 64 * 1024
+    STORAGE_SEGMENT_MAX_BYTES: int = 256 * 1024 * 1024
+    STORAGE_SEGMENT_MAX_AGE_SECONDS: float = 600.0
+    S3_ENDPOINT_URL: str = "http://localhost:9000"
+    S3_BUCKET: str = "fss"
+    S3_REGION: str = "us-east-1"
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
+    S3_PREFIX: str = ""
+    S3_TIMEOUT_SECONDS: float = 30.0
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_SESSION_MAX_BYTES: int = 10 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: float = 24 * 3600.0
+    STAGING_CLEANUP_MIN_AGE_SECONDS: float = 3600.0
+    BATCH_UPLOAD_MAX_FILES: int = 10000
+    FAS_NOTIFY_BATCH_SIZE: int = 500
+    FAS_NOTIFY_TIMEOUT_SECONDS: float = 10.0
+    FAS_NOTIFY_MAX_CONNECTIONS: int = 10
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    OUTBOX_RETRY_BASE_SECONDS: float = 1.0
+    OUTBOX_RETRY_MAX_SECONDS: float = 300.0
+    METADATA_CACHE_ENABLED: bool = True
+    METADATA_CACHE_MAX_ENTRIES: int = 10000
+    METADATA_CACHE_TTL_SECONDS: float = 300.0
+    METADATA_CACHE_NEGATIVE_TTL_SECONDS: float = 2.0
+    STORAGE_COMPRESSION: str = "none"
+    STORAGE_COMPRESSION_LEVEL: int = 3
+    STORAGE_COMPRESSION_MIN_BYTES: int = 512
+    STORAGE_COMPRESSION_MIME_TYPES: str = "text/,application/json,application/xml,application/javascript,image/svg+xml"
 
     model_config = SettingsConfigDict(env_file=env_path, extra='ignore')
 
@@ -1,7 +1,9 @@
 import uuid as py_uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, update
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import models, schemas
 
@@ -13,21 +15,136 @@ async def get_file_metadata_by_hash(db: AsyncSession, file_hash: str) -> Optiona
     result = await db.execute(select(models.FileMetadata).filter(models.FileMetadata.file_hash == file_hash))
     return result.scalars().first()
 
-async def create_file_metadata(db: AsyncSession, file_meta: schemas.FileMetadataCreate, file_location: str) -> models.FileMetadata:
+FILE_STORED_EVENT = "file_stored"
+
+def build_file_stored_event(db_file_meta: models.FileMetadata, download_base_url: str) -> models.OutboxEvent:
+    return models.OutboxEvent(
+        event_type=FILE_STORED_EVENT,
+        payload={
+            "file_id": str(db_file_meta.id),
+            "file_location": f"{download_base_url}/{db_file_meta.id}/download",
+            "original_filename": db_file_meta.original_filename,
+            "mime_type": db_file_meta.mime_type,
+            "file_hash": db_file_meta.file_hash,
+        }
+    )
+
+async def create_file_metadata(
+    db: AsyncSession,
+    file_meta: schemas.FileMetadataCreate,
+    file_location: str,
+    download_base_url: Optional[str] = None
+) -> models.FileMetadata:
     db_file_meta = models.FileMetadata(
+        id=py_uuid.uuid4(),
         original_filename=file_meta.original_filename,
         file_hash=file_meta.file_hash,
         mime_type=file_meta.mime_type,
         size_bytes=file_meta.size_bytes,
+        storage_encoding=file_meta.storage_encoding,
+        stored_size_bytes=file_meta.stored_size_bytes,
         file_location=file_location
     )
     db.add(db_file_meta)
+    if download_base_url is not None:
+        db.add(build_file_stored_event(db_file_meta, download_base_url))
     await db.commit()
     await db.refresh(db_file_meta)
     return db_file_meta
 
+async def get_file_metadata_by_hashes(db: AsyncSession, file_hashes: Iterable[str]) -> Dict[str, models.FileMetadata]:
+    file_hashes = list(file_hashes)
+    if not file_hashes:
+        return {}
+    result = await db.execute(select(models.FileMetadata).filter(models.FileMetadata.file_hash.in_(file_hashes)))
+    by_hash = {}
+    for file_meta in result.scalars().all():
+        by_hash.setdefault(file_meta.file_hash, file_meta)
+    return by_hash
+
+async def create_file_metadata_bulk(
+    db: AsyncSession,
+    items: List[Tuple[schemas.FileMetadataCreate, str]],
+    download_base_url: Optional[str] = None
+) -> List[models.FileMetadata]:
+    if not items:
+        return []
+    db_file_metas = [
+        models.FileMetadata(
+            id=py_uuid.uuid4(),
+            original_filename=file_meta.original_filename,
+            file_hash=file_meta.file_hash,
+            mime_type=file_meta.mime_type,
+            size_bytes=file_meta.size_bytes,
+            storage_encoding=file_meta.storage_encoding,
+            stored_size_bytes=file_meta.stored_size_bytes,
+            file_location=file_location
+        )
+        for file_meta, file_location in items
+    ]
+    ids = [db_file_meta.id for db_file_meta in db_file_metas]
+    db.add_all(db_file_metas)
+    if download_base_url is not None:
+        db.add_all([build_file_stored_event(db_file_meta, download_base_url) for db_file_meta in db_file_metas])
+    await db.commit()
+    result = await db.execute(select(models.FileMetadata).filter(models.FileMetadata.id.in_(ids)))
+    by_id = {file_meta.id: file_meta for file_meta in result.scalars().all()}
+    return [by_id[file_id] for file_id in ids]
+
 async def get_file_content_location(db: AsyncSession, file_id: py_uuid.UUID) -> Optional[str]:
     file_meta = await get_file_metadata_by_id(db, file_id)
     if file_meta:
         return file_meta.file_location
-    return None
\ No newline at end of file
+    return None
+
+async def get_uncompressed_file_metadata(db: AsyncSession, limit: int, after_id: Optional[py_uuid.UUID] = None) -> List[models.FileMetadata]:
+    query = select(models.FileMetadata).filter(models.FileMetadata.storage_encoding.is_(None))
+    if after_id is not None:
+        query = query.filter(models.FileMetadata.id > after_id)
+    result = await db.execute(query.order_by(models.FileMetadata.id).limit(limit))
+    return result.scalars().all()
+
+async def update_file_storage(db: AsyncSession, file_id: py_uuid.UUID, file_location: str, storage_encoding: Optional[str], stored_size_bytes: int):
+    await db.execute(
+        update(models.FileMetadata)
+        .where(models.FileMetadata.id == file_id)
+        .values(file_location=file_location, storage_encoding=storage_encoding, stored_size_bytes=stored_size_bytes)
+    )
+    await db.commit()
+
+async def get_file_locations_with_prefix(db: AsyncSession, prefix: str) -> List[Tuple[py_uuid.UUID, str]]:
+    result = await db.execute(
+        select(models.FileMetadata.id, models.FileMetadata.file_location).filter(models.FileMetadata.file_location.startswith(prefix, autoescape=True))
+    )
+    return [(row.id, row.file_location) for row in result.all()]
+
+async def update_file_location(db: AsyncSession, file_id: py_uuid.UUID, file_location: str):
+    await db.execute(update(models.FileMetadata).where(models.FileMetadata.id == file_id).values(file_location=file_location))
+    await db.commit()
+
+async def claim_outbox_events(db: AsyncSession, limit: int) -> List[models.OutboxEvent]:
+    result = await db.execute(
+        select(models.OutboxEvent)
+        .filter(models.OutboxEvent.available_at <= datetime.utcnow())
+        .order_by(models.OutboxEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return result.scalars().all()
+
+async def delete_outbox_events(db: AsyncSession, event_ids: List[int]):
+    await db.execute(delete(models.OutboxEvent).where(models.OutboxEvent.id.in_(event_ids)))
+    await db.commit()
+
+async def reschedule_outbox_events(db: AsyncSession, events: List[models.OutboxEvent], error: str, base_delay: float, max_delay: float):
+    now = datetime.utcnow()
+    for event in events:
+        event.attempts += 1
+        event.last_error = error[:1000]
+        event.available_at = now + timedelta(seconds=min(max_delay, base_delay * 2 ** (event.attempts - 1)))
+    await db.commit()
+
+async def get_outbox_backlog(db: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    result = await db.execute(select(func.count(models.OutboxEvent.id), func.min(models.OutboxEvent.created_at)))
+    count, oldest = result.one()
+    return count, oldest
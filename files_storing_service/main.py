@@ -1,18 +1,56 @@
 import logging
-from fastapi import FastAPI
+from datetime import datetime
+from fastapi import Depends, FastAPI
 from contextlib import asynccontextmanager
 
-from database import engine
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from database import engine, get_db
 from models import Base
 from routers import files as files_router
+from routers import uploads as uploads_router
 from logging_config import get_logger
 from config import settings
+from storage import cleanup_staging, cleanup_expired_sessions
+from metadata_cache import metadata_cache
+from storage_backends import backend_for, close_storage_backends
+from outbox import outbox_dispatcher
 
 logger = get_logger(__name__)
 
-async def create_db_and_tables():
-    async with engine.begin() as conn:
+def add_missing_nullable_columns(sync_conn):
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns and column.nullable:
+                logger.info(f"Adding missing column {table.name}.{column.name}")
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"))
+
+def add_missing_unique_indexes(sync_conn):
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index["name"]: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if not index.unique or existing_indexes.get(index.name, {}).get("unique"):
+                continue
+            try:
+                with sync_conn.begin_nested():
+                    if index.name in existing_indexes:
+                        sync_conn.execute(text(f"DROP INDEX {index.name}"))
+                    index.create(sync_conn)
+                logger.info(f"Created unique index {index.name} on {table.name}")
+            except IntegrityError:
+                logger.error(f"Cannot make index {index.name} unique, {table.name} already holds duplicate values; deduplicate them and restart")
+
+async def create_db_and_tables(db_engine=engine):
+    async with db_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_nullable_columns)
+        await conn.run_sync(add_missing_unique_indexes)
     logger.info("Database tables created or already exist.")
 
 @asynccontextmanager
@@ -20,9 +58,19 @@ async def lifespan(app: FastAPI):
     logger.info("Files Storing Service starting up...")
     await create_db_and_tables()
     logger.info(f"File storage path configured at: {settings.STORAGE_BASE_PATH}")
+    backend_for(settings)
+    removed = cleanup_staging(settings.STORAGE_BASE_PATH, settings.STAGING_CLEANUP_MIN_AGE_SECONDS)
+    if removed:
+        logger.warning(f"Removed {removed} abandoned upload(s) older than {settings.STAGING_CLEANUP_MIN_AGE_SECONDS}s from staging")
+    expired = cleanup_expired_sessions(settings.STORAGE_BASE_PATH, settings.UPLOAD_SESSION_TTL_SECONDS)
+    if expired:
+        logger.info(f"Removed {expired} expired upload session(s)")
     logger.info(f"FAS URL for notifications: {settings.FAS_URL}")
+    outbox_dispatcher.start()
     yield
     logger.info("Files Storing Service shutting down...")
+    await outbox_dispatcher.stop()
+    await close_storage_backends()
 
 app = FastAPI(
     title="Files Storing Service",
@@ -30,12 +78,25 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.include_router(uploads_router.router)
 app.include_router(files_router.router)
 
 @app.get("/ping")
 async def ping():
     return {"ping": "pong! from FSS"}
 
+@app.get("/metrics")
+async def metrics(db: AsyncSession = Depends(get_db)):
+    backlog, oldest = await crud.get_outbox_backlog(db)
+    return {
+        "metadata_cache": metadata_cache.snapshot(),
+        "outbox": {
+            **outbox_dispatcher.snapshot(),
+            "backlog": backlog,
+            "oldest_pending_age_seconds": round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else None,
+        },
+    }
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Files Storing Service API"}
@@ -0,0 +1,129 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, schemas
+from config import settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_MISSING = object()
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class _Counters:
+    def __init__(self):
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+class MetadataCache:
+    def __init__(self, enabled: bool, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._by_id = _LRU(max_entries)
+        self._by_hash = _LRU(max_entries)
+        self._counters: Dict[str, _Counters] = {"id": _Counters(), "hash": _Counters()}
+
+    async def _lookup(self, kind: str, lru: _LRU, key: Hashable, load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[schemas.FileMetadataInDB]:
+        counters = self._counters[kind]
+        if self.enabled:
+            cached = lru.get(key)
+            if cached is not _MISSING:
+                if cached is None:
+                    counters.negative_hits += 1
+                else:
+                    counters.hits += 1
+                return cached
+        counters.misses += 1
+        db_file_meta = await load()
+        if db_file_meta is None:
+            if self.enabled:
+                lru.put(key, None, self.negative_ttl_seconds)
+            return None
+        return self.put(db_file_meta)
+
+    async def get_by_id(self, db: AsyncSession, file_id: uuid.UUID) -> Optional[schemas.FileMetadataInDB]:
+        return await self._lookup("id", self._by_id, file_id, lambda: crud.get_file_metadata_by_id(db, file_id=file_id))
+
+    async def get_by_hash(self, db: AsyncSession, file_hash: str) -> Optional[schemas.FileMetadataInDB]:
+        return await self._lookup("hash", self._by_hash, file_hash, lambda: crud.get_file_metadata_by_hash(db, file_hash=file_hash))
+
+    def put(self, db_file_meta) -> schemas.FileMetadataInDB:
+        file_meta = db_file_meta if isinstance(db_file_meta, schemas.FileMetadataInDB) else schemas.FileMetadataInDB.model_validate(db_file_meta)
+        if self.enabled:
+            self._by_id.put(file_meta.id, file_meta, self.ttl_seconds)
+            self._by_hash.put(file_meta.file_hash, file_meta, self.ttl_seconds)
+        return file_meta
+
+    def invalidate(self, file_meta: schemas.FileMetadataInDB):
+        logger.debug(f"Invalidating cached metadata for file {file_meta.id}")
+        self._by_id.pop(file_meta.id)
+        self._by_hash.pop(file_meta.file_hash)
+
+    def clear(self):
+        self._by_id.clear()
+        self._by_hash.clear()
+        self._counters = {"id": _Counters(), "hash": _Counters()}
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": {"id": len(self._by_id), "hash": len(self._by_hash)},
+            "evictions": self._by_id.evictions + self._by_hash.evictions,
+            "by_id": self._counters["id"].snapshot(),
+            "by_hash": self._counters["hash"].snapshot(),
+        }
+
+metadata_cache = MetadataCache(
+    settings.METADATA_CACHE_ENABLED,
+    settings.METADATA_CACHE_MAX_ENTRIES,
+    settings.METADATA_CACHE_TTL_SECONDS,
+    settings.METADATA_CACHE_NEGATIVE_TTL_SECONDS,
+)
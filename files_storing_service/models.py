@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 
@@ -12,11 +12,27 @@ class FileMetadata(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     original_filename = Column(String, nullable=False)
-    file_hash = Column(String, nullable=False, index=True)
+    file_hash = Column(String, nullable=False, unique=True, index=True)
     file_location = Column(String, nullable=False, unique=True)
     mime_type = Column(String, nullable=True)
     size_bytes = Column(Integer, nullable=False)
+    storage_encoding = Column(String, nullable=True)
+    stored_size_bytes = Column(Integer, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     def __repr__(self):
-        return f"<FileMetadata(id={self.id}, name='{self.original_filename}', hash='{self.file_hash}')>" 
\ No newline at end of file
+        return f"<FileMetadata(id={self.id}, name='{self.original_filename}', hash='{self.file_hash}')>"
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<OutboxEvent(id={self.id}, type='{self.event_type}', attempts={self.attempts})>"
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+
+import crud
+from config import settings
+from database import AsyncSessionLocal
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        session_factory,
+        fas_url: str,
+        batch_size: int,
+        poll_interval: float,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        self.session_factory = session_factory
+        self.fas_url = fas_url.rstrip("/")
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.client = client
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.delivered_total = 0
+        self.batches_total = 0
+        self.failed_batches_total = 0
+        self.last_lag_seconds: Optional[float] = None
+        self.max_lag_seconds = 0.0
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self.client
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def deliver(self, payloads: List[dict]):
+        client = self._client()
+        response = await client.post(f"{self.fas_url}/analysis/batch", json=payloads)
+        if response.status_code in (404, 405):
+            logger.warning(f"FAS has no batch analysis endpoint ({response.status_code}), notifying file by file")
+            for payload in payloads:
+                (await client.post(f"{self.fas_url}/analysis/", json=payload)).raise_for_status()
+            return
+        response.raise_for_status()
+
+    async def dispatch_once(self) -> int:
+        async with self.session_factory() as db:
+            events = await crud.claim_outbox_events(db, self.batch_size)
+            if not events:
+                return 0
+            event_ids = [event.id for event in events]
+            oldest = min(event.created_at for event in events)
+            try:
+                await self.deliver([event.payload for event in events])
+            except httpx.HTTPError as e:
+                self.failed_batches_total += 1
+                error = f"{type(e).__name__}: {str(e)}"
+                logger.warning(f"Delivering {len(events)} outbox event(s) to FAS failed, will retry: {error}")
+                await crud.reschedule_outbox_events(db, events, error, self.retry_base_delay, self.retry_max_delay)
+                return 0
+            await crud.delete_outbox_events(db, event_ids)
+        self.batches_total += 1
+        self.delivered_total += len(event_ids)
+        self.last_lag_seconds = (datetime.utcnow() - oldest).total_seconds()
+        self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+        logger.info(f"Delivered {len(event_ids)} outbox event(s) to FAS, lag {self.last_lag_seconds:.3f}s")
+        return len(event_ids)
+
+    async def run(self):
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except Exception:
+                logger.exception("Outbox dispatch round failed")
+                delivered = 0
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+        logger.info(f"Outbox dispatcher started: batch_size={self.batch_size}, poll_interval={self.poll_interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def snapshot(self) -> dict:
+        return {
+            "delivered_total": self.delivered_total,
+            "batches_total": self.batches_total,
+            "failed_batches_total": self.failed_batches_total,
+            "last_lag_seconds": round(self.last_lag_seconds, 4) if self.last_lag_seconds is not None else None,
+            "max_lag_seconds": round(self.max_lag_seconds, 4),
+        }
+
+outbox_dispatcher = OutboxDispatcher(
+    AsyncSessionLocal,
+    settings.FAS_URL,
+    settings.FAS_NOTIFY_BATCH_SIZE,
+    settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    settings.OUTBOX_RETRY_BASE_SECONDS,
+    settings.OUTBOX_RETRY_MAX_SECONDS,
+    timeout=settings.FAS_NOTIFY_TIMEOUT_SECONDS,
+    max_connections=settings.FAS_NOTIFY_MAX_CONNECTIONS
+)
@@ -1,15 +1,21 @@
-import shutil
-import hashlib
+import secrets
 import uuid
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import quote
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Query
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
-import aiofiles
 
-import crud, schemas
+import compression, crud, schemas, storage, storage_backends
+from metadata_cache import metadata_cache
+from outbox import outbox_dispatcher
 from database import get_db
 from config import settings as global_app_settings, Settings 
 from logging_config import get_logger
@@ -26,131 +32,418 @@ if not global_app_settings.STORAGE_BASE_PATH.exists():
 else:
     logger.info(f"File storage directory already exists at {global_app_settings.STORAGE_BASE_PATH}")
 
-def calculate_sha256(file_content: bytes) -> str:
-    sha256_hash = hashlib.sha256()
-    sha256_hash.update(file_content)
-    return sha256_hash.hexdigest()
-
 def get_settings():
     return global_app_settings
 
-async def notify_fas_of_new_file(
-    file_id: uuid.UUID,
-    file_download_url: str,
+def get_storage_backend(current_settings: Settings = Depends(get_settings)) -> storage_backends.StorageBackend:
+    return storage_backends.backend_for(current_settings)
+
+MAX_BYTE_RANGES = 100
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def is_not_modified(request: Request, uploaded_at: datetime, *etags: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return any(candidate.strip().removeprefix("W/") in etags for candidate in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if uploaded_at.tzinfo is None:
+        uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+    return uploaded_at.replace(microsecond=0) <= since
+
+def content_disposition(filename: str) -> str:
+    quoted_filename = quote(filename)
+    if quoted_filename != filename:
+        return f"attachment; filename*=utf-8''{quoted_filename}"
+    return f'attachment; filename="{filename}"'
+
+def download_base_url(request: Request) -> str:
+    return str(request.base_url.replace(path="")).rstrip("/")
+
+async def commit_with_configured_compression(
+    staged: storage.StagedFile,
+    mime_type: Optional[str],
+    current_settings: Settings,
+    backend: storage_backends.StorageBackend
+) -> storage.StoredFile:
+    encoding = compression.choose_encoding(
+        current_settings.STORAGE_COMPRESSION, mime_type, staged.size_bytes,
+        current_settings.STORAGE_COMPRESSION_MIME_TYPES, current_settings.STORAGE_COMPRESSION_MIN_BYTES
+    )
+    return await storage.commit_staged(
+        staged, current_settings.STORAGE_BASE_PATH, backend, encoding,
+        current_settings.STORAGE_COMPRESSION_LEVEL, current_settings.UPLOAD_CHUNK_SIZE
+    )
+
+async def store_staged_file(
+    db: AsyncSession,
+    staged: storage.StagedFile,
     original_filename: str,
-    mime_type: str,
-    fas_url: str
+    mime_type: Optional[str],
+    request: Request,
+    current_settings: Settings,
+    backend: storage_backends.StorageBackend,
+    discard_on_error: bool = True
 ):
-    fas_trigger_url = f"{fas_url.rstrip('/')}/analysis/"
-    payload = {
-        "file_id": str(file_id),
-        "file_location": file_download_url,
-        "original_filename": original_filename,
-        "mime_type": mime_type
-    }
-    logger.info(f"Notifying FAS at {fas_trigger_url} for file_id: {file_id}")
+    file_hash = staged.file_hash
+    existing_file_meta = await metadata_cache.get_by_hash(db, file_hash)
+    if existing_file_meta:
+        storage.discard_staged(staged)
+        logger.info(f"File with hash {file_hash} (original: '{existing_file_meta.original_filename}') already exists. Returning existing metadata.")
+        return existing_file_meta
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(fas_trigger_url, json=payload)
-            response.raise_for_status()
-            logger.info(f"Successfully notified FAS for file_id: {file_id}. Response: {response.json()}")
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Error notifying FAS for file_id: {file_id}. Status: {e.response.status_code}, Response: {e.response.text}")
-    except httpx.RequestError as e:
-        logger.error(f"Error notifying FAS for file_id: {file_id}. Request failed: {str(e)}")
+        stored = await commit_with_configured_compression(staged, mime_type, current_settings, backend)
     except Exception as e:
-        logger.exception(f"An unexpected error occurred while notifying FAS for file_id: {file_id}")
+        if discard_on_error:
+            storage.discard_staged(staged)
+        logger.exception(f"Error moving file '{original_filename}' into storage")
+        raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+    logger.info(f"Saved new file '{original_filename}' to {stored.location} ({backend.name} storage)")
+
+    file_meta_create = schemas.FileMetadataCreate(
+        original_filename=original_filename,
+        file_hash=file_hash,
+        mime_type=mime_type,
+        size_bytes=staged.size_bytes,
+        storage_encoding=stored.storage_encoding,
+        stored_size_bytes=stored.stored_size_bytes
+    )
+    try:
+        db_file_meta = metadata_cache.put(await crud.create_file_metadata(
+            db, file_meta=file_meta_create, file_location=stored.location, download_base_url=download_base_url(request)
+        ))
+    except IntegrityError:
+        await db.rollback()
+        existing_file_meta = await crud.get_file_metadata_by_hash(db, file_hash=file_hash)
+        if existing_file_meta is None:
+            raise
+        logger.info(f"File with hash {file_hash} was stored concurrently as {existing_file_meta.id}. Returning existing metadata.")
+        if existing_file_meta.file_location != stored.location:
+            await backend.delete(stored.location)
+        return metadata_cache.put(existing_file_meta)
+    logger.info(f"Saved '{db_file_meta.original_filename}' (ID: {db_file_meta.id}) metadata and FAS notification to DB.")
+    outbox_dispatcher.wake()
+
+    return db_file_meta
+
+@router.post("/uploads/check", response_model=schemas.FileHashCheckResponse)
+async def check_file_hash(
+    check_request: schemas.FileHashCheckRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Hash check for {check_request.file_hash} ({check_request.size_bytes} bytes)")
+    existing_file_meta = await metadata_cache.get_by_hash(db, check_request.file_hash)
+    if existing_file_meta is None:
+        logger.debug(f"Hash {check_request.file_hash} is unknown, client should upload the content")
+        return schemas.FileHashCheckResponse(exists=False)
+    if existing_file_meta.size_bytes != check_request.size_bytes:
+        logger.warning(f"Hash check for {check_request.file_hash}: size {check_request.size_bytes} does not match stored size {existing_file_meta.size_bytes}")
+        raise HTTPException(status_code=409, detail="Size does not match stored content with this hash")
+    logger.info(f"Hash {check_request.file_hash} already stored as file {existing_file_meta.id}, upload skipped")
+    return schemas.FileHashCheckResponse(exists=True, file=existing_file_meta)
 
 @router.post("/upload", response_model=schemas.FileMetadataInDB)
 async def upload_file(
     request: Request,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    expected_sha256: Optional[str] = Query(None, pattern=schemas.SHA256_PATTERN),
     db: AsyncSession = Depends(get_db),
-    current_settings: Settings = Depends(get_settings)
+    current_settings: Settings = Depends(get_settings),
+    backend: storage_backends.StorageBackend = Depends(get_storage_backend)
 ):
     logger.info(f"Upload request for filename: '{file.filename}', content_type: '{file.content_type}'")
-    content = await file.read()
-    await file.seek(0)
-    file_hash = hashlib.sha256(content).hexdigest()
-    logger.debug(f"Calculated hash for '{file.filename}': {file_hash}")
-
-    existing_file_meta = await crud.get_file_metadata_by_hash(db, file_hash=file_hash)
-    if existing_file_meta:
-        logger.info(f"File with hash {file_hash} (original: '{existing_file_meta.original_filename}') already exists. Returning existing metadata.")
-        return existing_file_meta
-
-    hash_prefix = file_hash[:2]
-    storage_dir = current_settings.STORAGE_BASE_PATH / hash_prefix
-    storage_dir.mkdir(parents=True, exist_ok=True)
-    local_file_path = storage_dir / file_hash 
-
-    logger.info(f"Saving new file '{file.filename}' to {local_file_path} (base: {current_settings.STORAGE_BASE_PATH})")
     try:
-        async with aiofiles.open(local_file_path, 'wb') as out_file:
-            while chunk := await file.read(1024*1024):
-                await out_file.write(chunk)
+        staged = await storage.stage_upload(file, current_settings.STORAGE_BASE_PATH, current_settings.UPLOAD_CHUNK_SIZE)
     except Exception as e:
-        logger.exception(f"Error saving file '{file.filename}' to {local_file_path}")
+        logger.exception(f"Error receiving file '{file.filename}'")
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
     finally:
         await file.close()
+    file_hash = staged.file_hash
+    logger.debug(f"Calculated hash for '{file.filename}': {file_hash} ({staged.size_bytes} bytes)")
+    if expected_sha256 is not None and expected_sha256 != file_hash:
+        storage.discard_staged(staged)
+        logger.warning(f"Upload of '{file.filename}' failed verification: expected {expected_sha256}, got {file_hash}")
+        raise HTTPException(status_code=400, detail="Uploaded content does not match expected SHA-256")
 
-    file_meta_create = schemas.FileMetadataCreate(
-        original_filename=file.filename,
-        file_hash=file_hash,
-        mime_type=file.content_type,
-        size_bytes=file.size if file.size else len(content)
+    return await store_staged_file(db, staged, file.filename, file.content_type, request, current_settings, backend)
+
+@router.post("/upload/batch", response_model=schemas.FileBatchUploadResponse)
+async def upload_files_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_settings: Settings = Depends(get_settings),
+    backend: storage_backends.StorageBackend = Depends(get_storage_backend)
+):
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data with one or more 'files' parts")
+    base_path = current_settings.STORAGE_BASE_PATH
+    try:
+        parts = await storage.stage_multipart_files(request.stream(), content_type, base_path, "files", current_settings.BATCH_UPLOAD_MAX_FILES)
+    except storage.InvalidMultipart as e:
+        logger.warning(f"Rejected batch upload: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Batch upload received {len(parts)} file(s)")
+
+    existing_by_hash = {
+        file_hash: schemas.FileMetadataInDB.model_validate(file_meta)
+        for file_hash, file_meta in (await crud.get_file_metadata_by_hashes(db, {part.staged.file_hash for part in parts})).items()
+    }
+    outcomes = []
+    to_create = []
+    new_hashes = set()
+    for part in parts:
+        file_hash = part.staged.file_hash
+        if file_hash in existing_by_hash:
+            storage.discard_staged(part.staged)
+            outcomes.append((part, "existing", None))
+        elif file_hash in new_hashes:
+            storage.discard_staged(part.staged)
+            outcomes.append((part, "duplicate", None))
+        else:
+            try:
+                stored = await commit_with_configured_compression(part.staged, part.content_type, current_settings, backend)
+            except Exception as e:
+                storage.discard_staged(part.staged)
+                logger.exception(f"Error moving batch file '{part.filename}' into storage")
+                outcomes.append((part, "failed", str(e)))
+                continue
+            new_hashes.add(file_hash)
+            to_create.append((schemas.FileMetadataCreate(
+                original_filename=part.filename,
+                file_hash=file_hash,
+                mime_type=part.content_type,
+                size_bytes=part.staged.size_bytes,
+                storage_encoding=stored.storage_encoding,
+                stored_size_bytes=stored.stored_size_bytes
+            ), stored.location))
+            outcomes.append((part, "created", None))
+
+    try:
+        created = await crud.create_file_metadata_bulk(db, to_create, download_base_url(request))
+    except IntegrityError:
+        await db.rollback()
+        concurrent = await crud.get_file_metadata_by_hashes(db, {file_meta.file_hash for file_meta, _ in to_create})
+        logger.warning(f"Batch upload raced with {len(concurrent)} concurrent insert(s), retrying without them")
+        existing_by_hash.update({file_hash: schemas.FileMetadataInDB.model_validate(file_meta) for file_hash, file_meta in concurrent.items()})
+        for file_meta, file_location in to_create:
+            if file_meta.file_hash in concurrent and concurrent[file_meta.file_hash].file_location != file_location:
+                await backend.delete(file_location)
+        created = await crud.create_file_metadata_bulk(db, [item for item in to_create if item[0].file_hash not in concurrent], download_base_url(request))
+    created = [metadata_cache.put(file_meta) for file_meta in created]
+    metadata_by_hash = {**existing_by_hash, **{file_meta.file_hash: file_meta for file_meta in created}}
+    logger.info(f"Batch upload stored {len(created)} new file(s) in one transaction, {len(parts) - len(created)} deduplicated or failed")
+
+    if created:
+        outbox_dispatcher.wake()
+
+    items = [
+        schemas.FileBatchUploadItem(
+            filename=part.filename,
+            status=status,
+            file=metadata_by_hash.get(part.staged.file_hash) if status != "failed" else None,
+            error=error
+        )
+        for part, status, error in outcomes
+    ]
+    counts = {status: sum(1 for item in items if item.status == status) for status in ("created", "existing", "duplicate", "failed")}
+    return schemas.FileBatchUploadResponse(
+        created=counts["created"],
+        existing=counts["existing"],
+        duplicates=counts["duplicate"],
+        failed=counts["failed"],
+        files=items
     )
-    relative_file_path = local_file_path.relative_to(current_settings.STORAGE_BASE_PATH)
-    db_file_meta = await crud.create_file_metadata(db, file_meta=file_meta_create, file_location=str(relative_file_path))
-    logger.info(f"Saved '{db_file_meta.original_filename}' (ID: {db_file_meta.id}) metadata to DB.")
-
-    file_download_url = str(request.base_url.replace(path=f"/{db_file_meta.id}/download"))
-    
-    background_tasks.add_task(
-        notify_fas_of_new_file,
-        db_file_meta.id,
-        file_download_url,
-        db_file_meta.original_filename,
-        db_file_meta.mime_type,
-        current_settings.FAS_URL
+
+async def get_stored_file_metadata(db: AsyncSession, file_id: uuid.UUID, backend: storage_backends.StorageBackend) -> Optional[schemas.FileMetadataInDB]:
+    file_meta = await metadata_cache.get_by_id(db, file_id)
+    if file_meta is not None and backend.known_missing(file_meta.file_location):
+        logger.info(f"Cached location {file_meta.file_location} of file {file_id} is gone, reloading metadata")
+        metadata_cache.invalidate(file_meta)
+        file_meta = await metadata_cache.get_by_id(db, file_id)
+    return file_meta
+
+def parse_byte_ranges(range_header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    specs = range_header[len("bytes="):].split(",")
+    if len(specs) > MAX_BYTE_RANGES:
+        return None
+    requested = []
+    for spec in specs:
+        first, _, last = spec.strip().partition("-")
+        try:
+            if not first:
+                start, end = max(0, size - int(last)), size - 1
+            else:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+                if last and int(last) < start:
+                    return None
+        except ValueError:
+            return None
+        if start <= end:
+            requested.append((start, end))
+    if not requested:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"content-range": f"bytes */{size}"})
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(requested):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def stream_stored_object(stored_object: storage_backends.StoredObject, media_type: Optional[str], headers: dict, status_code: int = 200) -> StreamingResponse:
+    return StreamingResponse(
+        stored_object.chunks,
+        status_code=status_code,
+        media_type=media_type,
+        headers={**headers, "content-length": str(stored_object.size)},
+        background=BackgroundTask(stored_object.aclose)
     )
-    logger.info(f"Background task added to notify FAS for file '{db_file_meta.original_filename}' (ID: {db_file_meta.id}).")
 
-    return db_file_meta
+def stream_byte_ranges(
+    first_object: storage_backends.StoredObject,
+    backend: storage_backends.StorageBackend,
+    location: str,
+    byte_ranges: List[Tuple[int, int]],
+    size: int,
+    media_type: Optional[str],
+    headers: dict,
+    chunk_size: int
+) -> StreamingResponse:
+    boundary = secrets.token_hex(13)
+    part_type = media_type or "application/octet-stream"
+    if part_type.startswith("text/") and "charset=" not in part_type:
+        part_type += "; charset=utf-8"
+    part_headers = [
+        f"--{boundary}\r\nContent-Type: {part_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n".encode("latin-1")
+        for start, end in byte_ranges
+    ]
+    closing = f"--{boundary}--".encode("latin-1")
+    content_length = sum(len(part) + end - start + 3 for part, (start, end) in zip(part_headers, byte_ranges)) + len(closing)
+
+    async def body() -> AsyncIterator[bytes]:
+        stored_object = first_object
+        try:
+            for index, (start, end) in enumerate(byte_ranges):
+                if index:
+                    await stored_object.aclose()
+                    stored_object = await backend.get(location, start, end, chunk_size)
+                yield part_headers[index]
+                async for chunk in stored_object.chunks:
+                    yield chunk
+                yield b"\r\n"
+            yield closing
+        finally:
+            await stored_object.aclose()
+
+    return StreamingResponse(
+        body(),
+        status_code=206,
+        headers={**headers, "content-type": f"multipart/byteranges; boundary={boundary}", "content-length": str(content_length)},
+        background=BackgroundTask(first_object.aclose)
+    )
 
 @router.get("/{file_id}/download")
 async def download_file(
     file_id: uuid.UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    current_settings: Settings = Depends(get_settings)
+    current_settings: Settings = Depends(get_settings),
+    backend: storage_backends.StorageBackend = Depends(get_storage_backend)
 ):
     logger.info(f"Download request for file_id: {file_id}")
-    file_meta = await crud.get_file_metadata_by_id(db, file_id=file_id)
+    file_meta = await get_stored_file_metadata(db, file_id, backend)
     if not file_meta:
         logger.warning(f"File not found for download: ID {file_id}")
         raise HTTPException(status_code=404, detail="File not found")
 
-    file_path_on_disk = current_settings.STORAGE_BASE_PATH / file_meta.file_location
-    logger.debug(f"Serving file from path: {file_path_on_disk} for file_id: {file_id}")
+    encoding = file_meta.storage_encoding if file_meta.storage_encoding not in (None, "identity") else None
+    identity_etag = f'"{file_meta.file_hash}"'
+    encoded_etag = f'"{file_meta.file_hash}-{encoding}"' if encoding else None
+    serve_encoded = (
+        encoding is not None
+        and request.headers.get("range") is None
+        and compression.accepts_encoding(request.headers.get("accept-encoding"), encoding)
+    )
+    cache_headers = {"etag": encoded_etag if serve_encoded else identity_etag, "cache-control": IMMUTABLE_CACHE_CONTROL}
+    if encoding:
+        cache_headers["vary"] = "Accept-Encoding"
+    if is_not_modified(request, file_meta.uploaded_at, identity_etag, encoded_etag):
+        logger.debug(f"Conditional download for file_id: {file_id} matched, returning 304")
+        return Response(status_code=304, headers=cache_headers)
+
+    logger.debug(f"Serving {file_meta.file_location} from {backend.name} storage for file_id: {file_id} (storage_encoding={file_meta.storage_encoding})")
+    if serve_encoded:
+        cache_headers["content-encoding"] = encoding
+    file_path_on_disk = backend.local_path(file_meta.file_location)
+    if file_path_on_disk is not None and (serve_encoded or encoding is None):
+        return FileResponse(
+            path=file_path_on_disk,
+            filename=file_meta.original_filename,
+            media_type=file_meta.mime_type,
+            headers=cache_headers
+        )
 
-    if not file_path_on_disk.exists() or not file_path_on_disk.is_file():
-        logger.error(f"File for ID {file_id} found in DB (location: {file_meta.file_location}) but not in storage at {file_path_on_disk}. Inconsistency!")
+    cache_headers["content-disposition"] = content_disposition(file_meta.original_filename)
+    byte_ranges = None
+    if encoding is None:
+        cache_headers["accept-ranges"] = "bytes"
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == identity_etag:
+            byte_ranges = parse_byte_ranges(request.headers.get("range"), file_meta.size_bytes)
+    try:
+        if byte_ranges is not None:
+            first, last = byte_ranges[0]
+            stored_object = await backend.get(file_meta.file_location, first, last, current_settings.UPLOAD_CHUNK_SIZE)
+        else:
+            stored_object = await backend.get(file_meta.file_location, chunk_size=current_settings.UPLOAD_CHUNK_SIZE)
+    except FileNotFoundError:
+        logger.error(f"File for ID {file_id} found in DB (location: {file_meta.file_location}) but not in {backend.name} storage. Inconsistency!")
         raise HTTPException(status_code=500, detail="File found in DB but not in storage. Inconsistency.")
+    except (storage_backends.StorageError, httpx.HTTPError) as e:
+        logger.error(f"Storage backend failed to read {file_meta.file_location} for file_id {file_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Storage backend unavailable")
 
-    return FileResponse(
-        path=file_path_on_disk,
-        filename=file_meta.original_filename,
-        media_type=file_meta.mime_type
-    )
+    if encoding is not None and not serve_encoded:
+        logger.debug(f"Client does not accept {encoding}, decompressing file_id: {file_id} on the fly")
+        return StreamingResponse(
+            compression.iter_decompressed(stored_object.chunks, encoding),
+            media_type=file_meta.mime_type,
+            headers={**cache_headers, "content-length": str(file_meta.size_bytes)},
+            background=BackgroundTask(stored_object.aclose)
+        )
+    if byte_ranges is not None and len(byte_ranges) > 1:
+        logger.debug(f"Serving {len(byte_ranges)} byte ranges of file_id: {file_id} as multipart/byteranges")
+        return stream_byte_ranges(
+            stored_object, backend, file_meta.file_location, byte_ranges, file_meta.size_bytes,
+            file_meta.mime_type, cache_headers, current_settings.UPLOAD_CHUNK_SIZE
+        )
+    if byte_ranges is not None:
+        first, last = byte_ranges[0]
+        cache_headers["content-range"] = f"bytes {first}-{last}/{file_meta.size_bytes}"
+        return stream_stored_object(stored_object, file_meta.mime_type, cache_headers, status_code=206)
+    return stream_stored_object(stored_object, file_meta.mime_type, cache_headers)
 
 @router.get("/{file_id}/metadata", response_model=schemas.FileMetadataInDB)
 async def get_file_metadata_endpoint(
     file_id: uuid.UUID,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    backend: storage_backends.StorageBackend = Depends(get_storage_backend)
 ):
-    file_meta = await crud.get_file_metadata_by_id(db, file_id=file_id)
+    file_meta = await get_stored_file_metadata(db, file_id, backend)
     if not file_meta:
         raise HTTPException(status_code=404, detail="File metadata not found")
-    return file_meta 
\ No newline at end of file
+    return file_meta
@@ -0,0 +1,132 @@
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import schemas, storage, storage_backends
+from database import get_db
+from config import Settings
+from logging_config import get_logger
+from routers.files import get_settings, get_storage_backend, store_staged_file
+
+logger = get_logger(__name__)
+
+router = APIRouter(
+    prefix="/uploads/sessions",
+    tags=["uploads"],
+)
+
+def build_session_status(session_id: uuid.UUID, session_info: dict, current_settings: Settings) -> schemas.UploadSessionStatus:
+    ranges = storage.received_ranges(current_settings.STORAGE_BASE_PATH, session_id)
+    received_bytes = sum(end - start for start, end in ranges)
+    return schemas.UploadSessionStatus(
+        session_id=session_id,
+        original_filename=session_info["original_filename"],
+        mime_type=session_info["mime_type"],
+        size_bytes=session_info["size_bytes"],
+        chunk_size=current_settings.UPLOAD_SESSION_CHUNK_SIZE,
+        received=[[start, end] for start, end in ranges],
+        received_bytes=received_bytes,
+        complete=received_bytes == session_info["size_bytes"],
+    )
+
+def get_session_or_404(session_id: uuid.UUID, current_settings: Settings) -> dict:
+    session_info = storage.load_session(current_settings.STORAGE_BASE_PATH, session_id)
+    if session_info is None and storage.is_session_finalizing(current_settings.STORAGE_BASE_PATH, session_id):
+        raise HTTPException(status_code=409, detail="Upload session is being finalized")
+    if session_info is None:
+        logger.warning(f"Upload session {session_id} not found")
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session_info
+
+@router.post("", response_model=schemas.UploadSessionStatus, status_code=201)
+async def create_upload_session(
+    session_request: schemas.UploadSessionCreate,
+    current_settings: Settings = Depends(get_settings)
+):
+    if session_request.size_bytes > current_settings.UPLOAD_SESSION_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Declared size exceeds the limit of {current_settings.UPLOAD_SESSION_MAX_BYTES} bytes")
+    session_id = uuid.uuid4()
+    session_info = storage.create_session(current_settings.STORAGE_BASE_PATH, session_id, session_request.model_dump())
+    logger.info(f"Created upload session {session_id} for '{session_request.original_filename}' ({session_request.size_bytes} bytes)")
+    return build_session_status(session_id, session_info, current_settings)
+
+@router.get("/{session_id}", response_model=schemas.UploadSessionStatus)
+async def get_upload_session(
+    session_id: uuid.UUID,
+    current_settings: Settings = Depends(get_settings)
+):
+    session_info = get_session_or_404(session_id, current_settings)
+    return build_session_status(session_id, session_info, current_settings)
+
+@router.put("/{session_id}", response_model=schemas.UploadSessionStatus)
+async def upload_session_chunk(
+    session_id: uuid.UUID,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_settings: Settings = Depends(get_settings)
+):
+    session_info = get_session_or_404(session_id, current_settings)
+    try:
+        written = await storage.write_session_chunk(
+            current_settings.STORAGE_BASE_PATH, session_id, session_info["size_bytes"], offset, request.stream()
+        )
+    except storage.ChunkOutOfBounds as e:
+        logger.warning(f"Upload session {session_id}: {str(e)}")
+        raise HTTPException(status_code=416, detail=str(e))
+    except storage.SessionBusy as e:
+        logger.warning(f"Rejected chunk for upload session {session_id}: {str(e)}")
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    logger.debug(f"Upload session {session_id}: wrote {written} bytes at offset {offset}")
+    return build_session_status(session_id, session_info, current_settings)
+
+@router.post("/{session_id}/finalize", response_model=schemas.FileMetadataInDB)
+async def finalize_upload_session(
+    session_id: uuid.UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_settings: Settings = Depends(get_settings),
+    backend: storage_backends.StorageBackend = Depends(get_storage_backend)
+):
+    base_path = current_settings.STORAGE_BASE_PATH
+    session_info = get_session_or_404(session_id, current_settings)
+    status = build_session_status(session_id, session_info, current_settings)
+    if not status.complete:
+        logger.warning(f"Upload session {session_id} finalized with {status.received_bytes}/{status.size_bytes} bytes received")
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {status.received_bytes} of {status.size_bytes} bytes received")
+    try:
+        storage.lock_session(base_path, session_id)
+    except storage.SessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    finalized = False
+    try:
+        staged = await storage.stage_session(base_path, session_id, session_info["size_bytes"], current_settings.UPLOAD_CHUNK_SIZE)
+        expected_sha256 = session_info.get("expected_sha256")
+        if expected_sha256 is not None and expected_sha256 != staged.file_hash:
+            logger.warning(f"Upload session {session_id} failed verification: expected {expected_sha256}, got {staged.file_hash}")
+            raise HTTPException(status_code=400, detail="Uploaded content does not match expected SHA-256")
+        logger.info(f"Upload session {session_id} assembled: {staged.size_bytes} bytes, hash {staged.file_hash}")
+        file_meta = await store_staged_file(
+            db, staged, session_info["original_filename"], session_info["mime_type"], request, current_settings, backend,
+            discard_on_error=False
+        )
+        finalized = True
+        return file_meta
+    finally:
+        if finalized or not storage.has_session_data(base_path, session_id):
+            storage.delete_session(base_path, session_id)
+        else:
+            storage.unlock_session(base_path, session_id)
+            logger.info(f"Upload session {session_id} kept after failed finalize, client may retry")
+
+@router.delete("/{session_id}", status_code=204)
+async def abort_upload_session(
+    session_id: uuid.UUID,
+    current_settings: Settings = Depends(get_settings)
+):
+    get_session_or_404(session_id, current_settings)
+    storage.delete_session(current_settings.STORAGE_BASE_PATH, session_id)
+    logger.info(f"Upload session {session_id} aborted")
@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 class FileMetadataBase(BaseModel):
     original_filename: str
@@ -11,11 +11,52 @@ class FileMetadataBase(BaseModel):
     size_bytes: int
 
 class FileMetadataCreate(FileMetadataBase):
-    pass
+    storage_encoding: Optional[str] = None
+    stored_size_bytes: Optional[int] = None
 
 class FileMetadataInDB(FileMetadataBase):
     id: uuid.UUID
     file_location: str
+    storage_encoding: Optional[str] = None
     uploaded_at: datetime
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+SHA256_PATTERN = r"^[0-9a-f]{64}$"
+
+class FileHashCheckRequest(BaseModel):
+    file_hash: str = Field(..., pattern=SHA256_PATTERN)
+    size_bytes: int = Field(..., ge=0)
+
+class FileHashCheckResponse(BaseModel):
+    exists: bool
+    file: Optional[FileMetadataInDB] = None
+
+class UploadSessionCreate(BaseModel):
+    original_filename: str
+    mime_type: Optional[str] = None
+    size_bytes: int = Field(..., ge=0)
+    expected_sha256: Optional[str] = Field(None, pattern=SHA256_PATTERN)
+
+class UploadSessionStatus(BaseModel):
+    session_id: uuid.UUID
+    original_filename: str
+    mime_type: Optional[str] = None
+    size_bytes: int
+    chunk_size: int
+    received: List[List[int]]
+    received_bytes: int
+    complete: bool
+
+class FileBatchUploadItem(BaseModel):
+    filename: str
+    status: str
+    file: Optional[FileMetadataInDB] = None
+    error: Optional[str] = None
+
+class FileBatchUploadResponse(BaseModel):
+    created: int
+    existing: int
+    duplicates: int
+    failed: int
+    files: List[FileBatchUploadItem]
@@ -0,0 +1,347 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+import compression
+from logging_config import get_logger
+from storage_backends import StorageBackend
+
+logger = get_logger(__name__)
+
+STAGING_DIR_NAME = ".incoming"
+SESSIONS_DIR_NAME = ".sessions"
+
+class StagedFile(NamedTuple):
+    temp_path: Path
+    file_hash: str
+    size_bytes: int
+
+def shard_key(file_hash: str, suffix: str = "") -> str:
+    return f"{file_hash[:2]}/{file_hash}{suffix}"
+
+def staging_dir(base_path: Path) -> Path:
+    return base_path / STAGING_DIR_NAME
+
+class StagingWriter:
+    def __init__(self, base_path: Path):
+        temp_dir = staging_dir(base_path)
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        self.temp_path = temp_dir / f"{uuid.uuid4().hex}.part"
+        self._hash = hashlib.sha256()
+        self._size_bytes = 0
+        self._file = None
+
+    async def open(self):
+        self._file = await aiofiles.open(self.temp_path, 'wb')
+
+    async def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._size_bytes += len(chunk)
+        await self._file.write(chunk)
+
+    async def finish(self) -> StagedFile:
+        await self._file.flush()
+        await asyncio.to_thread(os.fsync, self._file.fileno())
+        await self._file.close()
+        self._file = None
+        return StagedFile(self.temp_path, self._hash.hexdigest(), self._size_bytes)
+
+    async def discard(self):
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        self.temp_path.unlink(missing_ok=True)
+
+async def stage_upload(file: UploadFile, base_path: Path, chunk_size: int) -> StagedFile:
+    writer = StagingWriter(base_path)
+    try:
+        await writer.open()
+        while chunk := await file.read(chunk_size):
+            await writer.write(chunk)
+        return await writer.finish()
+    except BaseException:
+        await writer.discard()
+        raise
+
+class StagedPart(NamedTuple):
+    filename: str
+    content_type: Optional[str]
+    staged: StagedFile
+
+class InvalidMultipart(ValueError):
+    pass
+
+async def stage_multipart_files(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    base_path: Path,
+    field_name: str,
+    max_files: int
+) -> List[StagedPart]:
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise InvalidMultipart("Missing multipart boundary")
+
+    events = []
+    header_field = bytearray()
+    header_value = bytearray()
+    part_headers = {}
+
+    def on_part_begin():
+        part_headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part_headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", dict(part_headers)))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    staged_parts: List[StagedPart] = []
+    writer: Optional[StagingWriter] = None
+    part_info = None
+    try:
+        async for chunk in chunks:
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise InvalidMultipart(str(e))
+            for kind, payload in events:
+                if kind == "headers":
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    filename = disposition.get(b"filename")
+                    if disposition.get(b"name", b"").decode("utf-8") != field_name or filename is None:
+                        part_info = None
+                        continue
+                    if len(staged_parts) >= max_files:
+                        raise InvalidMultipart(f"Too many files, maximum is {max_files}")
+                    part_content_type = payload.get(b"content-type")
+                    part_info = (filename.decode("utf-8"), part_content_type.decode("latin-1") if part_content_type else None)
+                    writer = StagingWriter(base_path)
+                    await writer.open()
+                elif kind == "data" and writer is not None:
+                    await writer.write(payload)
+                elif kind == "end" and writer is not None:
+                    staged_parts.append(StagedPart(part_info[0], part_info[1], await writer.finish()))
+                    writer = None
+            events.clear()
+        parser.finalize()
+        if writer is not None:
+            raise InvalidMultipart("Multipart body ended in the middle of a file")
+    except BaseException:
+        if writer is not None:
+            await writer.discard()
+        for part in staged_parts:
+            discard_staged(part.staged)
+        raise
+    return staged_parts
+
+class StoredFile(NamedTuple):
+    location: str
+    storage_encoding: Optional[str]
+    stored_size_bytes: int
+
+async def compress_in_staging(source: Path, base_path: Path, encoding: str, level: int, chunk_size: int) -> Tuple[Path, int]:
+    temp_dir = staging_dir(base_path)
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    compressed_path = temp_dir / f"{uuid.uuid4().hex}{compression.ENCODING_SUFFIXES[encoding]}.part"
+    try:
+        compressed_size = await asyncio.to_thread(compression.compress_file, source, compressed_path, encoding, level, chunk_size)
+    except BaseException:
+        compressed_path.unlink(missing_ok=True)
+        raise
+    return compressed_path, compressed_size
+
+async def commit_staged(
+    staged: StagedFile,
+    base_path: Path,
+    backend: StorageBackend,
+    encoding: Optional[str] = None,
+    level: int = 3,
+    chunk_size: int = 1024 * 1024
+) -> StoredFile:
+    if encoding is not None:
+        compressed_path, compressed_size = await compress_in_staging(staged.temp_path, base_path, encoding, level, chunk_size)
+        if compressed_size < staged.size_bytes:
+            try:
+                key = await backend.put_file(compressed_path, shard_key(staged.file_hash, compression.ENCODING_SUFFIXES[encoding]))
+            finally:
+                compressed_path.unlink(missing_ok=True)
+            staged.temp_path.unlink(missing_ok=True)
+            logger.debug(f"Stored {staged.file_hash} {encoding}-compressed: {staged.size_bytes} -> {compressed_size} bytes")
+            return StoredFile(key, encoding, compressed_size)
+        compressed_path.unlink(missing_ok=True)
+    key = await backend.put_file(staged.temp_path, shard_key(staged.file_hash))
+    logger.debug(f"Moved staged upload {staged.temp_path.name} into {backend.name} storage as {key}")
+    return StoredFile(key, "identity" if encoding is not None else None, staged.size_bytes)
+
+def discard_staged(staged: StagedFile):
+    staged.temp_path.unlink(missing_ok=True)
+
+def cleanup_staging(base_path: Path, min_age_seconds: float) -> int:
+    temp_dir = staging_dir(base_path)
+    if not temp_dir.is_dir():
+        return 0
+    removed = 0
+    cutoff = time.time() - min_age_seconds
+    for leftover in temp_dir.glob("*.part"):
+        try:
+            if leftover.stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        leftover.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+class ChunkOutOfBounds(ValueError):
+    pass
+
+class SessionBusy(RuntimeError):
+    pass
+
+def session_dir(base_path: Path, session_id: uuid.UUID) -> Path:
+    return base_path / SESSIONS_DIR_NAME / str(session_id)
+
+def create_session(base_path: Path, session_id: uuid.UUID, session_info: dict) -> dict:
+    directory = session_dir(base_path, session_id)
+    (directory / "ranges").mkdir(parents=True)
+    with open(directory / "data", "wb") as data_file:
+        data_file.truncate(session_info["size_bytes"])
+    session_info = {**session_info, "created_at": time.time()}
+    (directory / "session.json").write_text(json.dumps(session_info))
+    return session_info
+
+def load_session(base_path: Path, session_id: uuid.UUID) -> Optional[dict]:
+    try:
+        return json.loads((session_dir(base_path, session_id) / "session.json").read_text())
+    except FileNotFoundError:
+        return None
+
+def _record_range(directory: Path, start: int, end: int):
+    if end <= start:
+        return
+    ranges_dir = directory / "ranges"
+    os.close(os.open(ranges_dir / f"{start}-{end}", os.O_WRONLY | os.O_CREAT, 0o644))
+    dir_fd = os.open(ranges_dir, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+async def write_session_chunk(base_path: Path, session_id: uuid.UUID, size_bytes: int, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    directory = session_dir(base_path, session_id)
+    fd = os.open(directory / "data", os.O_WRONLY)
+    position = offset
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_SH)
+        async for chunk in chunks:
+            if position + len(chunk) > size_bytes:
+                raise ChunkOutOfBounds(f"Chunk at offset {offset} runs past the declared size of {size_bytes} bytes")
+            if is_session_finalizing(base_path, session_id):
+                raise SessionBusy(f"Upload session {session_id} is being finalized")
+            if not (directory / "session.json").exists():
+                raise FileNotFoundError(directory / "session.json")
+            await asyncio.to_thread(os.pwrite, fd, chunk, position)
+            position += len(chunk)
+        await asyncio.to_thread(os.fsync, fd)
+        await asyncio.to_thread(_record_range, directory, offset, position)
+    finally:
+        os.close(fd)
+    return position - offset
+
+def received_ranges(base_path: Path, session_id: uuid.UUID) -> List[Tuple[int, int]]:
+    recorded = []
+    for marker in (session_dir(base_path, session_id) / "ranges").iterdir():
+        start, _, end = marker.name.partition("-")
+        recorded.append((int(start), int(end)))
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(recorded):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def lock_session(base_path: Path, session_id: uuid.UUID):
+    directory = session_dir(base_path, session_id)
+    try:
+        os.rename(directory / "session.json", directory / "session.finalizing")
+    except FileNotFoundError:
+        raise SessionBusy(f"Upload session {session_id} is already being finalized")
+
+def unlock_session(base_path: Path, session_id: uuid.UUID):
+    directory = session_dir(base_path, session_id)
+    os.rename(directory / "session.finalizing", directory / "session.json")
+
+def is_session_finalizing(base_path: Path, session_id: uuid.UUID) -> bool:
+    return (session_dir(base_path, session_id) / "session.finalizing").exists()
+
+def has_session_data(base_path: Path, session_id: uuid.UUID) -> bool:
+    return (session_dir(base_path, session_id) / "data").is_file()
+
+async def stage_session(base_path: Path, session_id: uuid.UUID, size_bytes: int, chunk_size: int) -> StagedFile:
+    data_path = session_dir(base_path, session_id) / "data"
+    sha256_hash = hashlib.sha256()
+    lock_fd = os.open(data_path, os.O_RDONLY)
+    try:
+        await asyncio.to_thread(fcntl.flock, lock_fd, fcntl.LOCK_EX)
+        async with aiofiles.open(data_path, 'rb') as data_file:
+            while chunk := await data_file.read(chunk_size):
+                sha256_hash.update(chunk)
+    finally:
+        os.close(lock_fd)
+    return StagedFile(data_path, sha256_hash.hexdigest(), size_bytes)
+
+def delete_session(base_path: Path, session_id: uuid.UUID):
+    shutil.rmtree(session_dir(base_path, session_id), ignore_errors=True)
+
+def cleanup_expired_sessions(base_path: Path, ttl_seconds: float) -> int:
+    sessions_root = base_path / SESSIONS_DIR_NAME
+    if not sessions_root.is_dir():
+        return 0
+    removed = 0
+    cutoff = time.time() - ttl_seconds
+    for directory in sessions_root.iterdir():
+        ranges_dir = directory / "ranges"
+        last_activity = (ranges_dir if ranges_dir.exists() else directory).stat().st_mtime
+        if last_activity < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,453 @@
+import asyncio
+import errno
+import hashlib
+import hmac
+import os
+import shutil
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiofiles
+import httpx
+
+from config import Settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+class StorageError(RuntimeError):
+    pass
+
+class StoredObject(NamedTuple):
+    size: int
+    chunks: AsyncIterator[bytes]
+    release: Optional[Callable[[], Awaitable[None]]] = None
+
+    async def aclose(self):
+        await self.chunks.aclose()
+        if self.release is not None:
+            await self.release()
+
+class StorageBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def put_file(self, source: Path, key: str) -> str:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> StoredObject:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def known_missing(self, key: str) -> bool:
+        return False
+
+    async def aclose(self):
+        pass
+
+def parse_mounts(value: str) -> List[Path]:
+    return [Path(mount.strip()) for mount in value.split(",") if mount.strip()]
+
+class LocalShardedBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, mounts: List[Path]):
+        if not mounts:
+            raise ValueError("At least one storage mount is required")
+        self.mounts = mounts
+
+    def mount_for(self, key: str) -> Path:
+        content_id = Path(key).name.split(".", 1)[0]
+        return self.mounts[zlib.crc32(content_id.encode()) % len(self.mounts)]
+
+    def local_path(self, key: str) -> Optional[Path]:
+        primary = self.mount_for(key)
+        for mount in [primary] + [m for m in self.mounts if m != primary]:
+            candidate = mount / key
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def known_missing(self, key: str) -> bool:
+        return self.local_path(key) is None
+
+    async def put_file(self, source: Path, key: str) -> str:
+        target = self.mount_for(key) / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            partial = target.with_name(f"{target.name}.{uuid.uuid4().hex}.part")
+            try:
+                await asyncio.to_thread(shutil.copyfile, source, partial)
+                os.replace(partial, target)
+            except BaseException:
+                partial.unlink(missing_ok=True)
+                raise
+            source.unlink(missing_ok=True)
+            logger.debug(f"Copied {source.name} across filesystems to {target}")
+        return key
+
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> StoredObject:
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        last = path.stat().st_size - 1 if end is None else end
+        size = max(0, last - start + 1)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            remaining = size
+            async with aiofiles.open(path, "rb") as stored:
+                await stored.seek(start)
+                while remaining > 0:
+                    chunk = await stored.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        return StoredObject(size, chunks())
+
+    async def exists(self, key: str) -> bool:
+        return self.local_path(key) is not None
+
+    async def delete(self, key: str):
+        for mount in self.mounts:
+            (mount / key).unlink(missing_ok=True)
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+class S3Backend(StorageBackend):
+    name = "s3"
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        region: str,
+        access_key_id: str,
+        secret_access_key: str,
+        prefix: str = "",
+        chunk_size: int = 1024 * 1024,
+        timeout: float = 30.0,
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+
+    def object_url(self, key: str) -> httpx.URL:
+        return httpx.URL(f"{self.endpoint_url}/{self.bucket}/{self.prefix}{key}")
+
+    def signed_headers(self, method: str, url: httpx.URL, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now.strftime('%Y%m%d')}/{self.region}/s3/aws4_request"
+        signed = {k.lower(): v for k, v in (headers or {}).items()}
+        signed.update({"host": url.netloc.decode(), "x-amz-date": amz_date, "x-amz-content-sha256": "UNSIGNED-PAYLOAD"})
+        names = sorted(signed)
+        canonical_request = "\n".join([
+            method,
+            url.raw_path.decode().split("?", 1)[0],
+            url.query.decode(),
+            "".join(f"{name}:{signed[name].strip()}\n" for name in names),
+            ";".join(names),
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()])
+        signing_key = b"AWS4" + self.secret_access_key.encode()
+        for part in scope.split("/"):
+            signing_key = _hmac(signing_key, part)
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        return signed
+
+    def _check(self, response: httpx.Response, method: str, key: str):
+        if response.status_code == 404:
+            raise FileNotFoundError(key)
+        if response.status_code >= 300:
+            raise StorageError(f"S3 {method} for {key} failed with status {response.status_code}")
+
+    async def put_file(self, source: Path, key: str) -> str:
+        size = source.stat().st_size
+        url = self.object_url(key)
+
+        async def body() -> AsyncIterator[bytes]:
+            async with aiofiles.open(source, "rb") as staged:
+                while chunk := await staged.read(self.chunk_size):
+                    yield chunk
+
+        headers = self.signed_headers("PUT", url, {"content-length": str(size)})
+        response = await self.client.put(url, content=body(), headers=headers)
+        self._check(response, "PUT", key)
+        source.unlink(missing_ok=True)
+        logger.debug(f"Uploaded {size} bytes to s3://{self.bucket}/{self.prefix}{key}")
+        return key
+
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> StoredObject:
+        url = self.object_url(key)
+        extra = {}
+        if start or end is not None:
+            extra["range"] = f"bytes={start}-{'' if end is None else end}"
+        request = self.client.build_request("GET", url, headers=self.signed_headers("GET", url, extra))
+        response = await self.client.send(request, stream=True)
+        try:
+            self._check(response, "GET", key)
+        except BaseException:
+            await response.aclose()
+            raise
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in response.aiter_raw(chunk_size):
+                    yield chunk
+            finally:
+                await response.aclose()
+
+        return StoredObject(int(response.headers.get("content-length", 0)), chunks(), response.aclose)
+
+    async def exists(self, key: str) -> bool:
+        url = self.object_url(key)
+        response = await self.client.head(url, headers=self.signed_headers("HEAD", url))
+        if response.status_code == 404:
+            return False
+        self._check(response, "HEAD", key)
+        return True
+
+    async def delete(self, key: str):
+        url = self.object_url(key)
+        response = await self.client.delete(url, headers=self.signed_headers("DELETE", url))
+        if response.status_code != 404:
+            self._check(response, "DELETE", key)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+SEGMENTS_DIR_NAME = ".segments"
+PACKED_KEY_PREFIX = "segments/"
+SEGMENT_SUFFIX = ".seg"
+
+def is_packed_key(key: str) -> bool:
+    return key.startswith(PACKED_KEY_PREFIX)
+
+def parse_packed_key(key: str) -> Tuple[str, int, int]:
+    segment_name, offset, length = key[len(PACKED_KEY_PREFIX):].rsplit("/", 2)
+    return segment_name, int(offset), int(length)
+
+def _append_blob(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+    os.fsync(fd)
+
+def _pread_exact(fd: int, length: int, offset: int) -> bytes:
+    data = os.pread(fd, length, offset)
+    if len(data) != length:
+        raise StorageError(f"Segment is truncated: expected {length} bytes at offset {offset}, got {len(data)}")
+    return data
+
+class PackedSegmentBackend(StorageBackend):
+    name = "packed"
+
+    def __init__(self, inner: StorageBackend, segments_dir: Path, max_blob_bytes: int, segment_max_bytes: int, segment_max_age_seconds: float):
+        self.inner = inner
+        self.segments_dir = segments_dir
+        self.max_blob_bytes = max_blob_bytes
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age_seconds = segment_max_age_seconds
+        self._lock: Optional[asyncio.Lock] = None
+        self._active_name: Optional[str] = None
+        self._active_fd: Optional[int] = None
+        self._active_size = 0
+        self._active_opened_at = 0.0
+        self.packed_total = 0
+
+    def segment_path(self, segment_name: str) -> Path:
+        return self.segments_dir / segment_name
+
+    def segments(self) -> List[Path]:
+        if not self.segments_dir.is_dir():
+            return []
+        return sorted(self.segments_dir.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def is_active(self, segment_name: str) -> bool:
+        return segment_name == self._active_name
+
+    def _seal(self):
+        if self._active_fd is not None:
+            os.close(self._active_fd)
+            logger.info(f"Sealed segment {self._active_name} at {self._active_size} bytes")
+        self._active_name = None
+        self._active_fd = None
+        self._active_size = 0
+
+    def _roll(self):
+        self._seal()
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self._active_name = f"{int(time.time())}-{uuid.uuid4().hex}{SEGMENT_SUFFIX}"
+        self._active_fd = os.open(self.segment_path(self._active_name), os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_EXCL, 0o644)
+        self._active_opened_at = time.monotonic()
+        logger.info(f"Opened segment {self._active_name}")
+
+    async def append(self, data: bytes) -> str:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if (
+                self._active_fd is None
+                or self._active_size + len(data) > self.segment_max_bytes
+                or time.monotonic() - self._active_opened_at > self.segment_max_age_seconds
+            ):
+                self._roll()
+            offset = self._active_size
+            await asyncio.to_thread(_append_blob, self._active_fd, data)
+            self._active_size += len(data)
+            self.packed_total += 1
+            return f"{PACKED_KEY_PREFIX}{self._active_name}/{offset}/{len(data)}"
+
+    async def read_blob(self, key: str) -> bytes:
+        segment_name, offset, length = parse_packed_key(key)
+        try:
+            fd = os.open(self.segment_path(segment_name), os.O_RDONLY)
+        except FileNotFoundError:
+            raise FileNotFoundError(key)
+        try:
+            return await asyncio.to_thread(_pread_exact, fd, length, offset)
+        finally:
+            os.close(fd)
+
+    async def put_file(self, source: Path, key: str) -> str:
+        if source.stat().st_size > self.max_blob_bytes:
+            return await self.inner.put_file(source, key)
+        packed_key = await self.append(await asyncio.to_thread(source.read_bytes))
+        source.unlink(missing_ok=True)
+        return packed_key
+
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> StoredObject:
+        if not is_packed_key(key):
+            return await self.inner.get(key, start, end, chunk_size)
+        segment_name, offset, length = parse_packed_key(key)
+        segment = self.segment_path(segment_name)
+        if not segment.is_file():
+            raise FileNotFoundError(key)
+        last = length - 1 if end is None else min(end, length - 1)
+        size = max(0, last - start + 1)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                fd = os.open(segment, os.O_RDONLY)
+            except FileNotFoundError:
+                raise FileNotFoundError(key)
+            try:
+                position = offset + start
+                remaining = size
+                while remaining > 0:
+                    chunk = await asyncio.to_thread(_pread_exact, fd, min(chunk_size, remaining), position)
+                    position += len(chunk)
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                os.close(fd)
+
+        return StoredObject(size, chunks())
+
+    async def exists(self, key: str) -> bool:
+        if not is_packed_key(key):
+            return await self.inner.exists(key)
+        return self.segment_path(parse_packed_key(key)[0]).is_file()
+
+    async def delete(self, key: str):
+        if not is_packed_key(key):
+            await self.inner.delete(key)
+        else:
+            logger.debug(f"Packed blob {key} is reclaimed by segment compaction, not deleted in place")
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None if is_packed_key(key) else self.inner.local_path(key)
+
+    def known_missing(self, key: str) -> bool:
+        if is_packed_key(key):
+            return not self.segment_path(parse_packed_key(key)[0]).is_file()
+        return self.inner.known_missing(key)
+
+    async def aclose(self):
+        if self._lock is None:
+            self._seal()
+        else:
+            async with self._lock:
+                self._seal()
+        await self.inner.aclose()
+
+def create_storage_backend(current_settings: Settings) -> StorageBackend:
+    backend = _create_base_backend(current_settings)
+    if current_settings.STORAGE_PACK_SMALL_FILES:
+        return PackedSegmentBackend(
+            backend,
+            current_settings.STORAGE_BASE_PATH / SEGMENTS_DIR_NAME,
+            current_settings.STORAGE_PACK_MAX_BLOB_BYTES,
+            current_settings.STORAGE_SEGMENT_MAX_BYTES,
+            current_settings.STORAGE_SEGMENT_MAX_AGE_SECONDS
+        )
+    return backend
+
+def _create_base_backend(current_settings: Settings) -> StorageBackend:
+    if current_settings.STORAGE_BACKEND == "s3":
+        return S3Backend(
+            current_settings.S3_ENDPOINT_URL,
+            current_settings.S3_BUCKET,
+            current_settings.S3_REGION,
+            current_settings.S3_ACCESS_KEY_ID,
+            current_settings.S3_SECRET_ACCESS_KEY,
+            prefix=current_settings.S3_PREFIX,
+            chunk_size=current_settings.UPLOAD_CHUNK_SIZE,
+            timeout=current_settings.S3_TIMEOUT_SECONDS
+        )
+    if current_settings.STORAGE_BACKEND == "local":
+        return LocalShardedBackend(parse_mounts(current_settings.STORAGE_MOUNTS) or [current_settings.STORAGE_BASE_PATH])
+    raise ValueError(f"Unknown storage backend '{current_settings.STORAGE_BACKEND}'")
+
+_backends: Dict[tuple, StorageBackend] = {}
+
+def backend_for(current_settings: Settings) -> StorageBackend:
+    key = (
+        current_settings.STORAGE_BACKEND, str(current_settings.STORAGE_BASE_PATH), current_settings.STORAGE_MOUNTS,
+        current_settings.S3_ENDPOINT_URL, current_settings.S3_BUCKET, current_settings.S3_PREFIX,
+        current_settings.STORAGE_PACK_SMALL_FILES, current_settings.STORAGE_PACK_MAX_BLOB_BYTES
+    )
+    backend = _backends.get(key)
+    if backend is None:
+        backend = create_storage_backend(current_settings)
+        _backends[key] = backend
+        logger.info(f"Using '{backend.name}' storage backend")
+    return backend
+
+async def close_storage_backends():
+    for backend in _backends.values():
+        await backend.aclose()
+    _backends.clear()
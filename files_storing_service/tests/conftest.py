@@ -18,9 +18,16 @@ from main import app
 from models import Base
 from database import get_db
 from config import settings
+from metadata_cache import metadata_cache
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///./test_fss.db"
 
+@pytest.fixture(autouse=True)
+def reset_metadata_cache():
+    metadata_cache.clear()
+    yield
+    metadata_cache.clear()
+
 @pytest_asyncio.fixture(scope="function") 
 async def test_engine():
     engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False) 
@@ -0,0 +1,157 @@
+import gzip
+import io
+
+import pytest
+import zstandard
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from compress_storage import compress_existing_files
+
+TEXT = b"plain text corpus line that compresses well\n" * 200
+
+async def upload_text(async_client: AsyncClient, content: bytes = TEXT) -> dict:
+    response = await async_client.post("/upload", files={"file": ("corpus.txt", io.BytesIO(content), "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_upload_is_stored_compressed_and_served_encoded_or_decompressed(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    monkeypatch
+):
+    monkeypatch.setattr(mock_fss_settings, "STORAGE_COMPRESSION", "zstd")
+    data = await upload_text(async_client)
+
+    assert data["storage_encoding"] == "zstd"
+    assert data["file_location"].endswith(".zst")
+    stored = (mock_fss_settings.STORAGE_BASE_PATH / data["file_location"]).read_bytes()
+    assert len(stored) < len(TEXT)
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(stored) == TEXT
+
+    async with async_client.stream("GET", f"/{data['id']}/download", headers={"accept-encoding": "zstd"}) as encoded:
+        raw = b"".join([chunk async for chunk in encoded.aiter_raw()])
+    assert encoded.headers["content-encoding"] == "zstd"
+    assert encoded.headers["etag"] == f'"{data["file_hash"]}-zstd"'
+    assert raw == stored
+
+    identity = await async_client.get(f"/{data['id']}/download", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["content-length"] == str(len(TEXT))
+    assert identity.headers["etag"] == f'"{data["file_hash"]}"'
+    assert identity.content == TEXT
+
+    not_modified = await async_client.get(
+        f"/{data['id']}/download", headers={"accept-encoding": "zstd", "if-none-match": f'"{data["file_hash"]}-zstd"'}
+    )
+    assert not_modified.status_code == 304
+
+@pytest.mark.asyncio
+async def test_small_or_binary_uploads_are_stored_raw(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    monkeypatch
+):
+    monkeypatch.setattr(mock_fss_settings, "STORAGE_COMPRESSION", "gzip")
+    small = await upload_text(async_client, b"tiny")
+    assert small["storage_encoding"] is None
+
+    binary = await async_client.post("/upload", files={"file": ("img.png", io.BytesIO(TEXT), "image/png")})
+    assert binary.json()["storage_encoding"] is None
+    assert not binary.json()["file_location"].endswith(".gz")
+
+@pytest.mark.asyncio
+async def test_migration_tool_compresses_existing_files(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    test_engine
+):
+    data = await upload_text(async_client)
+    original_path = mock_fss_settings.STORAGE_BASE_PATH / data["file_location"]
+    assert data["storage_encoding"] is None
+
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    stats = await compress_existing_files(
+        session_factory, mock_fss_settings.STORAGE_BASE_PATH, "gzip", 6,
+        mock_fss_settings.STORAGE_COMPRESSION_MIME_TYPES, mock_fss_settings.STORAGE_COMPRESSION_MIN_BYTES,
+        1024, batch_size=10, grace_seconds=0
+    )
+
+    assert stats["compressed"] == 1
+    assert not original_path.exists()
+    metadata = (await async_client.get(f"/{data['id']}/metadata")).json()
+    assert metadata["storage_encoding"] == "gzip"
+    assert gzip.decompress((mock_fss_settings.STORAGE_BASE_PATH / metadata["file_location"]).read_bytes()) == TEXT
+
+    download = await async_client.get(f"/{data['id']}/download", headers={"accept-encoding": "identity"})
+    assert download.content == TEXT
+
+@pytest.mark.asyncio
+async def test_migration_tool_handles_files_on_another_mount(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    test_engine,
+    tmp_path,
+    monkeypatch
+):
+    import errno
+    import os
+    import storage_backends
+
+    data = await upload_text(async_client)
+    other_mount = tmp_path / "other_mount"
+    moved = other_mount / data["file_location"]
+    moved.parent.mkdir(parents=True)
+    os.replace(mock_fss_settings.STORAGE_BASE_PATH / data["file_location"], moved)
+    backend = storage_backends.LocalShardedBackend([other_mount])
+
+    real_replace = os.replace
+
+    def cross_device_replace(src, dst):
+        if ".incoming" in str(src):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(storage_backends.os, "replace", cross_device_replace)
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    stats = await compress_existing_files(
+        session_factory, mock_fss_settings.STORAGE_BASE_PATH, "gzip", 6,
+        mock_fss_settings.STORAGE_COMPRESSION_MIME_TYPES, mock_fss_settings.STORAGE_COMPRESSION_MIN_BYTES,
+        1024, batch_size=10, grace_seconds=0, backend=backend
+    )
+
+    assert stats["compressed"] == 1
+    assert not moved.exists()
+    assert gzip.decompress(moved.with_name(moved.name + ".gz").read_bytes()) == TEXT
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_migration_tool_counts_failed_moves_and_cleans_up(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    test_engine,
+    monkeypatch
+):
+    import storage_backends
+
+    data = await upload_text(async_client)
+    original_path = mock_fss_settings.STORAGE_BASE_PATH / data["file_location"]
+
+    async def no_space(self, source, key):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(storage_backends.LocalShardedBackend, "put_file", no_space)
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    stats = await compress_existing_files(
+        session_factory, mock_fss_settings.STORAGE_BASE_PATH, "gzip", 6,
+        mock_fss_settings.STORAGE_COMPRESSION_MIME_TYPES, mock_fss_settings.STORAGE_COMPRESSION_MIN_BYTES,
+        1024, batch_size=10, grace_seconds=0
+    )
+
+    assert stats["failed"] == 1
+    assert stats["compressed"] == 0
+    assert original_path.read_bytes() == TEXT
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+    assert (await async_client.get(f"/{data['id']}/metadata")).json()["storage_encoding"] is None
@@ -98,4 +98,212 @@ async def test_download_nonexistent_file_returns_404(
     
     assert response.status_code == 404
     data = response.json()
-    assert data["detail"] == "File not found"
\ No newline at end of file
+    assert data["detail"] == "File not found"
+@pytest.mark.asyncio
+async def test_upload_streams_in_chunks_and_leaves_no_temp_files(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    monkeypatch
+):
+    import hashlib
+    monkeypatch.setattr(mock_fss_settings, "UPLOAD_CHUNK_SIZE", 1024)
+    file_content = os.urandom(10 * 1024 + 17)
+    files = {"file": ("chunked.bin", io.BytesIO(file_content), "application/octet-stream")}
+
+    response = await async_client.post("/upload", files=files)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["file_hash"] == hashlib.sha256(file_content).hexdigest()
+    assert data["size_bytes"] == len(file_content)
+    assert data["file_location"] == f"{data['file_hash'][:2]}/{data['file_hash']}"
+    assert (mock_fss_settings.STORAGE_BASE_PATH / data["file_location"]).read_bytes() == file_content
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_discards_temp_file(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    file_content = b"duplicate content"
+    first = await async_client.post("/upload", files={"file": ("a.txt", io.BytesIO(file_content), "text/plain")})
+    second = await async_client.post("/upload", files={"file": ("b.txt", io.BytesIO(file_content), "text/plain")})
+
+    assert first.json()["id"] == second.json()["id"]
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_hash_check_returns_existing_metadata_or_go_ahead(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    import hashlib
+    file_content = b"content the client already uploaded once"
+    file_hash = hashlib.sha256(file_content).hexdigest()
+
+    unknown = await async_client.post("/uploads/check", json={"file_hash": file_hash, "size_bytes": len(file_content)})
+    assert unknown.status_code == 200
+    assert unknown.json() == {"exists": False, "file": None}
+
+    upload = await async_client.post(
+        "/upload", params={"expected_sha256": file_hash},
+        files={"file": ("known.txt", io.BytesIO(file_content), "text/plain")}
+    )
+    assert upload.status_code == 200
+
+    known = await async_client.post("/uploads/check", json={"file_hash": file_hash, "size_bytes": len(file_content)})
+    assert known.status_code == 200
+    assert known.json()["exists"] is True
+    assert known.json()["file"]["id"] == upload.json()["id"]
+
+    wrong_size = await async_client.post("/uploads/check", json={"file_hash": file_hash, "size_bytes": 1})
+    assert wrong_size.status_code == 409
+
+@pytest.mark.asyncio
+async def test_upload_with_mismatched_expected_hash_is_rejected(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    response = await async_client.post(
+        "/upload", params={"expected_sha256": "0" * 64},
+        files={"file": ("bad.txt", io.BytesIO(b"not what was promised"), "text/plain")}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Uploaded content does not match expected SHA-256"
+    assert not any(p.is_file() and p.suffix != ".part" for p in mock_fss_settings.STORAGE_BASE_PATH.rglob("*"))
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_download_supports_etag_and_conditional_get(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    file_content = b"content addressed download"
+    upload = (await async_client.post("/upload", files={"file": ("etag.txt", io.BytesIO(file_content), "text/plain")})).json()
+    etag = f'"{upload["file_hash"]}"'
+
+    response = await async_client.get(f"/{upload['id']}/download")
+    assert response.headers["etag"] == etag
+    assert "immutable" in response.headers["cache-control"]
+
+    not_modified = await async_client.get(f"/{upload['id']}/download", headers={"if-none-match": f'"other", {etag}'})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert not_modified.content == b""
+
+    modified = await async_client.get(f"/{upload['id']}/download", headers={"if-none-match": '"other"'})
+    assert modified.status_code == 200
+    assert modified.content == file_content
+
+@pytest.mark.asyncio
+async def test_download_honours_if_modified_since_date(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    file_content = b"dated download"
+    upload = (await async_client.post("/upload", files={"file": ("dated.txt", io.BytesIO(file_content), "text/plain")})).json()
+
+    older = await async_client.get(f"/{upload['id']}/download", headers={"if-modified-since": "Tue, 01 Jan 2019 00:00:00 GMT"})
+    assert older.status_code == 200
+    assert older.content == file_content
+
+    newer = await async_client.get(f"/{upload['id']}/download", headers={"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert newer.status_code == 304
+
+    unparsable = await async_client.get(f"/{upload['id']}/download", headers={"if-modified-since": "yesterday"})
+    assert unparsable.status_code == 200
+    assert unparsable.content == file_content
+
+@pytest.mark.asyncio
+async def test_download_serves_single_and_multiple_ranges(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    file_content = b"0123456789abcdefghij"
+    upload = (await async_client.post("/upload", files={"file": ("range.txt", io.BytesIO(file_content), "text/plain")})).json()
+    etag = f'"{upload["file_hash"]}"'
+
+    single = await async_client.get(f"/{upload['id']}/download", headers={"range": "bytes=5-9", "if-range": etag})
+    assert single.status_code == 206
+    assert single.content == b"56789"
+    assert single.headers["content-range"] == f"bytes 5-9/{len(file_content)}"
+
+    multi = await async_client.get(f"/{upload['id']}/download", headers={"range": "bytes=0-1,10-11"})
+    assert multi.status_code == 206
+    boundary = multi.headers["content-type"].split("boundary=")[1]
+    assert multi.headers["content-type"] == f"multipart/byteranges; boundary={boundary}"
+    assert int(multi.headers["content-length"]) == len(multi.content)
+    assert multi.content.split(f"--{boundary}".encode()) == [
+        b"",
+        b"\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Range: bytes 0-1/20\r\n\r\n01\r\n",
+        b"\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Range: bytes 10-11/20\r\n\r\nab\r\n",
+        b"--",
+    ]
+
+    stale = await async_client.get(f"/{upload['id']}/download", headers={"range": "bytes=5-9", "if-range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == file_content
+
+@pytest.mark.asyncio
+async def test_batch_upload_dedupes_and_notifies_fas_once(
+    async_client: AsyncClient,
+    db_session,
+    mock_fss_settings
+):
+    from sqlalchemy import select
+    from models import OutboxEvent
+
+    already_stored = await async_client.post("/upload", files={"file": ("old.txt", io.BytesIO(b"old content"), "text/plain")})
+    assert already_stored.status_code == 200
+
+    files = [
+        ("files", ("a.txt", io.BytesIO(b"alpha"), "text/plain")),
+        ("files", ("b.txt", io.BytesIO(b"beta"), "text/plain")),
+        ("files", ("a-copy.txt", io.BytesIO(b"alpha"), "text/plain")),
+        ("files", ("old-again.txt", io.BytesIO(b"old content"), "text/plain")),
+    ]
+    response = await async_client.post("/upload/batch", files=files, data={"note": "ignored"})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["existing"], body["duplicates"], body["failed"]) == (2, 1, 1, 0)
+    statuses = {item["filename"]: item["status"] for item in body["files"]}
+    assert statuses == {"a.txt": "created", "b.txt": "created", "a-copy.txt": "duplicate", "old-again.txt": "existing"}
+    by_name = {item["filename"]: item["file"] for item in body["files"]}
+    assert by_name["a-copy.txt"]["id"] == by_name["a.txt"]["id"]
+    assert by_name["old-again.txt"]["id"] == already_stored.json()["id"]
+    assert (mock_fss_settings.STORAGE_BASE_PATH / by_name["b.txt"]["file_location"]).read_bytes() == b"beta"
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+    events = (await db_session.execute(select(OutboxEvent).order_by(OutboxEvent.id))).scalars().all()
+    assert [event.payload["original_filename"] for event in events] == ["old.txt", "a.txt", "b.txt"]
+    assert events[1].payload["file_location"] == f"http://testfss/{by_name['a.txt']['id']}/download"
+
+@pytest.mark.asyncio
+async def test_batch_upload_rejects_too_many_files(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    monkeypatch
+):
+    monkeypatch.setattr(mock_fss_settings, "BATCH_UPLOAD_MAX_FILES", 1)
+    files = [
+        ("files", ("a.txt", io.BytesIO(b"alpha"), "text/plain")),
+        ("files", ("b.txt", io.BytesIO(b"beta"), "text/plain")),
+    ]
+    response = await async_client.post("/upload/batch", files=files)
+    assert response.status_code == 400
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+def test_startup_staging_cleanup_keeps_in_flight_uploads(tmp_path: Path):
+    from storage import cleanup_staging, staging_dir
+
+    temp_dir = staging_dir(tmp_path)
+    temp_dir.mkdir(parents=True)
+    stale, in_flight = temp_dir / "stale.part", temp_dir / "in_flight.part"
+    stale.write_bytes(b"abandoned")
+    in_flight.write_bytes(b"still uploading")
+    os.utime(stale, (0, 0))
+
+    assert cleanup_staging(tmp_path, 3600.0) == 1
+    assert not stale.exists()
+    assert in_flight.exists()
@@ -0,0 +1,96 @@
+import hashlib
+import io
+import shutil
+import uuid
+
+import pytest
+from httpx import AsyncClient
+
+import crud
+from metadata_cache import MetadataCache, metadata_cache
+
+@pytest.mark.asyncio
+async def test_cache_serves_repeat_lookups_and_caches_misses_briefly(db_session, monkeypatch):
+    cache = MetadataCache(True, 10, 60.0, 60.0)
+    calls = []
+    original = crud.get_file_metadata_by_id
+
+    async def counting_lookup(db, file_id):
+        calls.append(file_id)
+        return await original(db, file_id=file_id)
+
+    monkeypatch.setattr(crud, "get_file_metadata_by_id", counting_lookup)
+    missing_id = uuid.uuid4()
+    assert await cache.get_by_id(db_session, missing_id) is None
+    assert await cache.get_by_id(db_session, missing_id) is None
+    assert calls == [missing_id]
+
+    cache.negative_ttl_seconds = 0.0
+    cache.clear()
+    assert await cache.get_by_id(db_session, missing_id) is None
+    assert await cache.get_by_id(db_session, missing_id) is None
+    assert len(calls) == 3
+
+    snapshot = cache.snapshot()
+    assert snapshot["by_id"]["misses"] == 2
+    assert snapshot["by_id"]["negative_hits"] == 0
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used_entries(async_client: AsyncClient, mock_fss_settings, monkeypatch):
+    monkeypatch.setattr(metadata_cache, "_by_id", type(metadata_cache._by_id)(2))
+    ids = []
+    for i in range(3):
+        response = await async_client.post("/upload", files={"file": (f"f{i}.txt", io.BytesIO(f"content {i}".encode()), "text/plain")})
+        ids.append(response.json()["id"])
+
+    for file_id in reversed(ids):
+        assert (await async_client.get(f"/{file_id}/metadata")).status_code == 200
+
+    cache_metrics = (await async_client.get("/metrics")).json()["metadata_cache"]
+    assert cache_metrics["entries"]["id"] == 2
+    assert cache_metrics["by_id"]["hits"] == 2
+    assert cache_metrics["by_id"]["misses"] == 1
+    assert cache_metrics["evictions"] >= 1
+
+@pytest.mark.asyncio
+async def test_upload_replaces_cached_miss_for_hash(async_client: AsyncClient, mock_fss_settings):
+    content = b"hash lookups are cached"
+    file_hash = hashlib.sha256(content).hexdigest()
+    check = {"file_hash": file_hash, "size_bytes": len(content)}
+
+    assert (await async_client.post("/uploads/check", json=check)).json()["exists"] is False
+    uploaded = (await async_client.post("/upload", files={"file": ("c.txt", io.BytesIO(content), "text/plain")})).json()
+
+    response = await async_client.post("/uploads/check", json=check)
+    assert response.json()["exists"] is True
+    assert response.json()["file"]["id"] == uploaded["id"]
+
+@pytest.mark.asyncio
+async def test_upload_falls_back_to_existing_row_when_another_worker_won_the_race(async_client: AsyncClient, mock_fss_settings):
+    content = b"stored concurrently by another worker"
+    first = (await async_client.post("/upload", files={"file": ("a.txt", io.BytesIO(content), "text/plain")})).json()
+    metadata_cache.clear()
+    metadata_cache._by_hash.put(first["file_hash"], None, 60.0)
+
+    response = await async_client.post("/upload", files={"file": ("b.txt", io.BytesIO(content), "text/plain")})
+
+    assert response.status_code == 200
+    assert response.json()["id"] == first["id"]
+    assert (mock_fss_settings.STORAGE_BASE_PATH / first["file_location"]).read_bytes() == content
+
+@pytest.mark.asyncio
+async def test_download_reloads_metadata_when_cached_location_is_gone(async_client: AsyncClient, db_session, mock_fss_settings):
+    content = b"moved by the storage migration"
+    uploaded = (await async_client.post("/upload", files={"file": ("m.txt", io.BytesIO(content), "text/plain")})).json()
+    assert (await async_client.get(f"/{uploaded['id']}/metadata")).status_code == 200
+
+    old_path = mock_fss_settings.STORAGE_BASE_PATH / uploaded["file_location"]
+    new_location = uploaded["file_location"] + ".moved"
+    shutil.move(str(old_path), str(mock_fss_settings.STORAGE_BASE_PATH / new_location))
+    await crud.update_file_storage(db_session, uuid.UUID(uploaded["id"]), new_location, "identity", len(content))
+
+    response = await async_client.get(f"/{uploaded['id']}/download", headers={"accept-encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.content == content
+    assert (await async_client.get(f"/{uploaded['id']}/metadata")).json()["file_location"] == new_location
@@ -0,0 +1,109 @@
+import hashlib
+import io
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from models import OutboxEvent
+from outbox import OutboxDispatcher
+
+def make_dispatcher(test_engine, handler, batch_size=10) -> OutboxDispatcher:
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return OutboxDispatcher(session_factory, "http://mockfas:8000", batch_size, 1.0, 2.0, 60.0, client=client)
+
+async def upload(async_client: AsyncClient, name: str, content: bytes) -> dict:
+    response = await async_client.post("/upload", files={"file": (name, io.BytesIO(content), "text/plain")})
+    assert response.status_code == 200
+    return response.json()
+
+async def pending_events(test_engine):
+    async with sessionmaker(bind=test_engine, class_=AsyncSession)() as db:
+        return (await db.execute(select(OutboxEvent).order_by(OutboxEvent.id))).scalars().all()
+
+@pytest.mark.asyncio
+async def test_uploads_are_delivered_in_batches_over_one_client(async_client: AsyncClient, test_engine, mock_fss_settings):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(202, json=[])
+
+    uploaded = [await upload(async_client, f"f{i}.txt", f"content {i}".encode()) for i in range(3)]
+    dispatcher = make_dispatcher(test_engine, handler, batch_size=2)
+
+    assert await dispatcher.dispatch_once() == 2
+    assert await dispatcher.dispatch_once() == 1
+    assert await dispatcher.dispatch_once() == 0
+
+    assert [path for path, _ in requests] == ["/analysis/batch", "/analysis/batch"]
+    delivered = [item["file_id"] for _, batch in requests for item in batch]
+    assert delivered == [file["id"] for file in uploaded]
+    assert await pending_events(test_engine) == []
+    assert dispatcher.snapshot()["delivered_total"] == 3
+    assert dispatcher.snapshot()["batches_total"] == 2
+
+    metrics = (await async_client.get("/metrics")).json()["outbox"]
+    assert metrics["backlog"] == 0
+    assert metrics["oldest_pending_age_seconds"] is None
+
+@pytest.mark.asyncio
+async def test_failed_delivery_is_retried_with_backoff(async_client: AsyncClient, test_engine, mock_fss_settings):
+    fas_up = False
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(202, json=[]) if fas_up else httpx.Response(503)
+
+    await upload(async_client, "retry.txt", b"retry me")
+    dispatcher = make_dispatcher(test_engine, handler)
+
+    assert await dispatcher.dispatch_once() == 0
+    (event,) = await pending_events(test_engine)
+    assert event.attempts == 1
+    assert "503" in event.last_error
+    assert event.available_at >= datetime.utcnow() + timedelta(seconds=1)
+    assert await dispatcher.dispatch_once() == 0
+    assert dispatcher.snapshot()["failed_batches_total"] == 1
+
+    metrics = (await async_client.get("/metrics")).json()["outbox"]
+    assert metrics["backlog"] == 1
+    assert metrics["oldest_pending_age_seconds"] >= 0
+
+    async with sessionmaker(bind=test_engine, class_=AsyncSession)() as db:
+        await db.execute(update(OutboxEvent).values(available_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+    fas_up = True
+    assert await dispatcher.dispatch_once() == 1
+    assert await pending_events(test_engine) == []
+
+@pytest.mark.asyncio
+async def test_falls_back_to_single_notifications_without_batch_endpoint(async_client: AsyncClient, test_engine, mock_fss_settings):
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == "/analysis/batch":
+            return httpx.Response(404)
+        return httpx.Response(202, json={})
+
+    await upload(async_client, "a.txt", b"a")
+    await upload(async_client, "b.txt", b"b")
+    dispatcher = make_dispatcher(test_engine, handler)
+
+    assert await dispatcher.dispatch_once() == 2
+    assert paths == ["/analysis/batch", "/analysis/", "/analysis/"]
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_does_not_enqueue_another_notification(async_client: AsyncClient, test_engine, mock_fss_settings):
+    await upload(async_client, "one.txt", b"same")
+    await upload(async_client, "two.txt", b"same")
+
+    events = await pending_events(test_engine)
+    assert [event.payload["original_filename"] for event in events] == ["one.txt"]
+    assert events[0].payload["file_hash"] == hashlib.sha256(b"same").hexdigest()
@@ -0,0 +1,143 @@
+import io
+import os
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import models, storage_backends
+from compact_segments import compact_segments
+from main import app, create_db_and_tables
+from metadata_cache import metadata_cache
+from routers.files import get_storage_backend
+from storage_backends import LocalShardedBackend, PackedSegmentBackend
+
+@pytest.fixture
+def packed_backend(mock_fss_settings):
+    base_path = mock_fss_settings.STORAGE_BASE_PATH
+    backend = PackedSegmentBackend(LocalShardedBackend([base_path]), base_path / ".segments", 1024, 4096, 600.0)
+    app.dependency_overrides[get_storage_backend] = lambda: backend
+    yield backend
+    backend._seal()
+
+async def upload(async_client: AsyncClient, name: str, content: bytes) -> dict:
+    response = await async_client.post("/upload", files={"file": (name, io.BytesIO(content), "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_small_files_are_packed_and_large_files_keep_their_own_file(async_client: AsyncClient, mock_fss_settings, packed_backend):
+    small = [await upload(async_client, f"s{i}.txt", f"small file {i}".encode()) for i in range(5)]
+    large_content = os.urandom(2048)
+    large = await upload(async_client, "large.bin", large_content)
+
+    assert all(storage_backends.is_packed_key(item["file_location"]) for item in small)
+    assert len({storage_backends.parse_packed_key(item["file_location"])[0] for item in small}) == 1
+    assert not storage_backends.is_packed_key(large["file_location"])
+    assert (mock_fss_settings.STORAGE_BASE_PATH / large["file_location"]).read_bytes() == large_content
+    assert [p.name for p in (mock_fss_settings.STORAGE_BASE_PATH).iterdir() if p.is_dir() and not p.name.startswith(".")] == [large["file_location"][:2]]
+
+    for i, item in enumerate(small):
+        response = await async_client.get(f"/{item['id']}/download")
+        assert response.status_code == 200
+        assert response.content == f"small file {i}".encode()
+    ranged = await async_client.get(f"/{small[3]['id']}/download", headers={"range": "bytes=6-9"})
+    assert ranged.status_code == 206
+    assert ranged.content == b"file"
+    multi = await async_client.get(f"/{small[3]['id']}/download", headers={"range": "bytes=0-4,11-"})
+    assert multi.status_code == 206
+    boundary = multi.headers["content-type"].split("boundary=")[1]
+    assert int(multi.headers["content-length"]) == len(multi.content)
+    assert multi.content.split(f"--{boundary}".encode()) == [
+        b"",
+        b"\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Range: bytes 0-4/12\r\n\r\nsmall\r\n",
+        b"\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Range: bytes 11-11/12\r\n\r\n3\r\n",
+        b"--",
+    ]
+
+@pytest.mark.asyncio
+async def test_segments_roll_over_at_size_limit(packed_backend):
+    keys = [await packed_backend.append(bytes([i]) * 1000) for i in range(10)]
+
+    segments = {storage_backends.parse_packed_key(key)[0] for key in keys}
+    assert len(segments) == 3
+    assert all(path.stat().st_size <= 4096 for path in packed_backend.segments())
+    assert [await packed_backend.read_blob(key) for key in keys] == [bytes([i]) * 1000 for i in range(10)]
+
+@pytest.mark.asyncio
+async def test_compactor_rewrites_live_blobs_and_drops_dead_segments(async_client: AsyncClient, test_engine, mock_fss_settings, packed_backend):
+    kept = await upload(async_client, "kept.txt", b"still referenced")
+    orphan_key = await packed_backend.append(b"x" * 900)
+    old_segment = storage_backends.parse_packed_key(kept["file_location"])[0]
+    assert storage_backends.parse_packed_key(orphan_key)[0] == old_segment
+    dead_key = await packed_backend.append(b"y" * 3500)
+    dead_segment = storage_backends.parse_packed_key(dead_key)[0]
+    packed_backend._seal()
+    past = time.time() - 7200
+    for segment in packed_backend.segments():
+        os.utime(segment, (past, past))
+
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    stats = await compact_segments(session_factory, packed_backend, min_live_ratio=0.5, min_age_seconds=3600, grace_seconds=0)
+
+    assert stats["segments_scanned"] == 2
+    assert stats["segments_compacted"] == 2
+    assert stats["blobs_moved"] == 1
+    assert not packed_backend.segment_path(old_segment).exists()
+    assert not packed_backend.segment_path(dead_segment).exists()
+
+    metadata = (await async_client.get(f"/{kept['id']}/metadata")).json()
+    assert metadata["file_location"] != kept["file_location"]
+    assert (await async_client.get(f"/{kept['id']}/download")).content == b"still referenced"
+
+@pytest.mark.asyncio
+async def test_compactor_leaves_dense_and_recent_segments_alone(test_engine, packed_backend):
+    await packed_backend.append(b"recent")
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+
+    stats = await compact_segments(session_factory, packed_backend, min_age_seconds=3600, grace_seconds=0)
+
+    assert stats["segments_scanned"] == 0
+    assert len(packed_backend.segments()) == 1
+
+@pytest.mark.asyncio
+async def test_racing_identical_upload_keeps_one_row_and_leaves_its_blob_to_compaction(
+    async_client: AsyncClient, db_session, test_engine, packed_backend
+):
+    first = await upload(async_client, "a.txt", b"same small content")
+    metadata_cache.clear()
+    metadata_cache._by_hash.put(first["file_hash"], None, 60.0)
+
+    second = await upload(async_client, "b.txt", b"same small content")
+
+    assert second["id"] == first["id"]
+    rows = await db_session.execute(select(func.count()).select_from(models.FileMetadata).filter(models.FileMetadata.file_hash == first["file_hash"]))
+    assert rows.scalar_one() == 1
+    assert packed_backend.packed_total == 2
+    packed_backend._seal()
+    past = time.time() - 7200
+    for segment in packed_backend.segments():
+        os.utime(segment, (past, past))
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    stats = await compact_segments(session_factory, packed_backend, min_live_ratio=0.75, min_age_seconds=3600, grace_seconds=0)
+    assert stats["segments_compacted"] == 1
+    assert stats["bytes_reclaimed"] == len(b"same small content")
+
+@pytest.mark.asyncio
+async def test_startup_makes_file_hash_unique_on_existing_databases():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await conn.exec_driver_sql("DROP INDEX ix_file_metadata_file_hash")
+        await conn.exec_driver_sql("CREATE INDEX ix_file_metadata_file_hash ON file_metadata (file_hash)")
+
+    await create_db_and_tables(engine)
+    await create_db_and_tables(engine)
+
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(lambda sync_conn: {i["name"]: i["unique"] for i in inspect(sync_conn).get_indexes("file_metadata")})
+    assert indexes["ix_file_metadata_file_hash"]
+    await engine.dispose()
@@ -0,0 +1,229 @@
+import errno
+import gzip
+import hashlib
+import hmac
+import io
+import os
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from starlette.requests import Request
+from starlette.responses import Response
+
+import storage_backends
+from main import app
+from routers.files import get_storage_backend
+from storage_backends import LocalShardedBackend, S3Backend
+
+ACCESS_KEY = "test-access"
+SECRET_KEY = "test-secret"
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    def signature_is_valid(self, request: Request) -> bool:
+        authorization = request.headers.get("authorization", "")
+        fields = dict(part.strip().split("=", 1) for part in authorization[len("AWS4-HMAC-SHA256 "):].split(","))
+        signed_headers = fields["SignedHeaders"].split(";")
+        canonical_request = "\n".join([
+            request.method,
+            request.url.path,
+            request.url.query,
+            "".join(f"{name}:{request.headers[name].strip()}\n" for name in signed_headers),
+            fields["SignedHeaders"],
+            request.headers["x-amz-content-sha256"],
+        ])
+        _, date, region, service, terminator = fields["Credential"].split("/")
+        scope = f"{date}/{region}/{service}/{terminator}"
+        string_to_sign = f"AWS4-HMAC-SHA256\n{request.headers['x-amz-date']}\n{scope}\n{hashlib.sha256(canonical_request.encode()).hexdigest()}"
+        key = ("AWS4" + SECRET_KEY).encode()
+        for part in (date, region, service, terminator):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        return hmac.compare_digest(fields["Signature"], hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest())
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        self.requests.append((request.method, request.url.path, request.headers.get("range")))
+        if not self.signature_is_valid(request):
+            response = Response(status_code=403)
+        elif request.method == "PUT":
+            self.objects[request.url.path] = await request.body()
+            response = Response(status_code=200)
+        elif request.url.path not in self.objects:
+            response = Response(status_code=404)
+        elif request.method == "DELETE":
+            del self.objects[request.url.path]
+            response = Response(status_code=204)
+        else:
+            body = self.objects[request.url.path]
+            status_code = 200
+            if request.headers.get("range"):
+                first, _, last = request.headers["range"][len("bytes="):].partition("-")
+                body = body[int(first):int(last) + 1 if last else None]
+                status_code = 206
+            response = Response(body if request.method == "GET" else b"", status_code=status_code, headers={"content-length": str(len(body))})
+        await response(scope, receive, send)
+
+@pytest.fixture
+def fake_s3():
+    return FakeS3()
+
+@pytest.fixture
+def s3_backend(fake_s3):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_s3))
+    return S3Backend("http://s3.test", "fss", "us-east-1", ACCESS_KEY, SECRET_KEY, prefix="files/", chunk_size=4, client=client)
+
+async def read_all(stored_object) -> bytes:
+    return b"".join([chunk async for chunk in stored_object.chunks])
+
+@pytest.mark.asyncio
+async def test_local_backend_shards_keys_over_mounts_and_finds_moved_files(tmp_path):
+    mounts = [tmp_path / "disk0", tmp_path / "disk1"]
+    backend = LocalShardedBackend(mounts)
+    keys = [f"{h[:2]}/{h}" for h in (hashlib.sha256(str(i).encode()).hexdigest() for i in range(16))]
+    for key in keys:
+        source = tmp_path / "staged"
+        source.write_bytes(key.encode())
+        assert await backend.put_file(source, key) == key
+        assert not source.exists()
+
+    assert all(any((mount / key).is_file() for mount in mounts) for key in keys)
+    assert {backend.mount_for(key) for key in keys} == set(mounts)
+
+    grown = LocalShardedBackend(mounts + [tmp_path / "disk2"])
+    for key in keys:
+        assert await read_all(await grown.get(key)) == key.encode()
+    assert await read_all(await backend.get(keys[0], 3, 5)) == keys[0].encode()[3:6]
+
+    await backend.delete(keys[0])
+    assert not await backend.exists(keys[0])
+    assert backend.known_missing(keys[0])
+    with pytest.raises(FileNotFoundError):
+        await backend.get(keys[0])
+
+@pytest.mark.asyncio
+async def test_local_backend_copies_across_filesystems(tmp_path, monkeypatch):
+    source = tmp_path / "staged"
+    source.write_bytes(b"cross-device")
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if src == source:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(storage_backends.os, "replace", replace)
+    backend = LocalShardedBackend([tmp_path / "mount"])
+
+    assert await backend.put_file(source, "ab/abcdef") == "ab/abcdef"
+    assert not source.exists()
+    assert (tmp_path / "mount" / "ab" / "abcdef").read_bytes() == b"cross-device"
+    assert list((tmp_path / "mount" / "ab").iterdir()) == [tmp_path / "mount" / "ab" / "abcdef"]
+
+def test_incomplete_backend_cannot_be_created():
+    class ReadOnlyBackend(storage_backends.StorageBackend):
+        async def get(self, key, start=0, end=None, chunk_size=1024 * 1024):
+            raise FileNotFoundError(key)
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
+
+@pytest.mark.asyncio
+async def test_s3_backend_signs_and_streams_objects(tmp_path, s3_backend, fake_s3):
+    source = tmp_path / "staged"
+    source.write_bytes(b"0123456789")
+
+    assert await s3_backend.put_file(source, "ab/abcdef") == "ab/abcdef"
+    assert not source.exists()
+    assert fake_s3.objects["/fss/files/ab/abcdef"] == b"0123456789"
+    assert await s3_backend.exists("ab/abcdef")
+
+    stored_object = await s3_backend.get("ab/abcdef", 2, 5, chunk_size=2)
+    assert stored_object.size == 4
+    assert await read_all(stored_object) == b"2345"
+    assert fake_s3.requests[-1] == ("GET", "/fss/files/ab/abcdef", "bytes=2-5")
+
+    unread = await s3_backend.get("ab/abcdef")
+    await unread.aclose()
+    assert unread.release.__self__.is_closed
+
+    await s3_backend.delete("ab/abcdef")
+    assert not await s3_backend.exists("ab/abcdef")
+    with pytest.raises(FileNotFoundError):
+        await s3_backend.get("ab/abcdef")
+
+@pytest.mark.asyncio
+async def test_s3_backend_rejects_bad_credentials(tmp_path, fake_s3):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_s3))
+    backend = S3Backend("http://s3.test", "fss", "us-east-1", ACCESS_KEY, "wrong", client=client)
+    source = tmp_path / "staged"
+    source.write_bytes(b"data")
+
+    with pytest.raises(storage_backends.StorageError):
+        await backend.put_file(source, "ab/abcdef")
+    assert source.exists()
+
+@pytest.mark.asyncio
+async def test_upload_and_download_through_s3_backend(async_client: AsyncClient, mock_fss_settings, monkeypatch, s3_backend, fake_s3):
+    app.dependency_overrides[get_storage_backend] = lambda: s3_backend
+    monkeypatch.setattr(mock_fss_settings, "STORAGE_COMPRESSION", "gzip")
+    monkeypatch.setattr(mock_fss_settings, "STORAGE_COMPRESSION_MIN_BYTES", 0)
+    text = b"stored in an object store " * 20
+    binary = bytes(range(256))
+
+    text_meta = (await async_client.post("/upload", files={"file": ("t.txt", io.BytesIO(text), "text/plain")})).json()
+    binary_meta = (await async_client.post("/upload", files={"file": ("b.bin", io.BytesIO(binary), "application/octet-stream")})).json()
+
+    assert text_meta["storage_encoding"] == "gzip"
+    assert gzip.decompress(fake_s3.objects[f"/fss/files/{text_meta['file_location']}"]) == text
+    assert fake_s3.objects[f"/fss/files/{binary_meta['file_location']}"] == binary
+    assert list((mock_fss_settings.STORAGE_BASE_PATH / ".incoming").iterdir()) == []
+
+    decompressed = await async_client.get(f"/{text_meta['id']}/download", headers={"accept-encoding": "identity"})
+    assert decompressed.status_code == 200
+    assert decompressed.content == text
+
+    encoded = await async_client.get(f"/{text_meta['id']}/download", headers={"accept-encoding": "gzip"})
+    assert encoded.headers["content-encoding"] == "gzip"
+    assert encoded.content == text
+
+    ranged = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=10-19"})
+    assert ranged.status_code == 206
+    assert ranged.headers["content-range"] == "bytes 10-19/256"
+    assert ranged.content == binary[10:20]
+
+    suffix = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=-6"})
+    assert suffix.content == binary[-6:]
+
+    multi = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=0-1,250-"})
+    assert multi.status_code == 206
+    boundary = multi.headers["content-type"].split("boundary=")[1]
+    assert multi.headers["content-type"] == f"multipart/byteranges; boundary={boundary}"
+    assert int(multi.headers["content-length"]) == len(multi.content)
+    assert multi.content.split(f"--{boundary}".encode()) == [
+        b"",
+        b"\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 0-1/256\r\n\r\n" + binary[:2] + b"\r\n",
+        b"\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 250-255/256\r\n\r\n" + binary[250:] + b"\r\n",
+        b"--",
+    ]
+    assert [r for _, _, r in fake_s3.requests[-2:]] == ["bytes=0-1", "bytes=250-255"]
+
+    overlapping = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=10-19,15-29"})
+    assert overlapping.headers["content-range"] == "bytes 10-29/256"
+    assert overlapping.content == binary[10:30]
+
+    unsatisfiable = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=300-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */256"
+
+    partly_satisfiable = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=0-10,999999-"})
+    assert partly_satisfiable.status_code == 206
+    assert partly_satisfiable.headers["content-range"] == "bytes 0-10/256"
+    assert partly_satisfiable.content == binary[:11]
+
+    empty_suffix = await async_client.get(f"/{binary_meta['id']}/download", headers={"range": "bytes=-0"})
+    assert empty_suffix.status_code == 416
+    assert empty_suffix.headers["content-range"] == "bytes */256"
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import uuid
+
+import pytest
+from httpx import AsyncClient
+
+import storage
+from routers import files as files_router
+
+async def create_session(async_client: AsyncClient, content: bytes, **extra):
+    response = await async_client.post("/uploads/sessions", json={
+        "original_filename": "big.txt", "mime_type": "text/plain", "size_bytes": len(content), **extra
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["session_id"]
+
+@pytest.mark.asyncio
+async def test_parallel_out_of_order_chunks_are_assembled_and_finalized(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    content = os.urandom(64 * 1024 + 123)
+    chunk_size = 16 * 1024
+    session_id = await create_session(async_client, content, expected_sha256=hashlib.sha256(content).hexdigest())
+
+    offsets = list(range(0, len(content), chunk_size))[::-1]
+    responses = await asyncio.gather(*[
+        async_client.put(f"/uploads/sessions/{session_id}", params={"offset": offset}, content=content[offset:offset + chunk_size])
+        for offset in offsets
+    ])
+    assert all(r.status_code == 200 for r in responses)
+
+    status = (await async_client.get(f"/uploads/sessions/{session_id}")).json()
+    assert status["received"] == [[0, len(content)]]
+    assert status["complete"] is True
+
+    finalized = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert finalized.status_code == 200, finalized.text
+    data = finalized.json()
+    assert data["file_hash"] == hashlib.sha256(content).hexdigest()
+    assert data["size_bytes"] == len(content)
+
+    download = await async_client.get(f"/{data['id']}/download")
+    assert download.content == content
+    assert not (mock_fss_settings.STORAGE_BASE_PATH / ".sessions" / session_id).exists()
+
+@pytest.mark.asyncio
+async def test_session_reports_missing_ranges_and_refuses_incomplete_finalize(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    content = b"0123456789" * 10
+    session_id = await create_session(async_client, content)
+
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=content[:30])
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 50}, content=content[50:70])
+
+    status = (await async_client.get(f"/uploads/sessions/{session_id}")).json()
+    assert status["received"] == [[0, 30], [50, 70]]
+    assert status["received_bytes"] == 50
+
+    incomplete = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert incomplete.status_code == 409
+
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 30}, content=content[30:50])
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 70}, content=content[70:])
+    finalized = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert finalized.status_code == 200
+    assert finalized.json()["file_hash"] == hashlib.sha256(content).hexdigest()
+
+@pytest.mark.asyncio
+async def test_chunk_past_declared_size_is_rejected(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    session_id = await create_session(async_client, b"12345")
+    response = await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 3}, content=b"456")
+    assert response.status_code == 416
+
+    async def overflowing_body():
+        yield b"123"
+        yield b"456"
+
+    response = await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=overflowing_body())
+    assert response.status_code == 416
+    assert (await async_client.get(f"/uploads/sessions/{session_id}")).json()["received"] == []
+
+@pytest.mark.asyncio
+async def test_finalize_waits_for_in_flight_chunk_writers(mock_fss_settings):
+    base_path = mock_fss_settings.STORAGE_BASE_PATH
+    content = b"durable content"
+    session_id = uuid.uuid4()
+    storage.create_session(base_path, session_id, {"size_bytes": len(content)})
+    await storage.write_session_chunk(base_path, session_id, len(content), 0, _chunks(content))
+
+    first_chunk_written = asyncio.Event()
+    resume_writer = asyncio.Event()
+
+    async def stalled_body():
+        yield b"DURABLE"
+        first_chunk_written.set()
+        await resume_writer.wait()
+        yield b" CONTENT"
+
+    writer = asyncio.create_task(storage.write_session_chunk(base_path, session_id, len(content), 0, stalled_body()))
+    await first_chunk_written.wait()
+    storage.lock_session(base_path, session_id)
+    staging = asyncio.create_task(storage.stage_session(base_path, session_id, len(content), 4))
+    await asyncio.sleep(0.05)
+    assert not staging.done()
+
+    resume_writer.set()
+    with pytest.raises(storage.SessionBusy):
+        await writer
+    staged = await staging
+    assert staged.file_hash == hashlib.sha256(b"DURABLE content").hexdigest()
+    assert storage.received_ranges(base_path, session_id) == [(0, len(content))]
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+@pytest.mark.asyncio
+async def test_finalize_with_wrong_expected_hash_keeps_session_for_repair(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    content = b"some content"
+    session_id = await create_session(async_client, content, expected_sha256=hashlib.sha256(content).hexdigest())
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=b"some CONTENT")
+
+    response = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert response.status_code == 400
+    assert (await async_client.get(f"/uploads/sessions/{session_id}")).json()["complete"] is True
+
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 5}, content=content[5:])
+    repaired = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert repaired.status_code == 200
+    assert (await async_client.get(f"/{repaired.json()['id']}/download")).content == content
+
+@pytest.mark.asyncio
+async def test_failed_store_restores_session_for_retry(
+    async_client: AsyncClient,
+    mock_fss_settings,
+    monkeypatch
+):
+    content = b"retry me after the storage outage"
+    session_id = await create_session(async_client, content)
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=content)
+
+    async def failing_commit(*args, **kwargs):
+        raise OSError("disk unavailable")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(files_router.storage, "commit_staged", failing_commit)
+        assert (await async_client.post(f"/uploads/sessions/{session_id}/finalize")).status_code == 500
+
+    assert (await async_client.get(f"/uploads/sessions/{session_id}")).json()["received_bytes"] == len(content)
+    retried = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert retried.status_code == 200
+    assert not (mock_fss_settings.STORAGE_BASE_PATH / ".sessions" / session_id).exists()
+
+@pytest.mark.asyncio
+async def test_chunks_are_rejected_while_session_is_finalizing(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    content = b"locked for finalize"
+    session_id = await create_session(async_client, content)
+    await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=content)
+    storage.lock_session(mock_fss_settings.STORAGE_BASE_PATH, uuid.UUID(session_id))
+
+    response = await async_client.put(f"/uploads/sessions/{session_id}", params={"offset": 0}, content=b"overwritten")
+    assert response.status_code == 409
+    assert (await async_client.post(f"/uploads/sessions/{session_id}/finalize")).status_code == 409
+    assert (await async_client.delete(f"/uploads/sessions/{session_id}")).status_code == 409
+
+    storage.unlock_session(mock_fss_settings.STORAGE_BASE_PATH, uuid.UUID(session_id))
+    finalized = await async_client.post(f"/uploads/sessions/{session_id}/finalize")
+    assert (await async_client.get(f"/{finalized.json()['id']}/download")).content == content
+
+@pytest.mark.asyncio
+async def test_abort_removes_session(
+    async_client: AsyncClient,
+    mock_fss_settings
+):
+    session_id = await create_session(async_client, b"abc")
+    assert (await async_client.delete(f"/uploads/sessions/{session_id}")).status_code == 204
+    assert (await async_client.get(f"/uploads/sessions/{session_id}")).status_code == 404